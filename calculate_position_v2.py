@@ -33,9 +33,10 @@ def initialize():
         Returns:
             sensor_port: string
         ''' 
-        # sensor_port = '/dev/ttyACM0'                                                                          # Raspberry Pi Port
-
-        devices = [ComInfo(com_port='COM3', friendly_name='USB Serial Device (COM3)', dev_type='LX')]           # Windows Port
+        devices = ts_api.getComPorts(filter=ts_api.TSS_FIND_LX)                                                 # Windows and Linux ports
+        if len(devices) == 0:
+            print("No device was found.")
+            return None
         sensor_port = devices[0]                                                                                # Take first (and presumably only) device.
 
         return sensor_port
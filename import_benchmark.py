@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+""" Measures how long a fresh interpreter takes to import threespace_api.
+
+    Each run starts a new Python process with -X importtime and reports the
+    cumulative import time of the module, so the cost paid by short-lived
+    tools stays visible. Bytecode is cached in a temporary directory and
+    warmed first, so the numbers do not depend on PYTHONDONTWRITEBYTECODE.
+    The run also fails if any of the modules that are meant to be imported
+    lazily were loaded.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+### Private ###
+_lazy_modules = ("serial", "subprocess", "multiprocessing", "concurrent.futures", "traceback", "json", "ctypes",
+                 "selectors")
+
+_check_script = """
+import sys
+import {module}
+print(','.join(name for name in {lazy!r} if name in sys.modules))
+"""
+
+
+### Functions ###
+def _runImport(module, env):
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-W", "ignore", "-c",
+                                _check_script.format(module=module, lazy=_lazy_modules)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise Exception("Importing {0} failed:\n{1}".format(module, stderr.decode()))
+    timings = {}
+    for line in stderr.decode().splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            timings[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+        except ValueError:
+            continue
+    loaded = [name for name in stdout.decode().strip().split(",") if name]
+    return timings, loaded
+
+
+def benchmark(module="threespace_api", runs=10, top=10):
+    """ Imports module in runs fresh interpreters and returns the median
+        cumulative import time in milliseconds along with the lazy modules
+        that were loaded. The slowest imports of the median run are printed.
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = tempfile.mkdtemp(prefix="ts_import_")
+    _runImport(module, env)
+    results = []
+    loaded = []
+    for i in range(runs):
+        timings, loaded = _runImport(module, env)
+        results.append((timings[module][1], timings))
+    results.sort(key=lambda result: result[0])
+    median_us, timings = results[len(results) // 2]
+    print("{0}: median {1:.1f} ms, min {2:.1f} ms, max {3:.1f} ms over {4:d} runs".format(
+        module, median_us / 1000.0, results[0][0] / 1000.0, results[-1][0] / 1000.0, runs))
+    print("Slowest imports (self / cumulative ms):")
+    for name, (self_us, total_us) in sorted(timings.items(), key=lambda item: -item[1][0])[:top]:
+        print("  {0:<32} {1:7.2f} {2:7.2f}".format(name, self_us / 1000.0, total_us / 1000.0))
+    if loaded:
+        print("Modules that should be lazy were imported: {0}".format(", ".join(loaded)))
+    return median_us / 1000.0, loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the import time of the ThreeSpace API.")
+    parser.add_argument('--module', default="threespace_api")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help="exit with an error if the median import time is above this")
+    args = parser.parse_args()
+    median_ms, loaded = benchmark(args.module, args.runs)
+    if loaded or (args.max_ms is not None and median_ms > args.max_ms):
+        sys.exit(1)
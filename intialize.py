@@ -10,29 +10,28 @@ global sensor_port
 
 def initialize():
 
-    def find_port():
-        # Get all LX devices
-        devices = ts_api.getComPorts(filter=ts_api.TSS_FIND_LX)
-
-        # Take first (and presumably only) device.
-        sensor_port = devices[0]
-        
-        return sensor_port
-
     print("Connecting to the 3-Space Sensor...")
     try:
-        sensor = ts_api.TSLXSensor(com_port=find_port())
+        # Wait for the first LX sensor to be attached, whichever port it is on
+        with ts_api.TSDeviceMonitor(filter=ts_api.TSS_FIND_LX) as monitor:
+            sensor = monitor.waitForSensor(timeout=5.0)
     
     except IOError as e:
         print("I/O error({0}): {1}".format(e.errno, e.strerror))
+        return 1
     except ValueError:
         print("Could not convert data.", traceback.format_exc())
+        return 1
     except:
         print("Unexpected error:", sys.exc_info()[0], traceback.format_exc())
-        print("Could not connect to 3-Space Sensor on {0} or error in setting configuration - closing".format(find_port()))
+        print("Could not connect to 3-Space Sensor or error in setting configuration - closing")
+        return 1
+
+    if sensor is None:
+        print("No 3-Space Sensor was found.")
         return 1
 
-    print("Succesfully connected to 3-Space Sensor on port {0}.".format(find_port()))
+    print("Succesfully connected to 3-Space Sensor on port {0}.".format(sensor.port_name))
     sensor.close()
 
 if __name__ == '__main__':
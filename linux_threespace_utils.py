@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+""" This module is a utility module for Linux.
+
+    The Linux ThreeSpace Utils module is a collection of functions used to scan
+    for available ThreeSpace devices on the host system and information on
+    them. Ports are found by walking sysfs and matched on the USB vendor and
+    product IDs the kernel reports, so listing them does not open any port or
+    write anything to the devices. TSPortWatcher reports serial ports being
+    created and removed through inotify, so hot-plugging can be followed
+    without polling.
+"""
+
+from threespace_utils import *
+from threespace_utils import _matchDeviceIds, _pollDeviceInfo
+
+import os
+import struct
+
+### Private ###
+_sysfs_tty_path = "/sys/class/tty"
+_dev_path = "/dev"
+_libc = None
+
+_IN_ATTRIB = 0x00000004
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+_inotify_event = struct.Struct('=iIII')
+_serial_tty_prefixes = ("ttyACM", "ttyUSB", "rfcomm")
+
+
+### Functions ###
+def _loadLibc():
+    global _libc
+    if _libc is None:
+        import ctypes
+        import ctypes.util
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return _libc
+
+
+def _getErrno():
+    import ctypes
+    return ctypes.get_errno()
+
+
+def _readSysfsAttribute(path, name):
+    try:
+        with open(os.path.join(path, name)) as sysfs_file:
+            return sysfs_file.read().strip()
+    except (IOError, OSError):
+        return ""
+
+
+def _findUSBDevice(device_path):
+    # The tty's device is a USB interface (ACM) or a port below one
+    # (usb-serial), the USB device holding the IDs is further up
+    path = device_path
+    for i in range(4):
+        if os.path.exists(os.path.join(path, "idVendor")):
+            return path
+        path = os.path.dirname(path)
+    return None
+
+
+def _yeiComPorts():
+    """ This generator scans sysfs for serial ports and yields port, desc,
+        hw_id, vid_pid
+    """
+    try:
+        tty_names = sorted(os.listdir(_sysfs_tty_path))
+    except OSError:
+        return
+    for tty_name in tty_names:
+        device_link = os.path.join(_sysfs_tty_path, tty_name, "device")
+        if not os.path.exists(device_link):
+            # Virtual terminals and pseudo-terminals have no device
+            continue
+        device_path = os.path.realpath(device_link)
+        subsystem = os.path.basename(os.path.realpath(os.path.join(device_path, "subsystem")))
+        if subsystem == "platform":
+            # Legacy UART placeholders (ttyS*) that may not exist
+            continue
+        port_name = "/dev/" + tty_name
+        friendly_name = tty_name
+        hw_id = ""
+        vid_pid_string = ""
+        usb_path = _findUSBDevice(device_path)
+        if usb_path is not None:
+            vid = _readSysfsAttribute(usb_path, "idVendor").upper()
+            pid = _readSysfsAttribute(usb_path, "idProduct").upper()
+            vid_pid_string = "VID_" + vid + "&PID_" + pid
+            hw_id = "USB\\" + vid_pid_string
+            serial_string = _readSysfsAttribute(usb_path, "serial")
+            if serial_string:
+                hw_id += "\\" + serial_string
+            product = _readSysfsAttribute(usb_path, "product")
+            manufacturer = _readSysfsAttribute(usb_path, "manufacturer")
+            if product:
+                friendly_name = "{0} ({1})".format(" ".join(filter(None, (manufacturer, product))), tty_name)
+        yield (port_name, friendly_name, hw_id, vid_pid_string)
+
+
+def getComPorts(filter=TSS_FIND_ALL):
+    """ Queries the system for all available serial ports and returns a list
+        of them.
+
+        Args:
+            filter: An interger denoting a flag of what 3-Space Sensors device
+                type to be found (default is TSS_FIND_ALL)
+
+        Returns:
+            A list of all known serial ports. Each element of the list is a
+                tuple formatted as such:
+                    (PORT_NAME, FRIENDLY_NAME, YEI_TECH_DEVICE_TYPE)
+            Note:
+                YEI_TECH_DEVICE_TYPE is '???' for ports whose vendor and
+                    product IDs do not match any known YEI Techology product,
+                    these are only listed with the TSS_FIND_UNKNOWN filter.
+    """
+    port_list = []
+    for cur_port in _yeiComPorts():
+        if cur_port[3] != "":
+            vid, pid = cur_port[3].split("&")
+            device = _matchDeviceIds(vid, pid)
+            if device is not None:
+                if device[1] & filter:
+                    port_list.append(ComInfo(cur_port[0], cur_port[1], device[0]))
+                continue
+        if TSS_FIND_UNKNOWN & filter:
+            port_list.append(ComInfo(cur_port[0], cur_port[1], "???"))
+    return port_list
+
+
+def getDeviceInfoFromComPort(port_name, poll_device=True):
+    """ Analyzes a serial port of a 3-Space Sensor and returns details about
+        the device.
+
+        Args:
+            port_name: A string representing the name of the serial port to
+                analyze.
+            poll_device: An optional boolean that controls whether the named
+                port is written to and queried for information about the
+                device. If this value is True, please take caution as the
+                port's device will be written to and may produce undesired
+                effects if the device is unknown or not a 3-Space Sensor
+                (default is True)
+
+        Returns:
+            A SensorInfo describing the port's device:
+                Friendly name,
+                3-Space Type,
+                3-Space ID,
+                3-Space Firmware Version String,
+                3-Space Hardware Version String,
+                isInBootloader
+    """
+    friendly_name = ""
+    dev_type = "???"
+    dev_serial = 0
+    dev_fw_ver = ""
+    dev_hw_ver = ""
+    in_bootloader = False
+    port_path = os.path.realpath(port_name)
+    for cur_port in _yeiComPorts():
+        if cur_port[0] == port_path:
+            friendly_name = cur_port[1]
+            if cur_port[3] != "":
+                vid, pid = cur_port[3].split("&")
+                device = _matchDeviceIds(vid, pid)
+                if device is not None:
+                    dev_type = device[0]
+            break
+    if poll_device:
+        dev_type, dev_serial, dev_fw_ver, dev_hw_ver, in_bootloader = _pollDeviceInfo(port_name, dev_type)
+    return SensorInfo(
+        friendly_name,
+        dev_type,
+        dev_serial,
+        dev_fw_ver,
+        dev_hw_ver,
+        in_bootloader
+    )
+
+
+### Classes ###
+class TSPortWatcher(object):
+    """ Reports USB and Bluetooth serial ports appearing in and disappearing
+        from /dev through inotify.
+
+        The watcher is not threaded, fileno() can be handed to select and
+        read() returns the events that are ready. sysfs does not generate
+        inotify events, it is only used to describe the ports afterwards.
+    """
+
+    def __init__(self, dev_path=_dev_path):
+        libc = _loadLibc()
+        self.dev_path = dev_path
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            errno = _getErrno()
+            raise OSError(errno, os.strerror(errno))
+        mask = _IN_CREATE | _IN_DELETE | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, dev_path.encode(), mask) < 0:
+            errno = _getErrno()
+            os.close(self.fd)
+            self.fd = -1
+            raise OSError(errno, os.strerror(errno), dev_path)
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """ Returns a list of (port_name, present) tuples for the serial ports
+            that changed since the last call. present is False when the port
+            was removed. An attribute change (udev setting the permissions of
+            a new port) is reported as the port being present. An empty list
+            is returned when nothing is pending; after an event queue overflow
+            every port currently in /dev is reported as present.
+        """
+        try:
+            data = os.read(self.fd, 65536)
+        except (IOError, OSError):
+            return []
+        events = []
+        idx = 0
+        while idx + _inotify_event.size <= len(data):
+            wd, mask, cookie, name_len = _inotify_event.unpack_from(data, idx)
+            idx += _inotify_event.size
+            name = data[idx:idx + name_len].split(b'\0', 1)[0].decode('utf-8', 'replace')
+            idx += name_len
+            if mask & _IN_Q_OVERFLOW:
+                events.extend((port_name, True) for port_name in self.listPorts())
+                continue
+            if mask & _IN_ISDIR or not name.startswith(_serial_tty_prefixes):
+                continue
+            present = not mask & (_IN_DELETE | _IN_MOVED_FROM)
+            events.append((os.path.join(self.dev_path, name), present))
+        return events
+
+    def listPorts(self):
+        try:
+            names = sorted(os.listdir(self.dev_path))
+        except OSError:
+            return []
+        return [os.path.join(self.dev_path, name) for name in names if name.startswith(_serial_tty_prefixes)]
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -50,7 +50,6 @@ def get_csv_data(data, opened, file_name):
 
 
 def stream():
-    streaming = True
     opened = False
 
     # These variables determine the filename scheme
@@ -64,39 +63,28 @@ def stream():
 
     if device is not None:
 
-        # Disable magnometer (compass)
-        device.setCompassEnabled(enabled = False)
-        # Set calibration mode to Scale/Bias mode
-        device.setCalibrationMode(mode = 1)
-        # Begin auto calibration of gyroscope
-        device.beginGyroscopeAutoCalibration()
-        # Set filter mode to Kalman
-        device.setFilterMode(mode = 1)
-        # Fix rate 
-        device.setStreamingTiming(interval = 0, duration = 0xFFFFFFFF, delay = 0)
-        # Start streaming
-        device.startStreaming()
-        device.startRecordingData()
-
-        while streaming:
-
-            # Set slots for tared quaternion and raw batch data - accel in units of g
-            # gyro is in rad/sec
-            device.setStreamingSlots( 
-                slot0 = 'getCorrectedAccelerometerVector', 
-                slot1 = 'getCorrectedGyroRate',
-                slot2 = 'getTaredOrientationAsEulerAngles')
-            print("==================================================")
-            data = device.getLatestStreamData(1)[1]
-
-            get_csv_data(data, opened, file_name)
-            opened = True
-            print(data)
-            print("==================================================\n")
-    
-        device.stopStreaming()
+        # Configure the sensor once: compass (magnometer) off, Scale/Bias
+        # calibration with gyroscope auto calibration, Kalman filter and a
+        # fixed rate. Slots are corrected accel in units of g, corrected gyro
+        # in rad/sec and tared euler angles. Streaming stops and the port is
+        # closed when the session ends.
+        with device.streamingSession(
+                ['getCorrectedAccelerometerVector',
+                 'getCorrectedGyroRate',
+                 'getTaredOrientationAsEulerAngles'],
+                interval = 0, duration = 0xFFFFFFFF, delay = 0,
+                filter_mode = 1, calibration_mode = 1, compass_enabled = False,
+                gyro_autocalibrate = True):
+
+            # Runs until interrupted, samples are queued by the reader thread
+            for timestamp, data in device.iterStream():
+                print("==================================================")
+                get_csv_data(data, opened, file_name)
+                opened = True
+                print(data)
+                print("==================================================\n")
+
         print("End of session")
-        device.close()
     return None
 
 def calculate_position():
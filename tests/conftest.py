@@ -0,0 +1,40 @@
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import threespace_api as ts_api
+from threespace_emulator import TSEmulator
+
+# Sensors are kept in global_sensorlist by serial number, so every emulated
+# device gets its own to keep the tests apart
+_serial_numbers = itertools.count(0x0EA72000)
+
+STREAM_SLOTS = ('getTaredOrientationAsQuaternion',)
+
+
+def nextSerialNumber():
+    return next(_serial_numbers)
+
+
+def openSensor(emulator, interval=2000, **kwargs):
+    sensor = ts_api.TSLXSensor(emulator.port_name, baudrate=emulator.baudrate, **kwargs)
+    sensor.setStreamingTiming(interval, 0xFFFFFFFF, 0)
+    sensor.setStreamingSlots(*STREAM_SLOTS)
+    return sensor
+
+
+@pytest.fixture
+def emulator():
+    with TSEmulator(serial_number=nextSerialNumber(), sample_rate=500, seed=1) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def sensor(emulator):
+    sensor = openSensor(emulator)
+    yield sensor
+    sensor.close()
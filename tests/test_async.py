@@ -0,0 +1,56 @@
+import asyncio
+
+from threespace_async import AsyncTSLXSensor
+
+from conftest import STREAM_SLOTS
+
+
+def test_async_commands(emulator):
+    async def run():
+        async with AsyncTSLXSensor(emulator.port_name) as sensor:
+            assert await sensor.getSerialNumber() == emulator.device.serial_number
+            assert await sensor.setLEDColor((0.25, 0.5, 1.0))
+            serial_numbers = await asyncio.gather(*[sensor.getSerialNumber() for i in range(16)])
+            assert set(serial_numbers) == {emulator.device.serial_number}
+            assert await sensor.getLEDColor() == (0.25, 0.5, 1.0)
+    asyncio.run(run())
+
+
+def test_async_stream(emulator):
+    async def run():
+        async with AsyncTSLXSensor(emulator.port_name) as sensor:
+            await sensor.setStreamingTiming(2000, 0xFFFFFFFF, 0)
+            await sensor.setStreamingSlots(*STREAM_SLOTS)
+            samples = []
+            stream = sensor.stream()
+            async for timestamp, quaternion in stream:
+                samples.append(quaternion)
+                if len(samples) == 10:
+                    break
+            await stream.aclose()
+            assert all(len(quaternion) == 4 for quaternion in samples)
+            assert not sensor.streaming
+            # Commands still work after the stream stopped
+            assert await sensor.getSerialNumber() == emulator.device.serial_number
+    asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def test_async_dropped_response_times_out(emulator):
+    respond = emulator._respond
+    dropped = []
+
+    def dropOnce(start_byte, device, logical_id, command, args, data):
+        if command == 'getLEDColor' and not dropped:
+            dropped.append(command)
+            return
+        respond(start_byte, device, logical_id, command, args, data)
+
+    emulator._respond = dropOnce
+
+    async def run():
+        async with AsyncTSLXSensor(emulator.port_name) as sensor:
+            assert await sensor.writeRead('getLEDColor') == (True, None, None)
+            assert sensor.timeout_count == 1
+            fail_byte, timestamp, data = await sensor.writeRead('getLEDColor')
+            assert not fail_byte
+    asyncio.run(asyncio.wait_for(run(), 10))
@@ -0,0 +1,82 @@
+import struct
+import threading
+
+import numpy as np
+
+import threespace_api as ts_api
+from threespace_recorder import streamPacketDtype, streamPacketRun
+
+SLOTS = ['getTaredOrientationAsQuaternion']
+PAYLOAD_SIZE = 16
+# fail_byte, timestamp, cmd_echo, ck_sum, data_size
+CHECKSUM_HEADER = [0, 1, 2, 3, 6]
+
+
+def _packets(count, header_idx_lst=CHECKSUM_HEADER):
+    dtype = streamPacketDtype(header_idx_lst, ts_api.TSLXSensor.command_dict, SLOTS)
+    packets = np.zeros(count, dtype)
+    packets['timestamp'] = np.arange(count) * 1000
+    packets['cmd_echo'] = 0xff
+    packets['data_size'] = PAYLOAD_SIZE
+    packets['getTaredOrientationAsQuaternion'] = [(i, 0.0, 0.0, 1.0) for i in range(count)]
+    if 'ck_sum' in dtype.names:
+        raw = packets.view(np.uint8).reshape(count, dtype.itemsize)
+        packets['ck_sum'] = raw[:, dtype.itemsize - PAYLOAD_SIZE:].sum(axis=1) & 0xff
+    return dtype, bytearray(packets.tobytes())
+
+
+def test_packet_run_decodes_every_valid_packet():
+    dtype, data = _packets(5)
+    packets = streamPacketRun(data, dtype, PAYLOAD_SIZE)
+    assert len(packets) == 5
+    assert list(packets['timestamp']) == [0, 1000, 2000, 3000, 4000]
+    assert list(packets['getTaredOrientationAsQuaternion'][:, 0]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_packet_run_stops_at_bad_checksum():
+    dtype, data = _packets(5)
+    data[3 * dtype.itemsize - 1] ^= 0x01  # corrupt the payload of packet 2
+    assert len(streamPacketRun(data, dtype, PAYLOAD_SIZE)) == 2
+
+
+def test_packet_run_stops_before_a_short_or_foreign_packet():
+    dtype, data = _packets(4)
+    assert len(streamPacketRun(data[:-1], dtype, PAYLOAD_SIZE)) == 3
+    data[dtype.itemsize + 5] = 0xed  # packet 1 echoes a command instead
+    assert len(streamPacketRun(data, dtype, PAYLOAD_SIZE)) == 1
+    assert len(streamPacketRun(data, dtype, PAYLOAD_SIZE, offset=2 * dtype.itemsize)) == 2
+
+
+def test_decode_stream_capture_skips_command_responses(sensor):
+    sensor.getStreamingSlots()
+    dtype, streamed = _packets(5, sensor.header_idx_lst)
+    response = sensor.header_parse.pack(False, 1234, 0xed, 4) + struct.pack('>I', 42)
+    split = 3 * dtype.itemsize
+    capture = bytes(streamed[:split]) + response + bytes(streamed[split:])
+    packets = sensor.decodeStreamCapture(capture)
+    assert packets.dtype == sensor.getStreamPacketDtype()
+    assert list(packets['timestamp']) == [0, 1000, 2000, 3000, 4000]
+
+
+def test_batch_callback_in_zero_copy_mode(sensor):
+    assert sensor.setReadMode(ts_api.TSS_READ_ZERO_COPY)
+    batches = []
+    received = threading.Event()
+
+    def callback(packets):
+        batches.append(packets)
+        received.set()
+
+    sensor.setNewDataBatchCallBack(callback)
+    sensor.startStreaming()
+    try:
+        assert received.wait(2.0)
+        latest = sensor.getLatestStreamData(1.0)
+        assert type(latest) is tuple
+        assert len(latest[1]) == 4
+        assert isinstance(sensor.borrowLatestStreamSample(), ts_api.TSStreamSample)
+    finally:
+        sensor.stopStreaming()
+        sensor.setNewDataBatchCallBack(None)
+    assert batches[0].dtype == sensor.getStreamPacketDtype()
+    assert (batches[0]['cmd_echo'] == 0xff).all()
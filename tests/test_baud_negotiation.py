@@ -0,0 +1,57 @@
+import pytest
+
+import threespace_api as ts_api
+from threespace_emulator import TSEmulator
+
+from conftest import nextSerialNumber
+
+
+@pytest.fixture
+def slow_emulator():
+    with TSEmulator(serial_number=nextSerialNumber(), baudrate=115200) as emulator:
+        yield emulator
+
+
+def _openSensor(emulator):
+    return ts_api.TSLXSensor(emulator.port_name, baudrate=115200)
+
+
+def test_negotiates_the_fastest_rate(slow_emulator):
+    sensor = _openSensor(slow_emulator)
+    try:
+        assert sensor.negotiateBaudRate() == max(ts_api._allowed_baudrates)
+        assert slow_emulator.baudrate == sensor.baudrate
+        assert sensor.serial_port_settings['baudrate'] == sensor.baudrate
+        assert sensor.getSerialNumber() == slow_emulator.device.serial_number
+    finally:
+        sensor.close()
+
+
+def test_failed_rate_is_switched_back(slow_emulator, monkeypatch):
+    sensor = _openSensor(slow_emulator)
+    check_baud_rate = sensor._checkBaudRate
+
+    def failFastRates(hardware_version):
+        if sensor.baudrate > 230400:
+            return False
+        return check_baud_rate(hardware_version)
+
+    monkeypatch.setattr(sensor, '_checkBaudRate', failFastRates)
+    try:
+        assert sensor.negotiateBaudRate([460800, 230400]) == 230400
+        assert slow_emulator.baudrate == 230400
+        assert sensor.getSerialNumber() == slow_emulator.device.serial_number
+    finally:
+        sensor.close()
+
+
+def test_usb_cdc_port_is_not_negotiated(slow_emulator, monkeypatch):
+    sensor = _openSensor(slow_emulator)
+    monkeypatch.setattr(ts_api, 'isUSBCDCPort', lambda port_name: True)
+    commands_handled = slow_emulator.commands_handled
+    try:
+        assert sensor.negotiateBaudRate() is None
+        assert slow_emulator.commands_handled == commands_handled
+        assert sensor.baudrate == 115200
+    finally:
+        sensor.close()
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import threespace_api as ts_api
+
+
+def test_keyed_executor_keeps_key_order():
+    executor = ts_api._TSKeyedExecutor(max_workers=4)
+    calls = []
+    lock = threading.Lock()
+
+    def record(key, idx):
+        time.sleep(0.001)
+        with lock:
+            calls.append((key, idx))
+        return idx
+
+    futures_list = [executor.submit(key, record, key, idx) for idx in range(20) for key in ('a', 'b')]
+    assert [future.result(2.0) for future in futures_list] == [idx for idx in range(20) for key in ('a', 'b')]
+    for key in ('a', 'b'):
+        assert [idx for call_key, idx in calls if call_key == key] == list(range(20))
+    assert executor.queues == {}
+
+
+class _SlowDevice(object):
+
+    def __init__(self, delay, finished):
+        self.delay = delay
+        self.finished = finished
+
+    def call(self):
+        time.sleep(self.delay)
+        self.finished.append(self.delay)
+        return self.delay
+
+
+def test_queue_waits_for_every_call_under_a_repeated_key():
+    queue = ts_api.TSCommandQueue()
+    finished = []
+    # Bound methods run under their own object's executor key, so the slow
+    # call queued first finishes last
+    queue.queueMethod(_SlowDevice(0.1, finished).call, 'key', 1, None, [])
+    queue.queueMethod(_SlowDevice(0.0, finished).call, 'key', 1, None, [])
+    return_dict = queue.proccessQueue()
+    assert finished == [0.0, 0.1]
+    assert return_dict['key'] == 0.1
+
+
+def test_queue_survives_a_failing_call():
+    queue = ts_api.TSCommandQueue()
+
+    def failingCall():
+        raise IOError("sensor unplugged")
+
+    queue.queueMethod(failingCall, 'bad', 1, None, [])
+    queue.queueMethod(lambda: 7, 'good', 1, None, [])
+    assert queue.proccessQueue(clear_queue=True) == {'bad': None, 'good': 7}
+    assert queue.queue == []
+
+
+def test_submit_queue_returns_futures():
+    queue = ts_api.TSCommandQueue()
+    queue.queueMethod(lambda: 1, 'first', 1, None, [])
+    queue.queueMethod(lambda: 2, 'second', 1, None, [])
+    future_dict = queue.submitQueue()
+    assert sorted(future_dict) == ['first', 'second']
+    assert future_dict['second'].result(2.0) == 2
+
+
+def test_queue_method_retries_until_not_default():
+    queue = ts_api.TSCommandQueue()
+    results = [None, None, 3]
+    outcomes = []
+    queue.queueMethod(lambda: results.pop(0), 'key', 5, None, [], lambda key, success: outcomes.append(success))
+    assert queue.proccessQueue() == {'key': 3}
+    assert outcomes == [False, False, True]
+
+
+def test_broadcaster_write_read(emulator, sensor):
+    broadcaster = ts_api.Broadcaster()
+    packets = broadcaster.writeRead('getSerialNumber', filter=[sensor])
+    fail_byte, timestamp, serial_number = packets[sensor.serial_number]
+    assert not fail_byte
+    assert serial_number == emulator.device.serial_number
+    futures_dict = broadcaster.broadcastMethodFutures('getSerialNumber', filter=[sensor])
+    assert futures_dict[sensor].result(2.0) == emulator.device.serial_number
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from conftest import openSensor
+
+
+def test_slow_callback_does_not_stall_the_reader(sensor):
+    release = threading.Event()
+    sensor.setNewDataCallBack(lambda sample: release.wait(2.0), maxsize=4)
+    sensor.startStreaming()
+    try:
+        time.sleep(0.1)
+        start_time = time.perf_counter()
+        assert sensor.getSerialNumber() is not None
+        assert time.perf_counter() - start_time < 0.5
+        assert sensor.getCallbackDropCount() > 0
+    finally:
+        release.set()
+        sensor.stopStreaming()
+
+
+def test_callback_runs_on_a_worker_thread_unless_unthreaded(sensor):
+    threads = {}
+    done = threading.Event()
+
+    def callback(sample):
+        threads.setdefault('threaded', threading.current_thread())
+        done.set()
+
+    sensor.setNewDataCallBack(callback)
+    sensor.startStreaming()
+    assert done.wait(2.0)
+    assert threads['threaded'] is sensor.callback_worker.thread
+    done.clear()
+
+    def inline(sample):
+        threads.setdefault('inline', threading.current_thread())
+        done.set()
+
+    worker = sensor.callback_worker
+    sensor.setNewDataCallBack(inline, threaded=False)
+    assert sensor.callback_worker is None
+    assert done.wait(2.0)
+    sensor.stopStreaming()
+    assert threads['inline'] is sensor.read_thread
+    worker.thread.join(1.0)
+    assert not worker.thread.is_alive()
+
+
+def test_replacing_the_callback_never_calls_the_old_one_inline(sensor):
+    reader_calls = []
+    read_thread = sensor.read_thread
+
+    def old(sample):
+        if threading.current_thread() is read_thread:
+            reader_calls.append(sample)
+
+    sensor.setNewDataCallBack(old)
+    sensor.startStreaming()
+    try:
+        for i in range(50):
+            sensor.setNewDataCallBack(old)
+            time.sleep(0.002)
+    finally:
+        sensor.stopStreaming()
+    assert reader_calls == []
+
+
+def test_callbacks_survive_reconnect_and_stop_on_close(emulator):
+    sensor = openSensor(emulator)
+    received = threading.Event()
+    sensor.setNewDataCallBack(lambda sample: received.set())
+    worker = sensor.callback_worker
+    assert sensor.reconnect()
+    sensor.startStreaming()
+    assert received.wait(2.0)
+    assert sensor.callback_worker is worker
+    sensor.close()
+    worker.thread.join(1.0)
+    assert not worker.thread.is_alive()
@@ -0,0 +1,47 @@
+import struct
+
+import threespace_api as ts_api
+
+command_dict = ts_api.TSLXSensor.command_dict
+
+
+def test_descriptor_is_compiled_once_per_entry():
+    descriptor = ts_api.getCommandDescriptor(command_dict['getSerialNumber'])
+    assert ts_api.getCommandDescriptor(command_dict['getSerialNumber']) is descriptor
+    assert descriptor.cmd_byte == 0xed
+    assert descriptor.out_parse.format == '>I'
+    assert descriptor.out_single
+    assert descriptor.in_parse is None
+
+
+def test_replaced_entry_is_recompiled():
+    descriptor = ts_api.getCommandDescriptor(command_dict['getSerialNumber'])
+    entry = (0xed, 8, '>II', 0, None, 1)
+    replaced = ts_api.getCommandDescriptor(entry)
+    assert replaced is not descriptor
+    assert replaced.out_parse.size == 8
+    assert not replaced.out_single
+
+
+def test_write_arrays_match_the_wire_format():
+    descriptor = ts_api.getCommandDescriptor(command_dict['getSerialNumber'])
+    assert ts_api._makeCommandWriteArray(descriptor, 0xf9) == bytes(bytearray((0xf9, 0xed, 0xed)))
+    wireless = ts_api._makeCommandWriteArray(descriptor, 0xfa, 3)
+    assert bytes(wireless) == bytes(bytearray((0xfa, 3, 0xed, (3 + 0xed) % 256)))
+    descriptor = ts_api.getCommandDescriptor(command_dict['setLEDColor'])
+    write_array = bytes(ts_api._makeCommandWriteArray(descriptor, 0xf7, None, (0.0, 0.5, 1.0)))
+    data = struct.pack('>fff', 0.0, 0.5, 1.0)
+    assert write_array == bytes(bytearray((0xf7, 0xee))) + data + bytes(bytearray(((0xee + sum(bytearray(data))) % 256,)))
+
+
+def test_unpack_command_output():
+    descriptor = ts_api.getCommandDescriptor(command_dict['getLEDColor'])
+    assert ts_api._unpackCommandOutput(descriptor, struct.pack('>fff', 0.25, 0.5, 1.0)) == (0.25, 0.5, 1.0)
+    descriptor = ts_api.getCommandDescriptor(command_dict['getSerialNumber'])
+    assert ts_api._unpackCommandOutput(descriptor, struct.pack('>I', 7)) == 7
+
+
+def test_compile_command_dict_covers_every_entry():
+    ts_api.compileCommandDict(command_dict)
+    for command_args in command_dict.values():
+        assert command_args in ts_api._command_descriptors
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+import threespace_api as ts_api
+
+from conftest import openSensor
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    path = str(tmp_path / "device_cache.json")
+    ts_api.setDeviceCachePath(path)
+    yield path
+    ts_api.setDeviceCachePath(None)
+
+
+def _readCache(cache_path):
+    with open(cache_path) as cache_file:
+        return json.load(cache_file)
+
+
+def _verify(emulator):
+    serial_port = ts_api.serial.Serial(emulator.port_name, baudrate=emulator.baudrate, timeout=1.0)
+    try:
+        return ts_api._verifyCachedDevice(serial_port, ('LX',))
+    finally:
+        serial_port.close()
+
+
+def _failVersionProbe(monkeypatch):
+    # A cache hit must not need the firmware version probe
+    def checkSoftwareVersion(serial_port):
+        raise AssertionError("version probe ran on a cache hit")
+
+    monkeypatch.setattr(ts_api, 'checkSoftwareVersionFromPort', checkSoftwareVersion)
+
+
+def test_cache_entry_keyed_by_port_and_serial(emulator, cache_path):
+    sensor = openSensor(emulator)
+    sensor.close()
+    cache = _readCache(cache_path)
+    serial_key = '{0:08X}'.format(emulator.device.serial_number)
+    entry = cache[emulator.port_name][serial_key]
+    assert entry['serial_number'] == emulator.device.serial_number
+    assert entry['device_type'] == 'LX'
+    assert entry['stream_slot_cmds'][0] == 'getTaredOrientationAsQuaternion'
+
+
+def test_cache_hit_skips_probes(emulator, cache_path, monkeypatch):
+    openSensor(emulator).close()
+    assert _verify(emulator)['serial_number'] == emulator.device.serial_number
+    _failVersionProbe(monkeypatch)
+    sensor = openSensor(emulator)
+    try:
+        assert sensor.serial_number == emulator.device.serial_number
+        assert sensor.getSerialNumber() == emulator.device.serial_number
+    finally:
+        sensor.close()
+
+
+def test_cache_miss_on_other_serial_reprobes(emulator, cache_path):
+    openSensor(emulator).close()
+    # Move the entry to a serial number that is not on the port, like a
+    # different sensor plugged in where this one used to be
+    cache = _readCache(cache_path)
+    port_entries = cache[emulator.port_name]
+    entry = port_entries.pop('{0:08X}'.format(emulator.device.serial_number))
+    entry['serial_number'] = 0x0EA7FFFF
+    port_entries['0EA7FFFF'] = entry
+    with open(cache_path, 'w') as cache_file:
+        json.dump(cache, cache_file)
+    ts_api.setDeviceCachePath(cache_path)
+    assert _verify(emulator) is None
+    sensor = openSensor(emulator)
+    sensor.close()
+    port_entries = _readCache(cache_path)[emulator.port_name]
+    assert sorted(port_entries) == sorted(['0EA7FFFF', '{0:08X}'.format(emulator.device.serial_number)])
+
+
+def test_clear_device_cache_invalidates(emulator, cache_path, monkeypatch):
+    openSensor(emulator).close()
+    ts_api.clearDeviceCache()
+    assert _verify(emulator) is None
+    probes = []
+    check_version = ts_api.checkSoftwareVersionFromPort
+
+    def checkSoftwareVersion(serial_port):
+        probes.append(serial_port.name)
+        return check_version(serial_port)
+
+    monkeypatch.setattr(ts_api, 'checkSoftwareVersionFromPort', checkSoftwareVersion)
+    openSensor(emulator).close()
+    assert probes == [emulator.port_name]
@@ -0,0 +1,67 @@
+import struct
+import time
+
+import serial
+
+import threespace_api as ts_api
+from threespace_emulator import TSEmulator, TSS_EMU_FIRMWARE_VERSION
+
+from conftest import nextSerialNumber
+
+
+def _f7(port, command, input_data=b''):
+    cmd_byte = ts_api.TSLXSensor.command_dict[command][0]
+    packet = bytearray((0xf7, cmd_byte)) + bytearray(input_data)
+    packet.append(sum(packet[1:]) % 256)
+    port.write(packet)
+
+
+def test_emulator_answers_wired_commands():
+    serial_number = nextSerialNumber()
+    with TSEmulator(serial_number=serial_number) as emulator:
+        port = serial.Serial(emulator.port_name, timeout=1.0)
+        try:
+            _f7(port, 'getSerialNumber')
+            assert struct.unpack('>I', port.read(4))[0] == serial_number
+            _f7(port, 'getFirmwareVersionString')
+            assert port.read(12).decode('ascii') == TSS_EMU_FIRMWARE_VERSION
+        finally:
+            port.close()
+        assert emulator.commands_handled == 2
+
+
+def test_emulator_ignores_commands_with_bad_checksum():
+    with TSEmulator(serial_number=nextSerialNumber()) as emulator:
+        port = serial.Serial(emulator.port_name, timeout=0.2)
+        try:
+            port.write(bytearray((0xf7, 0xed, 0x00)))
+            assert port.read(4) == b''
+            _f7(port, 'getSerialNumber')
+            assert len(port.read(4)) == 4
+        finally:
+            port.close()
+        assert emulator.commands_handled == 1
+
+
+def test_emulator_stores_settings(emulator):
+    sensor = ts_api.TSLXSensor(emulator.port_name)
+    try:
+        assert sensor.setLEDColor((0.25, 0.5, 1.0))
+        assert sensor.getLEDColor() == (0.25, 0.5, 1.0)
+    finally:
+        sensor.close()
+
+
+def test_emulator_streams_at_sample_rate_and_corrupts_on_request():
+    with TSEmulator(serial_number=nextSerialNumber(), sample_rate=500, corruption=1.0, seed=2) as emulator:
+        sensor = ts_api.TSLXSensor(emulator.port_name)
+        try:
+            sensor.setStreamingTiming(0, 0xFFFFFFFF, 0)
+            sensor.setStreamingSlots('getTaredOrientationAsQuaternion')
+            sensor.startStreaming()
+            time.sleep(0.2)
+            sensor.stopStreaming()
+        finally:
+            sensor.close()
+        assert 50 <= emulator.packets_streamed <= 150
+        assert emulator.packets_corrupted == emulator.packets_streamed
@@ -0,0 +1,81 @@
+import os
+import select
+import threading
+
+import pytest
+
+import threespace_api as ts_api
+import linux_threespace_utils
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    try:
+        watcher = linux_threespace_utils.TSPortWatcher(str(tmp_path))
+    except OSError:
+        pytest.skip("inotify is not available")
+    yield watcher
+    watcher.close()
+
+
+def _waitForEvents(watcher):
+    assert select.select([watcher], [], [], 1.0)[0]
+    return watcher.read()
+
+
+def test_port_watcher_reports_serial_ports(tmp_path, watcher):
+    port_path = tmp_path / "ttyACM0"
+    port_path.write_text("")
+    (tmp_path / "video0").write_text("")
+    assert _waitForEvents(watcher) == [(str(port_path), True)]
+    os.remove(str(port_path))
+    assert _waitForEvents(watcher) == [(str(port_path), False)]
+    assert watcher.read() == []
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    # Scanning mode with a port list the test controls
+    port_list = []
+
+    def noWatcher(*args):
+        raise OSError("no inotify")
+
+    monkeypatch.setattr(ts_api, 'TSPortWatcher', noWatcher)
+    monkeypatch.setattr(ts_api, 'getComPorts', lambda filter=ts_api.TSS_FIND_ALL: list(port_list))
+    return port_list
+
+
+def test_monitor_attaches_and_detaches(emulator, ports):
+    attached = []
+    detached = threading.Event()
+
+    def openSensor(com_port):
+        return ts_api.TSLXSensor(com_port, baudrate=emulator.baudrate)
+
+    monitor = ts_api.TSDeviceMonitor(on_attach=attached.append, on_detach=lambda sensor: detached.set(),
+                                     sensor_class=openSensor, settle_time=0, poll_interval=0.05)
+    with monitor:
+        assert monitor.waitForSensor(0.1) is None
+        ports.append(ts_api.ComInfo(emulator.port_name, "LX", "LX"))
+        sensor = monitor.waitForSensor(2.0)
+        assert sensor is not None
+        assert sensor.serial_number == emulator.device.serial_number
+        assert attached == [sensor]
+        del ports[:]
+        assert detached.wait(2.0)
+        assert monitor.getSensors() == []
+        assert sensor.serial_port is None
+
+
+def test_monitor_gives_up_after_retries(ports):
+    attempts = []
+
+    def failingOpen(com_port):
+        attempts.append(com_port)
+        raise IOError("port busy")
+
+    ports.append(ts_api.ComInfo("/dev/ttyACM9", "LX", "LX"))
+    with ts_api.TSDeviceMonitor(sensor_class=failingOpen, settle_time=0.01, poll_interval=0.02) as monitor:
+        assert monitor.waitForSensor(0.5) is None
+    assert attempts == ["/dev/ttyACM9"] * ts_api._hotplug_attach_retries
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+import import_benchmark
+import threespace_api as ts_api
+from threespace_utils import _LazyModule, _parseFirmwareDate
+
+
+def test_lazy_module_imports_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "ts_lazy_target.py").write_text("VALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "ts_lazy_target", raising=False)
+    module = _LazyModule("ts_lazy_target")
+    assert "ts_lazy_target" not in sys.modules
+    assert module.VALUE == 42
+    assert "ts_lazy_target" in sys.modules
+    assert repr(module) == "<lazy module 'ts_lazy_target'>"
+
+
+def test_import_does_not_load_lazy_modules():
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    timings, loaded = import_benchmark._runImport("threespace_api", env)
+    assert loaded == []
+    assert "threespace_api" in timings
+
+
+def test_firmware_date_parse():
+    assert _parseFirmwareDate("25Apr2013") == (2013, 4, 25)
+    with pytest.raises(ValueError):
+        _parseFirmwareDate("25Foo2013")
+
+
+def test_reverse_command_dict_is_per_class():
+    lx_reverse = ts_api.TSLXSensor.reverse_command_dict
+    assert lx_reverse is ts_api.TSLXSensor.reverse_command_dict
+    for name, args in ts_api.TSLXSensor.command_dict.items():
+        assert args[0] in lx_reverse
+    assert lx_reverse[ts_api.TSLXSensor.command_dict['getSerialNumber'][0]] == 'getSerialNumber'
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import linux_threespace_utils
+from threespace_utils import TSS_FIND_ALL_KNOWN, TSS_FIND_UNKNOWN
+
+
+def _addTTY(root, tty_name, vid, pid, product=""):
+    # Builds the sysfs layout of a USB serial port: the tty's device links to
+    # an interface directory whose parent USB device holds the IDs
+    usb_path = root / "devices" / tty_name
+    interface_path = usb_path / (tty_name + ":1.0")
+    interface_path.mkdir(parents=True)
+    (usb_path / "idVendor").write_text(vid + "\n")
+    (usb_path / "idProduct").write_text(pid + "\n")
+    if product:
+        (usb_path / "product").write_text(product + "\n")
+    tty_path = root / "class" / "tty" / tty_name
+    tty_path.mkdir(parents=True)
+    os.symlink(str(interface_path), str(tty_path / "device"))
+
+
+@pytest.fixture
+def sysfs(tmp_path, monkeypatch):
+    monkeypatch.setattr(linux_threespace_utils, '_sysfs_tty_path', str(tmp_path / "class" / "tty"))
+    return tmp_path
+
+
+def test_yei_and_nano_ports_are_matched(sysfs):
+    _addTTY(sysfs, "ttyACM0", "2476", "1090", "3-Space LX")
+    _addTTY(sysfs, "ttyUSB0", "0403", "6015", "Nano")
+    ports = linux_threespace_utils.getComPorts(TSS_FIND_ALL_KNOWN)
+    assert [(port[0], port[2]) for port in ports] == [("/dev/ttyACM0", "LX"), ("/dev/ttyUSB0", "NANO")]
+
+
+def test_other_ftdi_products_are_unknown(sysfs):
+    # A plain FT232R shares FTDI's vendor ID with the Nano's bridge
+    _addTTY(sysfs, "ttyUSB0", "0403", "6001")
+    assert linux_threespace_utils.getComPorts(TSS_FIND_ALL_KNOWN) == []
+    ports = linux_threespace_utils.getComPorts(TSS_FIND_UNKNOWN)
+    assert [(port[0], port[2]) for port in ports] == [("/dev/ttyUSB0", "???")]
+    info = linux_threespace_utils.getDeviceInfoFromComPort("/dev/ttyUSB0", poll_device=False)
+    assert info[1] == "???"
+
+
+def test_device_info_reads_type_from_sysfs(sysfs):
+    _addTTY(sysfs, "ttyACM0", "2476", "1010", "3-Space USB")
+    info = linux_threespace_utils.getDeviceInfoFromComPort("/dev/ttyACM0", poll_device=False)
+    assert info[1] == "USB"
+    assert "3-Space USB" in info[0]
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import threespace_api as ts_api
+
+_serial_number_cmd = ts_api._TSSensor.command_dict['getSerialNumber'][0]
+
+
+def _holdResponses(emulator, count, delay):
+    # Delays the next count getSerialNumber responses by delay seconds, or
+    # drops them for a delay of None
+    respond = emulator._respond
+    held = []
+
+    def heldRespond(start_byte, device, logical_id, command, args, data):
+        if args[0] == _serial_number_cmd and len(held) < count:
+            held.append(command)
+            if delay is None:
+                return
+            timer = threading.Timer(delay, respond, (start_byte, device, logical_id, command, args, data))
+            timer.daemon = True
+            timer.start()
+            return
+        respond(start_byte, device, logical_id, command, args, data)
+
+    emulator._respond = heldRespond
+    return held
+
+
+def test_dropped_response_times_out(emulator, sensor):
+    _holdResponses(emulator, 1, None)
+    start_time = time.perf_counter()
+    fail_byte, timestamp, data = sensor.f9WriteRead('getSerialNumber')
+    assert fail_byte
+    assert time.perf_counter() - start_time < ts_api._max_command_timeout
+    assert sensor.stats()['timeouts'] == 1
+    assert sensor.getSerialNumber() == emulator.device.serial_number
+
+
+def test_late_response_goes_to_timed_out_request(emulator, sensor):
+    sensor.getSerialNumber()
+    _holdResponses(emulator, 1, 0.09)
+    estimator = sensor.command_pipeline.roundTripEstimator(_serial_number_cmd)
+    estimator.rto = ts_api._min_command_timeout
+    fail_byte, timestamp, data = sensor.f9WriteRead('getSerialNumber')
+    assert fail_byte
+    time.sleep(0.2)
+    # The next request gets its own response, not the late one
+    assert sensor.getSerialNumber() == emulator.device.serial_number
+    stats = sensor.stats()
+    assert stats['late_responses'] == 1
+    assert stats['unmatched_packets'] == 0
+
+
+def test_pipelined_commands_resolve_in_order(emulator, sensor):
+    requests = [sensor.f9WriteReadFuture('getSerialNumber') for i in range(8)]
+    for future in requests:
+        fail_byte, timestamp, data = future.result(2.0)
+        assert not fail_byte
+        assert data == emulator.device.serial_number
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import threespace_api as ts_api
+
+
+def _fakeProbe(monkeypatch, hung_ports, release):
+    # Replaces the port probe: hung ports block until release is set, a port
+    # named 'bad' raises and every other port reports an LX sensor
+    def getDeviceInfo(port_name, poll_device=True):
+        if port_name in hung_ports:
+            release.wait()
+        if port_name == 'bad':
+            raise IOError("probe failed")
+        return ts_api.SensorInfo(port_name, 'LX', '00000001', '', '', False)
+
+    monkeypatch.setattr(ts_api, 'getDeviceInfoFromComPort', getDeviceInfo)
+
+
+def test_probe_all_yields_each_port(monkeypatch):
+    _fakeProbe(monkeypatch, (), threading.Event())
+    results = dict(ts_api.probeAll(['a', 'bad', 'c'], poll_device=False))
+    assert sorted(results) == ['a', 'c']
+    assert results['a'].dev_type == 'LX'
+
+
+def test_probe_all_deadline_skips_hung_port(monkeypatch):
+    release = threading.Event()
+    _fakeProbe(monkeypatch, ('hung',), release)
+    try:
+        start = time.perf_counter()
+        results = dict(ts_api.probeAll(['a', 'hung', 'c'], deadline=0.2))
+        elapsed = time.perf_counter() - start
+    finally:
+        release.set()
+    assert sorted(results) == ['a', 'c']
+    assert elapsed < 1.0
+
+
+def test_probe_all_without_ports_yields_nothing(monkeypatch):
+    _fakeProbe(monkeypatch, (), threading.Event())
+    assert list(ts_api.probeAll([])) == []
@@ -0,0 +1,74 @@
+import pytest
+
+import threespace_api as ts_api
+from threespace_emulator import TSEmulator
+
+from conftest import nextSerialNumber, openSensor
+
+READ_MODES = (ts_api.TSS_READ_HEADER, ts_api.TSS_READ_FRAMED, ts_api.TSS_READ_ZERO_COPY)
+
+
+def _takeSamples(sensor, count):
+    with sensor.iterStream(timeout=2.0) as stream:
+        sensor.startStreaming()
+        samples = [next(stream) for i in range(count)]
+    sensor.stopStreaming()
+    return samples
+
+
+@pytest.mark.parametrize('mode', READ_MODES)
+def test_read_mode_streams_and_answers_commands(emulator, sensor, mode):
+    assert sensor.setReadMode(mode)
+    assert sensor.getReadMode() == mode
+    samples = _takeSamples(sensor, 20)
+    assert len(samples) == 20
+    for timestamp, quaternion in samples:
+        assert len(quaternion) == 4
+    assert sensor.getSerialNumber() == emulator.device.serial_number
+
+
+def test_read_mode_switch_while_streaming(emulator, sensor):
+    with sensor.iterStream(timeout=2.0) as stream:
+        sensor.startStreaming()
+        for mode in READ_MODES + READ_MODES:
+            assert sensor.setReadMode(mode)
+            assert next(stream) is not None
+            assert sensor.getSerialNumber() == emulator.device.serial_number
+    sensor.stopStreaming()
+    assert sensor.stats()['reader_errors'] == 0
+
+
+@pytest.mark.parametrize('mode', (ts_api.TSS_READ_FRAMED, ts_api.TSS_READ_ZERO_COPY))
+def test_checksum_mode_resyncs_corrupt_stream(mode):
+    with TSEmulator(serial_number=nextSerialNumber(), sample_rate=500, corruption=0.05, seed=3) as emulator:
+        sensor = openSensor(emulator)
+        try:
+            assert sensor.setChecksumMode(True)
+            assert sensor.getChecksumMode()
+            sensor.setReadMode(mode)
+            samples = _takeSamples(sensor, 300)
+            assert emulator.packets_corrupted > 0
+            stats = sensor.stats()
+            assert stats['resyncs'] > 0
+            for timestamp, quaternion in samples:
+                assert len(quaternion) == 4
+            assert sensor.getSerialNumber() == emulator.device.serial_number
+        finally:
+            sensor.close()
+
+
+def test_checksum_mode_failure_restores_header(sensor):
+    header_size = sensor.header_parse.size
+    f7WriteRead = sensor.f7WriteRead
+
+    def failingWriteRead(command, input_list=None):
+        if command == '_setWiredResponseHeaderBitfield':
+            raise Exception("No response")
+        return f7WriteRead(command, input_list)
+
+    sensor.f7WriteRead = failingWriteRead
+    assert sensor.setChecksumMode(True) is False
+    del sensor.f7WriteRead
+    assert not sensor.getChecksumMode()
+    assert sensor.header_parse.size == header_size
+    assert sensor.getSerialNumber() is not None
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+import threespace_api as ts_api
+from threespace_emulator import TSEmulator
+
+from conftest import nextSerialNumber, openSensor
+
+
+@pytest.fixture
+def hub():
+    hub = ts_api.TSReaderHub()
+    yield hub
+    hub.close()
+
+
+def test_register_and_unregister_many_sensors(hub):
+    emulators = [TSEmulator(serial_number=nextSerialNumber(), sample_rate=200) for i in range(3)]
+    sensors = []
+    try:
+        for emulator in emulators:
+            emulator.start()
+            sensor = openSensor(emulator, interval=5000)
+            sensors.append(sensor)
+            assert sensor.setReaderHub(hub)
+            assert sensor.getReaderHub() is hub
+        assert sensor.read_thread is None
+        streams = [sensor.iterStream(timeout=2.0) for sensor in sensors]
+        for sensor in sensors:
+            sensor.startStreaming()
+        for sensor, stream, emulator in zip(sensors, streams, emulators):
+            assert next(stream) is not None
+            assert sensor.getSerialNumber() == emulator.device.serial_number
+        assert len(hub) == 3
+        # Moving a sensor back onto its own thread
+        assert sensors[0].setReaderHub(None)
+        assert len(hub) == 2
+        assert sensors[0].read_thread is not None
+        assert sensors[0].getSerialNumber() == emulators[0].device.serial_number
+        assert next(streams[0]) is not None
+        sensors[1].close()
+        assert len(hub) == 1
+        assert sensors[2].getSerialNumber() == emulators[2].device.serial_number
+    finally:
+        for sensor in sensors:
+            sensor.close()
+        for emulator in emulators:
+            emulator.stop()
+    assert len(hub) == 0
+
+
+def test_unregister_returns_when_hub_thread_died(emulator, hub):
+    sensor = openSensor(emulator)
+    try:
+        assert sensor.setReaderHub(hub)
+        hub.selector.select = None  # the next poll raises and ends the hub thread
+        hub._wake()
+        hub.thread.join(1.0)
+        assert not hub.thread.is_alive()
+        start_time = time.perf_counter()
+        assert sensor.setReaderHub(None)
+        assert time.perf_counter() - start_time < 1.0
+        assert sensor.getSerialNumber() == emulator.device.serial_number
+        with pytest.raises(Exception):
+            hub.register(sensor)
+    finally:
+        sensor.close()
+
+
+def test_hub_survives_failing_sensor(emulator, hub):
+    sensor = openSensor(emulator)
+    try:
+        assert sensor.setReaderHub(hub)
+        expire = sensor.command_pipeline.expire
+
+        def failingExpire():
+            raise Exception("expire failed")
+
+        sensor.command_pipeline.expire = failingExpire
+        time.sleep(0.05)
+        sensor.command_pipeline.expire = expire
+        assert hub.thread.is_alive()
+        assert sensor.getSerialNumber() == emulator.device.serial_number
+    finally:
+        sensor.close()
@@ -0,0 +1,104 @@
+import struct
+import time
+
+import threespace_api as ts_api
+from threespace_recorder import TSStreamRecorder
+
+from conftest import openSensor
+
+
+def _waitFor(condition, timeout=2.0):
+    end_time = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end_time:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_overwrite_recorder_keeps_newest(sensor):
+    sensor.startStreaming()
+    sensor.startRecordingData(capacity=10)
+    recorder = sensor.stream_recorder
+    assert _waitFor(lambda: recorder.dropped > 0)
+    assert len(recorder) == 10
+    timestamps = recorder.snapshot(copy=True)['timestamp']
+    assert (timestamps[1:] >= timestamps[:-1]).all()
+    sensor.stopStreaming()
+
+
+def test_blocking_recorder_does_not_block_reader(sensor):
+    sensor.startStreaming()
+    sensor.startRecordingData(capacity=10, overflow=ts_api.TSS_RECORD_BLOCK)
+    recorder = sensor.stream_recorder
+    assert _waitFor(lambda: len(recorder) == 10)
+    # The reader thread keeps answering commands while the recorder is full
+    time.sleep(0.1)
+    start_time = time.perf_counter()
+    assert sensor.getSerialNumber() is not None
+    assert time.perf_counter() - start_time < 0.5
+    assert recorder.dropped == 0
+    assert len(recorder.read(5)) == 5
+    assert _waitFor(lambda: len(recorder) == 10)
+    sensor.clearRecordingData()
+    assert _waitFor(lambda: len(recorder) == 10)
+    sensor.stopStreaming()
+
+
+def test_close_releases_blocked_recorder(emulator):
+    sensor = openSensor(emulator)
+    sensor.startStreaming()
+    sensor.startRecordingData(capacity=5, overflow=ts_api.TSS_RECORD_BLOCK)
+    worker = sensor.record_worker
+    assert _waitFor(lambda: len(sensor.stream_recorder) == 5)
+    time.sleep(0.05)
+    start_time = time.perf_counter()
+    sensor.close()
+    assert time.perf_counter() - start_time < 2.0
+    assert sensor.record_worker is None
+    worker.thread.join(1.0)
+    assert not worker.thread.is_alive()
+
+
+def test_stop_recording_releases_blocked_recorder(sensor):
+    sensor.startStreaming()
+    sensor.startRecordingData(capacity=5, overflow=ts_api.TSS_RECORD_BLOCK)
+    worker = sensor.record_worker
+    assert _waitFor(lambda: len(sensor.stream_recorder) == 5)
+    sensor.stopRecordingData()
+    worker.thread.join(1.0)
+    assert not worker.thread.is_alive()
+    sensor.stopStreaming()
+
+
+def _unitRecorder(capacity, overflow=ts_api.TSS_RECORD_OVERWRITE):
+    command_dict = ts_api.TSLXSensor.command_dict
+    return TSStreamRecorder(command_dict, ['getTaredOrientationAsQuaternion'], capacity, overflow)
+
+
+def _payload(value):
+    return struct.pack('>4f', value, 0.0, 0.0, 1.0)
+
+
+def test_ring_buffer_wraps_and_reads_oldest_first():
+    recorder = _unitRecorder(4)
+    for i in range(6):
+        assert recorder.record(float(i), _payload(i))
+    assert len(recorder) == 4
+    assert recorder.dropped == 2
+    assert list(recorder.snapshot()['timestamp']) == [2.0, 3.0, 4.0, 5.0]
+    assert list(recorder.snapshot()['getTaredOrientationAsQuaternion'][:, 0]) == [2.0, 3.0, 4.0, 5.0]
+    assert list(recorder.read(3)['timestamp']) == [2.0, 3.0, 4.0]
+    assert len(recorder) == 1
+    assert not recorder.record(0.0, b'short')
+
+
+def test_blocking_recorder_refuses_samples_once_closed():
+    recorder = _unitRecorder(2, ts_api.TSS_RECORD_BLOCK)
+    assert recorder.record(0.0, _payload(0))
+    assert recorder.record(1.0, _payload(1))
+    recorder.close()
+    assert not recorder.record(2.0, _payload(2))
+    recorder.reopen()
+    recorder.read(1)
+    assert recorder.record(2.0, _payload(2))
@@ -0,0 +1,73 @@
+import pytest
+
+import threespace_api as ts_api
+
+from test_pipeline import _holdResponses, _serial_number_cmd
+
+
+def test_first_sample_sets_srtt_and_rttvar():
+    estimator = ts_api.TSRoundTripEstimator()
+    assert estimator.rto == ts_api._initial_command_timeout
+    estimator.update(0.02)
+    assert estimator.srtt == pytest.approx(0.02)
+    assert estimator.rttvar == pytest.approx(0.01)
+    assert estimator.rto == pytest.approx(0.06)
+
+
+def test_later_samples_are_smoothed():
+    estimator = ts_api.TSRoundTripEstimator()
+    estimator.update(0.1)
+    estimator.update(0.02)
+    # rttvar = 3/4 * 0.05 + 1/4 * |0.1 - 0.02|, srtt = 7/8 * 0.1 + 1/8 * 0.02
+    assert estimator.rttvar == pytest.approx(0.0575)
+    assert estimator.srtt == pytest.approx(0.09)
+    assert estimator.rto == pytest.approx(0.09 + 4 * 0.0575)
+    assert estimator.sample_count == 2
+
+
+def test_timeout_is_clamped():
+    estimator = ts_api.TSRoundTripEstimator(min_timeout=0.05, max_timeout=1.0)
+    estimator.update(0.001)
+    assert estimator.rto == 0.05
+    estimator = ts_api.TSRoundTripEstimator(min_timeout=0.05, max_timeout=1.0)
+    estimator.update(2.0)
+    assert estimator.rto == 1.0
+
+
+def test_backoff_doubles_up_to_max():
+    estimator = ts_api.TSRoundTripEstimator(initial_timeout=0.3, max_timeout=1.0)
+    estimator.backoff()
+    assert estimator.rto == pytest.approx(0.6)
+    estimator.backoff()
+    assert estimator.rto == 1.0
+    # The next measured response replaces the backed off timeout
+    estimator.update(0.02)
+    assert estimator.rto == pytest.approx(0.06)
+
+
+def test_timeout_counts_requests_in_flight():
+    estimator = ts_api.TSRoundTripEstimator()
+    assert estimator.timeout(2) == pytest.approx(0.5 + 2 * ts_api._queued_command_timeout)
+    estimator.update(0.02)
+    assert estimator.timeout(3) == pytest.approx(0.06 + 3 * 0.02)
+
+
+def test_retry_delay_backs_off_with_jitter():
+    estimator = ts_api.TSRoundTripEstimator(initial_timeout=0.2)
+    for attempt in range(6):
+        delay = min(0.2 * 2 ** attempt / 2, ts_api._max_retry_delay)
+        for i in range(20):
+            assert delay / 2 <= estimator.retryDelay(attempt) <= delay
+
+
+def test_timeout_backs_off_the_command_estimator(emulator, sensor):
+    sensor.getSerialNumber()
+    estimator = sensor.command_pipeline.roundTripEstimator(_serial_number_cmd)
+    assert estimator.sample_count >= 1
+    rto = estimator.rto
+    _holdResponses(emulator, 1, None)
+    fail_byte, timestamp, data = sensor.f9WriteRead('getSerialNumber')
+    assert fail_byte
+    assert estimator.rto == pytest.approx(min(rto * 2, estimator.max_timeout))
+    # Each logical ID behind the port keeps its own estimate
+    assert sensor.command_pipeline.roundTripEstimator(_serial_number_cmd, 1) is not estimator
@@ -0,0 +1,46 @@
+import time
+
+from conftest import openSensor
+
+
+def test_stream_iterator_survives_reconnect(sensor):
+    stream = sensor.iterStream(timeout=2.0)
+    sensor.startStreaming()
+    assert len([next(stream) for i in range(5)]) == 5
+    # reconnect() reads the response header back directly, so the sensor
+    # must not be streaming over it
+    sensor.stopStreaming()
+    assert sensor.reconnect()
+    sensor.startStreaming()
+    assert len([next(stream) for i in range(5)]) == 5
+    assert not stream.stream_queue.closed
+    stream.close()
+
+
+def test_close_ends_stream_iterator(emulator):
+    sensor = openSensor(emulator)
+    stream = sensor.iterStream(timeout=2.0)
+    sensor.startStreaming()
+    next(stream)
+    sensor.close()
+    assert stream.stream_queue.closed
+    # The samples queued before closing are still delivered, then it ends
+    assert len(list(stream)) < 1024
+
+
+def test_stream_iterator_batches_and_counts_drops(sensor):
+    with sensor.iterStream(maxsize=4, batch=8, timeout=2.0) as stream:
+        sensor.startStreaming()
+        time.sleep(0.1)
+        batch = next(stream)
+        sensor.stopStreaming()
+        assert 1 <= len(batch) <= 4
+        assert stream.dropped > 0
+        assert stream.total >= len(batch) + stream.dropped
+    assert stream.stream_queue not in sensor.stream_queues
+
+
+def test_stream_iterator_stops_on_timeout(sensor):
+    stream = sensor.iterStream(timeout=0.1)
+    assert list(stream) == []
+    assert stream.stream_queue not in sensor.stream_queues
@@ -0,0 +1,101 @@
+import pytest
+
+import threespace_api as ts_api
+from threespace_emulator import TSEmulator
+
+from conftest import nextSerialNumber, openSensor
+
+
+def test_unpaced_stream_uses_max_stream_rate():
+    plan, = ts_api.planStreamingLink([(43, 0)], 115200)
+    assert plan.requested_hz == 1000.0
+    assert not plan.fits
+    assert plan.suggested_baudrate == 921600
+    assert plan.min_interval > 1000
+
+
+def test_unpaced_stream_counts_against_paced_streams():
+    unpaced, paced = ts_api.planStreamingLink([(43, 0), (43, 2000)], 460800)
+    assert unpaced.requested_hz == 1000.0
+    assert paced.requested_hz == 500.0
+    assert not paced.fits
+    assert paced.suggested_baudrate == 921600
+
+
+def test_unpaced_stream_at_a_given_filter_rate():
+    plan, = ts_api.planStreamingLink([(43, 0)], 115200, max_stream_hz=100)
+    assert plan.requested_hz == 100.0
+    assert plan.fits
+    assert plan.suggested_baudrate == 57600
+
+
+def test_paced_stream_fits():
+    plan, = ts_api.planStreamingLink([(43, 10000)], 115200)
+    assert plan.requested_hz == 100.0
+    assert plan.fits
+    assert plan.min_interval == 4148
+
+
+@pytest.fixture
+def plan_policy():
+    policy = ts_api.getStreamPlanPolicy()
+    yield
+    ts_api.setStreamPlanPolicy(policy)
+
+
+@pytest.fixture
+def slow_emulator():
+    with TSEmulator(serial_number=nextSerialNumber(), baudrate=115200) as emulator:
+        yield emulator
+
+
+def test_paced_sensor_stream_is_checked_against_the_link(slow_emulator, plan_policy):
+    ts_api.setStreamPlanPolicy(ts_api.TSS_PLAN_RAISE)
+    sensor = openSensor(slow_emulator, interval=1000)
+    try:
+        plan = sensor.planStreaming()
+        assert plan.requested_hz == 1000.0
+        assert not plan.fits
+        with pytest.raises(Exception):
+            sensor.startStreaming()
+        assert sensor.planStreaming(interval=plan.min_interval).fits
+    finally:
+        sensor.close()
+
+
+def test_unpaced_sensor_stream_is_only_checked_on_request(slow_emulator, plan_policy):
+    sensor = openSensor(slow_emulator, interval=0)
+    try:
+        ts_api.setStreamPlanPolicy(ts_api.TSS_PLAN_RAISE)
+        assert not sensor.planStreaming().fits
+        assert sensor.startStreaming()
+        sensor.stopStreaming()
+        ts_api.setStreamPlanPolicy(ts_api.TSS_PLAN_RAISE, plan_unpaced=True)
+        with pytest.raises(Exception):
+            sensor.startStreaming()
+    finally:
+        sensor.close()
+
+
+def test_usb_cdc_stream_is_not_checked(slow_emulator, plan_policy, monkeypatch):
+    ts_api.setStreamPlanPolicy(ts_api.TSS_PLAN_RAISE, plan_unpaced=True)
+    sensor = openSensor(slow_emulator, interval=1000)
+    port_name = slow_emulator.port_name
+
+    def getDeviceInfo(port, poll_device=True):
+        dev_type = "LX" if port == port_name else "???"
+        return ts_api.SensorInfo("", dev_type, 0, "", "", False)
+
+    monkeypatch.setattr(ts_api, 'getDeviceInfoFromComPort', getDeviceInfo)
+    try:
+        assert ts_api.isUSBCDCPort(port_name)
+        assert sensor.startStreaming()
+        sensor.stopStreaming()
+    finally:
+        sensor.close()
+
+
+def test_usb_cdc_device_types():
+    assert ts_api.isUSBCDCPort("/dev/ttyNOTAPORT") is False
+    assert "LX" in ts_api._usb_cdc_device_types
+    assert "NANO" not in ts_api._usb_cdc_device_types
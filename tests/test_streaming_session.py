@@ -0,0 +1,51 @@
+import struct
+
+import pytest
+
+from conftest import openSensor
+
+SLOTS = ['getTaredOrientationAsQuaternion', 'getCorrectedGyroRate']
+
+
+def test_session_configures_once_and_streams(emulator):
+    sensor = openSensor(emulator)
+    with sensor.streamingSession(SLOTS, interval=5000, filter_mode=1, calibration_mode=1) as session:
+        assert session.streaming
+        assert sensor.stream_slot_cmds == SLOTS + ['null'] * 6
+        assert sensor.stream_timing == (5000, 0xFFFFFFFF, 0)
+        assert emulator.device.stream_timing == (5000, 0xFFFFFFFF, 0)
+        stream = sensor.iterStream(timeout=2.0)
+        timestamp, data = next(stream)
+        assert len(data) == 7
+        assert not sensor.record_data
+    assert not session.streaming
+    assert not emulator.device.streaming
+    assert sensor.serial_port is None
+
+
+def test_session_checks_the_read_back(emulator):
+    sensor = openSensor(emulator)
+    handle_command = emulator.device.handleCommand
+
+    def wrongFilterMode(command, args, data):
+        if command == 'getFilterMode':
+            return False, struct.pack('>B', 2)
+        return handle_command(command, args, data)
+
+    emulator.device.handleCommand = wrongFilterMode
+    with pytest.raises(Exception) as error:
+        with sensor.streamingSession(SLOTS, filter_mode=1, close_on_exit=False):
+            pass
+    try:
+        assert "getFilterMode" in str(error.value)
+        assert not emulator.device.streaming
+        assert sensor.serial_port is not None
+    finally:
+        sensor.close()
+
+
+def test_session_rejects_bad_slot_counts(sensor):
+    with pytest.raises(ValueError):
+        sensor.streamingSession([])
+    with pytest.raises(ValueError):
+        sensor.streamingSession(SLOTS * 5)
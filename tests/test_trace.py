@@ -0,0 +1,62 @@
+import json
+import threading
+import time
+
+import pytest
+
+import threespace_api as ts_api
+from threespace_trace import TSTracer
+
+
+def test_span_and_counter_events():
+    tracer = TSTracer()
+    start_time = tracer.now()
+    tracer.span("work", start_time, args={'cmd': 0xed}, end_time=start_time + 0.002)
+    tracer.counter("depth", {'depth': 3})
+    span, counter = tracer.events
+    assert span['ph'] == 'X' and span['cat'] == 'command'
+    assert span['dur'] == pytest.approx(2000)
+    assert span['args'] == {'cmd': 0xed}
+    assert span['tid'] == threading.get_ident()
+    assert counter['ph'] == 'C' and counter['args'] == {'depth': 3}
+    metadata = tracer.traceEvents()[0]
+    assert metadata['ph'] == 'M'
+    assert metadata['args']['name'] == threading.current_thread().name
+
+
+def test_max_events_counts_dropped():
+    tracer = TSTracer(max_events=2)
+    for i in range(5):
+        tracer.span("work", tracer.now())
+    assert len(tracer) == 2
+    assert tracer.dropped == 3
+
+
+def test_save_writes_chrome_trace(tmp_path):
+    tracer = TSTracer(path=str(tmp_path / "trace.json"), max_events=1)
+    tracer.span("work", tracer.now())
+    tracer.counter("depth", {'depth': 1})
+    with open(tracer.save()) as trace_file:
+        trace = json.load(trace_file)
+    assert [event['ph'] for event in trace['traceEvents']] == ['M', 'X']
+    assert trace['otherData'] == {'dropped_events': 1}
+    with pytest.raises(ValueError):
+        TSTracer().save()
+
+
+def test_sensor_commands_and_stream_are_traced(sensor, tmp_path):
+    path = str(tmp_path / "trace.json")
+    ts_api.startTrace(path)
+    try:
+        sensor.getSerialNumber()
+        sensor.startStreaming()
+        time.sleep(0.05)
+        sensor.stopStreaming()
+    finally:
+        tracer = ts_api.stopTrace()
+    assert ts_api.getTracer() is None
+    names = set(event['name'] for event in tracer.events)
+    assert set(["makeWriteArray", "serial write", "wait for response", "unpack", "stream dispatch"]) <= names
+    assert "stream queues " + sensor.serial_number_hex in names
+    with open(path) as trace_file:
+        assert len(json.load(trace_file)['traceEvents']) >= len(tracer)
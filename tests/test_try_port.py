@@ -0,0 +1,37 @@
+import threading
+
+import threespace_utils
+
+
+class _HungSerial(object):
+    # Stands in for the serial module, Serial() blocks like a driver stuck
+    # in open() until release is set
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def Serial(self, *args, **kwargs):
+        self.release.wait()
+        raise IOError("port gone")
+
+
+def test_try_port_opens_emulator(emulator):
+    assert threespace_utils.tryPort(emulator.port_name) is True
+
+
+def test_try_port_missing_port(tmp_path):
+    assert threespace_utils.tryPort(str(tmp_path / "ttyMISSING")) is None
+
+
+def test_try_port_timeout_holds_port(monkeypatch):
+    hung_serial = _HungSerial()
+    monkeypatch.setattr(threespace_utils, 'serial', hung_serial)
+    try:
+        assert threespace_utils.tryPort("/dev/ttyHUNG", timeout=0.1) is False
+        # The first check still holds the port, a second one must wait on it
+        assert threespace_utils.tryPort("/dev/ttyHUNG", timeout=0.1) is False
+    finally:
+        hung_serial.release.set()
+    port_lock = threespace_utils._try_port_locks["/dev/ttyHUNG"]
+    assert port_lock.acquire(True, 1.0)
+    port_lock.release()
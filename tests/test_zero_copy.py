@@ -0,0 +1,51 @@
+import threading
+
+import threespace_api as ts_api
+
+
+def _collect(sensor, count, **kwargs):
+    received = []
+    done = threading.Event()
+
+    def callback(sample):
+        received.append(sample)
+        if len(received) >= count:
+            done.set()
+
+    sensor.setNewDataCallBack(callback, **kwargs)
+    sensor.startStreaming()
+    assert done.wait(2.0)
+    sensor.stopStreaming()
+    sensor.setNewDataCallBack(None)
+    return received
+
+
+def test_unthreaded_callback_borrows_the_stream_sample(sensor):
+    assert sensor.setReadMode(ts_api.TSS_READ_ZERO_COPY)
+    received = _collect(sensor, 5, threaded=False)
+    assert all(sample is sensor.borrowLatestStreamSample() for sample in received)
+    assert isinstance(received[0], ts_api.TSStreamSample)
+
+
+def test_queued_consumers_share_one_copy(sensor):
+    assert sensor.setReadMode(ts_api.TSS_READ_ZERO_COPY)
+    with sensor.iterStream(timeout=2.0) as stream:
+        received = _collect(sensor, 5)
+        queued = [next(stream) for i in range(5)]
+    assert all(type(sample) is tuple for sample in received)
+    assert len(set(id(sample) for sample in received)) == len(received)
+    # The iterator and the callback worker are handed the same tuple
+    assert queued[0] is received[0]
+    timestamp, quaternion = queued[0]
+    assert len(quaternion) == 4
+
+
+def test_latest_stream_data_is_a_copy(sensor):
+    assert sensor.setReadMode(ts_api.TSS_READ_ZERO_COPY)
+    sensor.startStreaming()
+    try:
+        data = sensor.getLatestStreamData(1.0)
+    finally:
+        sensor.stopStreaming()
+    assert type(data) is tuple
+    assert len(data[1]) == 4
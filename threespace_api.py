@@ -17,19 +17,34 @@ __authors__ = [
 
 import threading
 import sys
-import serial
 import struct
 import collections
-import traceback
 import time
 import os
+import select
+import atexit
+import math
+import warnings
 
 # chose an implementation, depending on os
-# if os.name == 'nt':  # sys.platform == 'win32':
-#     from win32_threespace_utils import *
-# else:
-from threespace_utils import *
-# print("WARNING: No additional utils are loaded!!!!!!")
+if os.name == 'nt':  # sys.platform == 'win32':
+    from win32_threespace_utils import *
+elif sys.platform.startswith('linux'):
+    from linux_threespace_utils import *
+else:
+    from threespace_utils import *
+    # print("WARNING: No additional utils are loaded!!!!!!")
+from threespace_utils import _LazyModule, _usb_cdc_device_types
+from threespace_recorder import TSStreamRecorder, TSS_RECORD_OVERWRITE, TSS_RECORD_BLOCK
+from threespace_recorder import streamPacketDtype, streamPacketRun, _requireNumpy
+from threespace_trace import TSTracer
+
+serial = _LazyModule('serial')
+traceback = _LazyModule('traceback')
+json = _LazyModule('json')
+random = _LazyModule('random')
+futures = _LazyModule('concurrent.futures')
+selectors = _LazyModule('selectors')
 
 ### Globals ###
 global_file_path = os.getcwd()
@@ -43,16 +58,96 @@ TSS_TIMESTAMP_SENSOR = 0
 TSS_TIMESTAMP_SYSTEM = 1
 TSS_TIMESTAMP_NONE = 2
 
+TSS_READ_HEADER = 0
+TSS_READ_FRAMED = 1
+TSS_READ_ZERO_COPY = 2
+
 TSS_JOYSTICK = 0
 TSS_MOUSE = 2
 
 TSS_BUTTON_LEFT = 0
 TSS_BUTTON_RIGHT = 1
 
+TSS_OVERFLOW_DROP_OLDEST = 0
+TSS_OVERFLOW_DROP_NEWEST = 1
+TSS_OVERFLOW_BLOCK = 2
+
+TSS_PLAN_IGNORE = 0
+TSS_PLAN_WARN = 1
+TSS_PLAN_ADJUST = 2
+TSS_PLAN_RAISE = 3
+
 ### Private ###
 _baudrate = 115200
 _allowed_baudrates = [1200, 2400, 4800, 9600, 19200, 28800, 38400, 57600, 115200, 230400, 460800, 921600]
 _wireless_retries = 5
+_frame_read_size = 4096
+_frame_buffer_size = 16384
+_max_commands_in_flight = 8
+_late_response_grace = 0.25
+_initial_command_timeout = 0.5
+_min_command_timeout = 0.05
+_max_command_timeout = 5.0
+_queued_command_timeout = 0.150
+_max_retry_delay = 1.0
+_latency_bucket_count = 24
+_debug_print = "-d" in sys.argv or bool(os.environ.get('TSS_DEBUG'))
+_debug_hex = "-d_hex" in sys.argv or bool(os.environ.get('TSS_DEBUG_HEX'))
+_tracer = None
+_stream_queue_size = 1024
+_probe_deadline = 5.0
+_max_probe_workers = 16
+_device_cache_path = None
+_device_cache = None
+_device_cache_lock = threading.Lock()
+_hotplug_settle_time = 0.25
+_hotplug_poll_interval = 1.0
+_hotplug_attach_retries = 3
+_max_broadcast_workers = 32
+_broadcast_executor = None
+_broadcast_executor_lock = threading.Lock()
+_use_reader_hub = bool(os.environ.get('TSS_READER_HUB'))
+_reader_hub = None
+_reader_hub_lock = threading.Lock()
+_reader_hub_interval = 0.01
+_stream_plan_policy = TSS_PLAN_WARN
+_plan_unpaced_streams = False
+_stream_link_utilization = 0.9
+_serial_frame_bits = 10
+_max_stream_hz = 1000.0
+_baud_check_rounds = 4
+_baud_settle_time = 0.02
+_default_device_cache_path = os.path.join(os.path.expanduser('~'), '.threespace_device_cache.json')
+
+_command_descriptors = {}
+
+### Structures ###
+CommandDescriptor = collections.namedtuple(
+    'CommandDescriptor', (
+        'cmd_byte',
+        'out_len',
+        'out_struct',
+        'in_len',
+        'in_struct',
+        'compatibility',
+        'out_parse',
+        'in_parse',
+        'out_single',
+        'frames'
+    )
+)
+
+TSStreamPlan = collections.namedtuple(
+    'TSStreamPlan', (
+        'packet_size',
+        'requested_hz',
+        'max_hz',
+        'min_interval',
+        'baudrate',
+        'suggested_baudrate',
+        'fits'
+    )
+)
 
 ### Functions ###
 if sys.version_info >= (3, 0):
@@ -81,8 +176,86 @@ else:
         return rtn_array
 
 
+def getCommandDescriptor(command_args):
+    """ Returns the compiled form of a command_dict entry, with its struct
+        formats as ready struct.Struct objects and, for commands that take no
+        arguments, prebuilt request frames. Descriptors are compiled once and
+        cached by entry, so an entry that gets replaced is recompiled.
+    """
+    descriptor = _command_descriptors.get(command_args)
+    if descriptor is None:
+        cmd_byte, out_len, out_struct, in_len, in_struct, compatibility = command_args
+        out_parse = None
+        in_parse = None
+        out_single = False
+        frames = {}
+        if out_struct:
+            out_parse = struct.Struct(out_struct)
+            out_single = len(out_parse.unpack(bytes(out_parse.size))) == 1
+        if in_struct:
+            in_parse = struct.Struct(in_struct)
+        else:
+            for startbyte in (0xf7, 0xf9):
+                frames[(startbyte, None)] = bytes(bytearray((startbyte, cmd_byte, cmd_byte)))
+        descriptor = CommandDescriptor(cmd_byte, out_len, out_struct, in_len, in_struct, compatibility,
+                                       out_parse, in_parse, out_single, frames)
+        _command_descriptors[command_args] = descriptor
+    return descriptor
+
+
+def compileCommandDict(command_dict):
+    """ Compiles every entry of a command_dict ahead of the first call. """
+    for command_args in command_dict.values():
+        getCommandDescriptor(command_args)
+
+
+def _makeCommandWriteArray(descriptor, startbyte, index_byte=None, input_list=None):
+    tracer = _tracer
+    if tracer is not None:
+        start_time = tracer.now()
+    in_parse = descriptor.in_parse
+    if in_parse is None:
+        frame_key = (startbyte, index_byte)
+        write_array = descriptor.frames.get(frame_key)
+        if write_array is None:
+            write_array = bytes(makeWriteArray(startbyte, index_byte, descriptor.cmd_byte))
+            descriptor.frames[frame_key] = write_array
+        elif _debug_hex:
+            _hexDump(write_array)
+    else:
+        if type(input_list) in (list, tuple):
+            packed_data = in_parse.pack(*input_list)
+        else:
+            packed_data = in_parse.pack(input_list)
+        write_array = makeWriteArray(startbyte, index_byte, descriptor.cmd_byte, packed_data)
+    if tracer is not None:
+        tracer.span("makeWriteArray", start_time, args={'cmd': descriptor.cmd_byte})
+    return write_array
+
+
+def _unpackCommandOutput(descriptor, output_data):
+    rtn_list = descriptor.out_parse.unpack(output_data)
+    if descriptor.out_single:
+        return rtn_list[0]
+    return rtn_list
+
+
+def _commandResult(descriptor, header_list, output_data):
+    fail_byte = header_list[0]
+    rtn_list = None
+    if not fail_byte and descriptor.out_parse:
+        rtn_list = _unpackCommandOutput(descriptor, output_data)
+    return (fail_byte, header_list[1], rtn_list)
+
+
+def _completedCommand(result=(True, None, None)):
+    future = futures.Future()
+    future.set_result(result)
+    return future
+
+
 def _hexDump(serial_string, header='i'):
-    if "-d_hex" in sys.argv:
+    if _debug_hex:
         ba = bytearray(serial_string)
         print('{0}('.format(header), end='')
         for i in range(len(ba)):
@@ -94,10 +267,57 @@ def _hexDump(serial_string, header='i'):
 
 
 def _print(string):
-    if "-d" in sys.argv:
+    if _debug_print:
         print(string)
 
 
+def setDebugOutput(print_messages=None, hex_dump=None):
+    """ Turns the debug messages and the hex dumps of written commands on or
+        off, None leaves a setting as it is. They start on when the script
+        was run with -d or -d_hex, or the TSS_DEBUG or TSS_DEBUG_HEX
+        environment variable is set.
+    """
+    global _debug_print, _debug_hex
+    if print_messages is not None:
+        _debug_print = bool(print_messages)
+    if hex_dump is not None:
+        _debug_hex = bool(hex_dump)
+
+
+def startTrace(path=None, max_events=1000000):
+    """ Starts recording Chrome trace events of the command and stream paths
+        and returns the TSTracer collecting them. Spans cover building
+        commands (makeWriteArray), waiting for a free pipeline slot, serial
+        writes, waiting for responses, unpacking responses, stream dispatch
+        and user callbacks. Setting the TSS_TRACE environment variable to a
+        file path starts a trace on import that is saved at exit.
+
+        Args:
+            path: The file stopTrace() writes the trace to (default is None,
+                keep it in memory)
+            max_events: The number of events kept (default is 1000000)
+    """
+    global _tracer
+    _tracer = TSTracer(path, max_events)
+    return _tracer
+
+
+def stopTrace(path=None):
+    """ Stops tracing and returns the TSTracer, after saving it to path or
+        to the path given to startTrace() if there is one.
+    """
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    if tracer is not None and (path is not None or tracer.path is not None):
+        tracer.save(path)
+    return tracer
+
+
+def getTracer():
+    return _tracer
+
+
 def _echoCallback(sensor, state):
     _print('{0}:{1}'.format(sensor, state))
 
@@ -143,41 +363,143 @@ def _generateProtocolHeader(success_failure=False,
     return (byte, struct.Struct(struct_str), idx_list)
 
 
+def _protocolHeaderFromBitfield(bitfield):
+    return _generateProtocolHeader(*[bool(bitfield & (1 << i)) for i in range(7)])
+
+
+def _loadDeviceCache():
+    # Call with _device_cache_lock held
+    global _device_cache
+    if _device_cache is None:
+        try:
+            with open(_device_cache_path) as cache_file:
+                _device_cache = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            _device_cache = {}
+    return _device_cache
+
+
+def _storeDeviceCacheEntry(port_name, entry):
+    if _device_cache_path is None:
+        return
+    serial_key = '{0:08X}'.format(entry['serial_number'])
+    with _device_cache_lock:
+        port_entries = _loadDeviceCache().setdefault(port_name, {})
+        if port_entries.get(serial_key) == entry:
+            return
+        port_entries[serial_key] = entry
+        tmp_path = _device_cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(_device_cache, cache_file, indent=1, sort_keys=True)
+            os.replace(tmp_path, _device_cache_path)
+        except (IOError, OSError):
+            _print("Could not write the device cache {0}".format(_device_cache_path))
+
+
+def _readCachedSerialNumber(serial_port, header_bitfield):
+    # Sends a wired getSerialNumber and parses the response with the given
+    # response header, raises if the response does not fit it
+    protocol_byte, header_parse, idx_lst = _protocolHeaderFromBitfield(header_bitfield)
+    serial_port.write(bytearray((0xf9, 0xed, 0xed)))
+    response = serial_port.read(header_parse.size + 4)
+    if len(response) != header_parse.size + 4:
+        raise Exception("Short response")
+    header_list = padProtocolHeader(header_parse.unpack_from(response), idx_lst)
+    fail_byte, timestamp, cmd_echo, ck_sum, rtn_log_id, sn, data_size = header_list
+    if fail_byte or cmd_echo not in (None, 0xed) or data_size not in (None, 4):
+        raise Exception("Unexpected header")
+    return struct.unpack_from('>I', response, header_parse.size)[0]
+
+
+def _verifyCachedDevice(serial_port, allowed_device_types):
+    # Checks with a single round trip that the device on the port is one
+    # cached for it: a wired getSerialNumber must come back with a cached
+    # response header and the serial number of the entry cached under it.
+    # Entries are kept per port and serial number, so sensors swapped on a
+    # port each keep theirs and a serial number without one is re-probed
+    if _device_cache_path is None:
+        return None
+    with _device_cache_lock:
+        port_entries = dict(_loadDeviceCache().get(serial_port.name, {}))
+    for serial_key in list(port_entries):
+        if port_entries[serial_key].get('device_type') not in allowed_device_types:
+            del port_entries[serial_key]
+    if not port_entries:
+        return None
+    timeout = serial_port.timeout
+    serial_port.timeout = 0.1
+    entry = None
+    for header_bitfield in sorted(set(entry['header_bitfield'] for entry in port_entries.values())):
+        try:
+            serial_number = _readCachedSerialNumber(serial_port, header_bitfield)
+        except:
+            time.sleep(0.05)
+            serial_port.reset_input_buffer()
+            continue
+        entry = port_entries.get('{0:08X}'.format(serial_number))
+        if entry is not None and entry['header_bitfield'] != header_bitfield:
+            entry = None
+        break
+    if entry is None:
+        _print("Device cache miss on {0}".format(serial_port.name))
+    serial_port.timeout = timeout
+    return entry
+
+
+def _applyCachedDevice(sensor_inst, cache_entry):
+    if cache_entry is None:
+        sensor_inst.verified_header_bitfield = None
+        sensor_inst.cached_stream_slots = None
+    else:
+        sensor_inst.verified_header_bitfield = cache_entry['header_bitfield']
+        sensor_inst.cached_stream_slots = cache_entry.get('stream_slot_cmds')
+
+
 def _generateSensorClass(sensor_inst, serial_port, allowed_device_types):
-    sensor_inst.compatibility = checkSoftwareVersionFromPort(serial_port)
+    cache_entry = _verifyCachedDevice(serial_port, allowed_device_types)
     sensor_inst.port_name = serial_port.name
     sensor_inst.serial_port_settings = serial_port.getSettingsDict()
     sensor_inst.serial_port = serial_port
 
-    hardware_version = convertString(sensor_inst.f7WriteRead('getHardwareVersionString'))
-    dev_type = hardware_version[4:-8].strip()
-    if dev_type not in allowed_device_types:
-        raise Exception("This is a %s device, not one of these devices %s!" % (dev_type, allowed_device_types))
+    if cache_entry is not None:
+        # The device answered as the cached one, skip the version probes
+        sensor_inst.compatibility = cache_entry['compatibility']
+        dev_type = cache_entry['device_type']
+        serial_number = cache_entry['serial_number']
+    else:
+        sensor_inst.compatibility = checkSoftwareVersionFromPort(serial_port)
+        hardware_version = convertString(sensor_inst.f7WriteRead('getHardwareVersionString'))
+        dev_type = hardware_version[4:-8].strip()
+        if dev_type not in allowed_device_types:
+            raise Exception("This is a %s device, not one of these devices %s!" % (dev_type, allowed_device_types))
+        serial_number = sensor_inst.f7WriteRead('getSerialNumber')
 
     sensor_inst.device_type = dev_type
-
-    serial_number = sensor_inst.f7WriteRead('getSerialNumber')
     sensor_inst.serial_number = serial_number
+    _applyCachedDevice(sensor_inst, cache_entry)
 
     if dev_type == "DNG":
         if serial_number in global_donglist:
             rtn_inst = global_donglist[serial_number]
-            rtn_inst.close()
+            rtn_inst._closePort()
             rtn_inst.compatibility = sensor_inst.compatibility
             rtn_inst.port_name = serial_port.name
             rtn_inst.serial_port_settings = serial_port.getSettingsDict()
             rtn_inst.serial_port = serial_port
+            _applyCachedDevice(rtn_inst, cache_entry)
             return rtn_inst
 
         global_donglist[serial_number] = sensor_inst
     else:
         if serial_number in global_sensorlist:
             rtn_inst = global_sensorlist[serial_number]
-            rtn_inst.close()
+            rtn_inst._closePort()
             rtn_inst.compatibility = sensor_inst.compatibility
             rtn_inst.port_name = serial_port.name
             rtn_inst.serial_port_settings = serial_port.getSettingsDict()
             rtn_inst.serial_port = serial_port
+            _applyCachedDevice(rtn_inst, cache_entry)
             if "BT" in dev_type:
                 rtn_inst.serial_port.timeout = 1.5
                 rtn_inst.serial_port.writeTimeout = 1.5
@@ -256,6 +578,156 @@ def setSystemWirelessRetries(retries):
     _wireless_retries = retries
 
 
+def setDeviceCachePath(path=_default_device_cache_path):
+    """ Enables the on-disk device metadata cache, or disables it with None.
+        The cache remembers, per port and serial number, the device type,
+        firmware compatibility, response header and streaming slots of the
+        sensors seen there. Creating a sensor on a cached port then only
+        checks the serial number and response header with one round trip
+        instead of running the full set of setup probes, a serial number with
+        no entry for the port gets the full probes.
+    """
+    global _device_cache_path, _device_cache
+    with _device_cache_lock:
+        _device_cache_path = path
+        _device_cache = None
+
+
+def getDeviceCachePath():
+    return _device_cache_path
+
+
+def clearDeviceCache():
+    global _device_cache
+    with _device_cache_lock:
+        _device_cache = None
+        if _device_cache_path is not None and os.path.exists(_device_cache_path):
+            os.remove(_device_cache_path)
+
+
+def getStreamPlanPolicy():
+    return _stream_plan_policy
+
+
+def setStreamPlanPolicy(policy, plan_unpaced=False):
+    """ Sets what startStreaming does when the requested stream does not fit
+        the link: TSS_PLAN_WARN issues a RuntimeWarning, TSS_PLAN_ADJUST
+        lengthens the streaming interval to the shortest one that fits,
+        TSS_PLAN_RAISE raises an Exception and TSS_PLAN_IGNORE skips the
+        check. Streams over USB CDC ports are never checked, their baud rate
+        does not limit the link.
+
+        Args:
+            policy: One of the TSS_PLAN_* values
+            plan_unpaced: Also check streams with an interval of 0, planned
+                at the sensor's filter rate. These run as fast as the link
+                lets them, so they are not checked by default (default is
+                False)
+    """
+    global _stream_plan_policy, _plan_unpaced_streams
+    if policy not in (TSS_PLAN_IGNORE, TSS_PLAN_WARN, TSS_PLAN_ADJUST, TSS_PLAN_RAISE):
+        raise ValueError("Unknown stream plan policy %r" % policy)
+    _stream_plan_policy = policy
+    _plan_unpaced_streams = bool(plan_unpaced)
+
+
+def isUSBCDCPort(port_name):
+    """ Returns True if port_name belongs to a 3-Space device that is a USB
+        CDC device itself. Data on these ports moves at USB speed whatever
+        baud rate is set, while the Nano's FTDI bridge, Bluetooth and UART
+        links are limited by it. The device type comes from the port's USB
+        IDs, nothing is written to the port.
+    """
+    try:
+        dev_type = getDeviceInfoFromComPort(port_name, poll_device=False).dev_type
+    except:
+        return False
+    return dev_type in _usb_cdc_device_types
+
+
+def _linkBytesPerSecond(baudrate):
+    # 8N1 framing spends 10 bits on the wire per byte, and some room is left
+    # for command responses sharing the link
+    return baudrate * _stream_link_utilization / _serial_frame_bits
+
+
+def streamPayloadSize(command_dict, slot_cmds):
+    """ Returns the number of data bytes one stream packet carries for the
+        given streaming slot command names.
+    """
+    size = 0
+    for slot_cmd in slot_cmds:
+        if slot_cmd != 'null':
+            size += struct.calcsize(command_dict[slot_cmd][2])
+    return size
+
+
+def planStreamingLink(streams, baudrate, max_stream_hz=None):
+    """ Works out how fast each stream sharing one serial link can run.
+
+        Args:
+            streams: A list of (packet_size, interval) tuples, one for every
+                sensor streaming over the link. packet_size includes the
+                response header, interval is in microseconds and 0 streams as
+                fast as the sensor can
+            baudrate: The baud rate of the link
+            max_stream_hz: The rate a stream with an interval of 0 is planned
+                at, the sensor's filter rate (default is 1000 Hz)
+
+        Returns:
+            A list of TSStreamPlan, one per stream. max_hz is the rate the
+                stream can reach with the other streams unchanged,
+                min_interval the shortest interval that fits (None if nothing
+                is left) and suggested_baudrate the lowest allowed baud rate
+                carrying every stream (None if even the fastest one does not).
+    """
+    if max_stream_hz is None:
+        max_stream_hz = _max_stream_hz
+    capacity = _linkBytesPerSecond(baudrate)
+    rates = []
+    load = 0.0
+    for packet_size, interval in streams:
+        requested_hz = 1000000.0 / interval if interval else float(max_stream_hz)
+        rates.append(requested_hz)
+        load += packet_size * requested_hz
+    suggested_baudrate = None
+    for rate in _allowed_baudrates:
+        if _linkBytesPerSecond(rate) >= load:
+            suggested_baudrate = rate
+            break
+    plans = []
+    for (packet_size, interval), requested_hz in zip(streams, rates):
+        available = capacity - (load - packet_size * requested_hz)
+        max_hz = max(available, 0.0) / packet_size
+        min_interval = None
+        if max_hz > 0:
+            min_interval = int(math.ceil(1000000.0 / max_hz))
+        plans.append(TSStreamPlan(packet_size, requested_hz, max_hz, min_interval, baudrate,
+                                  suggested_baudrate, requested_hz <= max_hz))
+    return plans
+
+
+def useReaderHub(enabled=True):
+    """ Makes sensors opened from now on (and reopened by reconnect) read
+        their ports on the shared TSReaderHub thread instead of a thread of
+        their own. Ports without a file descriptor, and dongles, keep their
+        own reader thread. Setting the TSS_READER_HUB environment variable
+        turns this on from the start.
+    """
+    global _use_reader_hub
+    _use_reader_hub = bool(enabled)
+
+
+def getReaderHub():
+    """ Returns the shared TSReaderHub, starting it on first use. """
+    global _reader_hub
+    if _reader_hub is None:
+        with _reader_hub_lock:
+            if _reader_hub is None:
+                _reader_hub = TSReaderHub()
+    return _reader_hub
+
+
 def getDefaultCreateDeviceBaudRate():
     return _baudrate
 
@@ -266,6 +738,89 @@ def setDefaultCreateDeviceBaudRate(new_baudrate):
         _baudrate = new_baudrate
 
 
+def _probePort(port_name, poll_device):
+    try:
+        return getDeviceInfoFromComPort(port_name, poll_device)
+    except:
+        _print("Probe of {0} failed".format(port_name))
+        return None
+
+
+def _probeWorker(pending, results, results_ready, poll_device):
+    while True:
+        try:
+            port_name = pending.popleft()
+        except IndexError:
+            return
+        sensor_info = _probePort(port_name, poll_device)
+        with results_ready:
+            results.append((port_name, sensor_info))
+            results_ready.notify()
+
+
+def probeAll(ports=None, max_workers=None, deadline=_probe_deadline, poll_device=True, filter=TSS_FIND_ALL_KNOWN):
+    """ Probes serial ports concurrently with getDeviceInfoFromComPort and
+        yields a (port_name, SensorInfo) tuple for each one as soon as its
+        probe finishes. Ports whose probe fails are skipped.
+
+        Args:
+            ports: The port names or ComInfo tuples to probe (default is
+                every port getComPorts finds with filter)
+            max_workers: The number of ports probed at once (default is one
+                thread per port, up to 16)
+            deadline: Seconds after which probes still running are abandoned,
+                counted from the start of iteration, or None to wait for all
+                (default is 5.0)
+            poll_device: Passed on to getDeviceInfoFromComPort (default is
+                True)
+            filter: The TSS_FIND_* flags used when ports is not given
+                (default is TSS_FIND_ALL_KNOWN)
+    """
+    if ports is None:
+        ports = getComPorts(filter)
+    port_names = []
+    for port in ports:
+        if type(port) is ComInfo:
+            port = port.com_port
+        port_names.append(port)
+    if not port_names:
+        return
+    if max_workers is None:
+        max_workers = min(len(port_names), _max_probe_workers)
+    end_time = None
+    if deadline is not None:
+        end_time = time.perf_counter() + deadline
+    # Daemon threads, unlike an executor's, do not hold up interpreter exit
+    # when a probe hangs in the driver
+    pending = collections.deque(port_names)
+    results = collections.deque()
+    results_ready = threading.Condition(threading.Lock())
+    for i in range(max_workers):
+        probe_thread = threading.Thread(target=_probeWorker, args=(pending, results, results_ready, poll_device))
+        probe_thread.daemon = True
+        probe_thread.start()
+    remaining = set(port_names)
+    try:
+        while remaining:
+            with results_ready:
+                while not results:
+                    timeout = None
+                    if end_time is not None:
+                        timeout = end_time - time.perf_counter()
+                        if timeout <= 0:
+                            break
+                    results_ready.wait(timeout)
+                if not results:
+                    _print("Probe deadline passed, skipping {0}".format(sorted(remaining)))
+                    return
+                port_name, sensor_info = results.popleft()
+            remaining.discard(port_name)
+            if sensor_info is not None:
+                yield (port_name, sensor_info)
+    finally:
+        pending.clear()
+
+
 def padProtocolHeader69(header_data, sys_timestamp):
     fail_byte, cmd_echo, data_size = header_data
     return (fail_byte, sys_timestamp, cmd_echo, None, None, None, data_size)
@@ -286,7 +841,964 @@ def padProtocolHeader87(header_data):
     return (fail_byte, timestamp, cmd_echo, None, rtn_log_id, None, data_size)
 
 
+def padProtocolHeader(header_data, idx_list, sys_timestamp=None):
+    header_list = [None] * 7
+    for i in range(len(idx_list)):
+        header_list[idx_list[i]] = header_data[i]
+    if 1 not in idx_list:
+        header_list[1] = sys_timestamp
+    return tuple(header_list)
+
+
 ### Classes ###
+class _ReverseCommandDict(object):
+    """ Class attribute that builds the command byte to command name map of
+        its class's command_dict on first use.
+    """
+
+    def __get__(self, instance, owner):
+        reverse_command_dict = dict((args[0], name) for name, args in owner.command_dict.items())
+        setattr(owner, 'reverse_command_dict', reverse_command_dict)
+        return reverse_command_dict
+
+
+class TSStreamSample(object):
+    """ A reusable stream sample that the zero-copy reader decodes into in
+        place. It indexes like the (timestamp, data) tuples of the other read
+        modes, but it is borrowed: its contents change with the next sample,
+        so use copy() to keep one.
+    """
+    __slots__ = ('timestamp', 'values', 'count')
+
+    def __init__(self, value_count=0):
+        self.timestamp = None
+        self.values = [None] * value_count
+        self.count = 0
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, idx):
+        if idx == 0 or idx == -2:
+            return self.timestamp
+        if idx == 1 or idx == -1:
+            if len(self.values) == 1:
+                return self.values[0]
+            return tuple(self.values)
+        raise IndexError("stream sample index out of range")
+
+    def __repr__(self):
+        return "<TSStreamSample {0}: {1}>".format(self.timestamp, self.values)
+
+    def copy(self):
+        return (self.timestamp, self[1])
+
+
+class TSStreamQueue(object):
+    """ A bounded first-in first-out queue that hands stream samples from the
+        serial reader thread to a consumer thread.
+
+        Args:
+            maxsize: The number of samples held before overflow kicks in
+                (default is 1024)
+            overflow: What put() does with a full queue: TSS_OVERFLOW_DROP_OLDEST
+                discards the oldest queued sample, TSS_OVERFLOW_DROP_NEWEST
+                discards the new one and TSS_OVERFLOW_BLOCK waits for room
+                (default is TSS_OVERFLOW_DROP_OLDEST)
+    """
+
+    def __init__(self, maxsize=_stream_queue_size, overflow=TSS_OVERFLOW_DROP_OLDEST):
+        if maxsize < 1:
+            raise ValueError("Queue size must be at least 1 sample")
+        if overflow not in (TSS_OVERFLOW_DROP_OLDEST, TSS_OVERFLOW_DROP_NEWEST, TSS_OVERFLOW_BLOCK):
+            raise ValueError("Unknown queue overflow policy: {0}".format(overflow))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queue = collections.deque()
+        self.lock = threading.Condition(threading.Lock())
+        self.total = 0
+        self.dropped = 0
+        self.closed = False
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, item):
+        """ Queues an item, returns False if it was dropped or the queue was
+            closed.
+        """
+        with self.lock:
+            if self.closed:
+                return False
+            if len(self.queue) >= self.maxsize:
+                if self.overflow == TSS_OVERFLOW_BLOCK:
+                    while len(self.queue) >= self.maxsize:
+                        self.lock.wait()
+                        if self.closed:
+                            return False
+                elif self.overflow == TSS_OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                else:
+                    self.queue.popleft()
+                    self.dropped += 1
+            self.queue.append(item)
+            self.total += 1
+            self.lock.notify_all()
+        return True
+
+    def get(self, block=True, timeout=None):
+        """ Removes and returns the oldest item, or None if there is none
+            within the timeout or the queue was closed.
+        """
+        items = self.getBatch(1, block, timeout)
+        if items:
+            return items[0]
+
+    def getBatch(self, max_count=None, block=True, timeout=None):
+        """ Removes and returns up to max_count of the oldest items as a list,
+            waiting for at least one if block is set. The list is empty if
+            nothing came within the timeout or the queue was closed.
+        """
+        with self.lock:
+            if block and not self.queue and not self.closed:
+                if timeout is None:
+                    while not self.queue and not self.closed:
+                        self.lock.wait()
+                else:
+                    end_time = time.perf_counter() + timeout
+                    while not self.queue and not self.closed:
+                        remaining = end_time - time.perf_counter()
+                        if remaining <= 0:
+                            break
+                        self.lock.wait(remaining)
+            queue = self.queue
+            count = len(queue)
+            if max_count is not None:
+                count = min(count, max_count)
+            items = [queue.popleft() for i in range(count)]
+            if items and self.overflow == TSS_OVERFLOW_BLOCK:
+                self.lock.notify_all()
+        return items
+
+    def close(self):
+        """ Wakes every waiting thread, queued items can still be drained. """
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+
+
+class TSStreamIterator(object):
+    """ Iterates over every stream sample of a sensor in arrival order, see
+        _TSSensor.iterStream. Closing it, or leaving its with block, stops the
+        sensor from queueing samples for it.
+    """
+
+    def __init__(self, sensor, stream_queue, block=True, timeout=None, batch=None):
+        self.sensor = sensor
+        self.stream_queue = stream_queue
+        self.block = block
+        self.timeout = timeout
+        self.batch = batch
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.batch:
+            items = self.stream_queue.getBatch(self.batch, self.block, self.timeout)
+            if items:
+                return items
+        else:
+            items = self.stream_queue.getBatch(1, self.block, self.timeout)
+            if items:
+                return items[0]
+        self.close()
+        raise StopIteration
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def dropped(self):
+        return self.stream_queue.dropped
+
+    @property
+    def total(self):
+        return self.stream_queue.total
+
+    def close(self):
+        self.sensor._removeStreamQueue(self.stream_queue)
+        self.stream_queue.close()
+
+
+class TSCallbackWorker(object):
+    """ Runs a stream callback on its own thread, fed through a bounded
+        TSStreamQueue, so a slow callback does not hold up the serial reader
+        thread. Items queued when the worker is closed are still delivered.
+
+        Args:
+            callback: The function called with every queued item
+            maxsize: The number of items held for the callback (default is
+                1024)
+            overflow: One of the TSS_OVERFLOW_* policies for a full queue
+                (default is TSS_OVERFLOW_DROP_OLDEST)
+    """
+
+    def __init__(self, callback, maxsize=_stream_queue_size, overflow=TSS_OVERFLOW_DROP_OLDEST):
+        self.callback = callback
+        self.stream_queue = TSStreamQueue(maxsize, overflow)
+        self.put = self.stream_queue.put
+        self.thread = threading.Thread(target=self._callbackLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def dropped(self):
+        return self.stream_queue.dropped
+
+    def _callbackLoop(self):
+        stream_queue = self.stream_queue
+        callback = self.callback
+        while True:
+            items = stream_queue.getBatch()
+            if not items:
+                break
+            for item in items:
+                tracer = _tracer
+                if tracer is not None:
+                    start_time = tracer.now()
+                try:
+                    callback(item)
+                except:
+                    traceback.print_exc()
+                if tracer is not None:
+                    tracer.span("callback", start_time, "callback")
+
+    def close(self, wait=False):
+        self.stream_queue.close()
+        if wait and threading.current_thread() is not self.thread:
+            self.thread.join()
+
+
+class TSStreamingSession(object):
+    """ Configures a sensor for streaming once and streams until the session
+        is left. Entering the session sends every setting back to back, reads
+        the slots, timing, filter mode and calibration mode back in one batch
+        and raises an Exception if the sensor did not take them, then starts
+        streaming. Leaving it always stops streaming and, unless close_on_exit
+        is off, closes the sensor.
+
+        Args:
+            sensor: The sensor to stream from
+            slots: A list of up to 8 command names to stream
+            interval: The streaming interval in microseconds (default is 0,
+                as fast as the sensor's filter runs)
+            duration: The streaming duration in microseconds (default is
+                0xFFFFFFFF, stream until stopped)
+            delay: The delay before the first sample in microseconds (default
+                is 0)
+            filter_mode: An optional filter mode to set
+            calibration_mode: An optional calibration mode to set
+            compass_enabled: An optional boolean to enable or disable the
+                compass
+            gyro_autocalibrate: Begin gyroscope auto calibration before
+                streaming (default is False)
+            record_data: Start recording into the sensor's stream_data
+                (default is False)
+            close_on_exit: Close the sensor when the session is left (default
+                is True)
+    """
+
+    def __init__(self, sensor, slots, interval=0, duration=0xFFFFFFFF, delay=0,
+                 filter_mode=None, calibration_mode=None, compass_enabled=None,
+                 gyro_autocalibrate=False, record_data=False, close_on_exit=True):
+        if not 0 < len(slots) <= 8:
+            raise ValueError("A streaming session needs 1 to 8 slots, got %d" % len(slots))
+        self.sensor = sensor
+        self.slots = list(slots) + ['null'] * (8 - len(slots))
+        self.timing = (interval, duration, delay)
+        self.filter_mode = filter_mode
+        self.calibration_mode = calibration_mode
+        self.compass_enabled = compass_enabled
+        self.gyro_autocalibrate = gyro_autocalibrate
+        self.record_data = record_data
+        self.close_on_exit = close_on_exit
+        self.streaming = False
+
+    def __enter__(self):
+        try:
+            self.start()
+        except:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _writeReadAll(self, commands):
+        # Wired sensors keep every command in flight at once, wireless ones go
+        # through their own writeRead one at a time
+        sensor = self.sensor
+        if sensor.writeRead != sensor.f9WriteRead:
+            return [sensor.writeRead(command, input_list) for command, input_list in commands]
+        pending = [sensor.f9WriteReadFuture(command, input_list) for command, input_list in commands]
+        return [sensor.command_pipeline.wait(future) for future in pending]
+
+    def start(self):
+        """ Applies the settings, verifies them and starts streaming. """
+        sensor = self.sensor
+        slot_bytes = [sensor.command_dict[slot][0] for slot in self.slots]
+        commands = []
+        if self.compass_enabled is not None:
+            commands.append(('setCompassEnabled', int(self.compass_enabled)))
+        if self.calibration_mode is not None:
+            commands.append(('setCalibrationMode', self.calibration_mode))
+        if self.gyro_autocalibrate:
+            commands.append(('beginGyroscopeAutoCalibration', None))
+        if self.filter_mode is not None:
+            commands.append(('setFilterMode', self.filter_mode))
+        commands.append(('_setStreamingTiming', self.timing))
+        commands.append(('_setStreamingSlots', slot_bytes))
+        for (command, input_list), packet in zip(commands, self._writeReadAll(commands)):
+            if packet[0]:
+                raise Exception("%s failed on %s" % (command, sensor))
+        sensor.stream_timing = self.timing
+        sensor.stream_slot_cmds = list(self.slots)
+        sensor._generateStreamParse()
+        sensor._storeDeviceCache()
+
+        expected = [('_getStreamingSlots', tuple(slot_bytes)), ('_getStreamingTiming', self.timing)]
+        if self.filter_mode is not None:
+            expected.append(('getFilterMode', self.filter_mode))
+        if self.calibration_mode is not None:
+            expected.append(('getCalibrationMode', self.calibration_mode))
+        packets = self._writeReadAll([(command, None) for command, value in expected])
+        for (command, value), (fail_byte, timestamp, data) in zip(expected, packets):
+            if isinstance(data, (list, tuple)):
+                data = tuple(data)
+            if fail_byte or data != value:
+                raise Exception("%s read back %r from %s, expected %r" % (command, data, sensor, value))
+
+        if not sensor.startStreaming(start_record=self.record_data):
+            raise Exception("startStreaming failed on %s" % sensor)
+        self.streaming = True
+
+    def stop(self):
+        """ Stops streaming and closes the sensor if close_on_exit is set. """
+        sensor = self.sensor
+        self.streaming = False
+        try:
+            sensor.stopStreaming()
+        finally:
+            if self.close_on_exit:
+                sensor.close()
+
+
+class TSRoundTripEstimator(object):
+    """ Derives command timeouts and retry delays from measured round-trip
+        times, the way TCP computes its retransmission timeout (RFC 6298).
+
+        Every response updates a smoothed round-trip time and its mean
+        deviation, and the timeout is the smoothed time plus four
+        deviations, kept between min_timeout and max_timeout. A timed out
+        command doubles the timeout until the next response is measured, and
+        responses that arrive after their command timed out are not measured.
+
+        Args:
+            initial_timeout: The timeout used before the first response
+                (default is 0.5)
+            min_timeout: The smallest timeout used (default is 0.05)
+            max_timeout: The largest timeout used (default is 5.0)
+    """
+
+    def __init__(self, initial_timeout=_initial_command_timeout, min_timeout=_min_command_timeout,
+                 max_timeout=_max_command_timeout):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_timeout
+        self.sample_count = 0
+
+    def __repr__(self):
+        if self.srtt is None:
+            return "<TSRoundTripEstimator timeout={0:.3f}s>".format(self.rto)
+        return "<TSRoundTripEstimator srtt={0:.2f}ms rttvar={1:.2f}ms timeout={2:.3f}s>".format(
+            self.srtt * 1000, self.rttvar * 1000, self.rto)
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.min_timeout), self.max_timeout)
+        self.sample_count += 1
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, self.max_timeout)
+
+    def timeout(self, in_flight=0):
+        """ Returns the timeout of a command sent behind in_flight others,
+            each of which is expected to take one smoothed round trip.
+        """
+        if self.srtt is None:
+            return self.rto + in_flight * _queued_command_timeout
+        return self.rto + in_flight * self.srtt
+
+    def retryDelay(self, attempt):
+        """ Returns how long to wait before retry number attempt (from 0).
+            The delay starts at half the timeout and doubles with each
+            attempt up to one second; a random half of it is jitter so
+            retries from many callers do not line up.
+        """
+        delay = min(self.rto * 2 ** attempt / 2, _max_retry_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TSLatencyHistogram(object):
+    """ A histogram of command latencies in power-of-two microsecond
+        buckets, cheap enough to update on every response. Bucket i counts
+        the latencies from 2**(i - 1) up to 2**i microseconds, and the last
+        bucket everything slower.
+    """
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * _latency_bucket_count
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency):
+        idx = int(latency * 1000000).bit_length()
+        if idx >= _latency_bucket_count:
+            idx = _latency_bucket_count - 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+
+    def percentile(self, fraction):
+        """ Returns the upper bound in seconds of the bucket that holds the
+            given fraction (0.0 to 1.0) of the latencies, or None if empty.
+        """
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for idx in range(_latency_bucket_count):
+            seen += self.counts[idx]
+            if seen >= target and seen:
+                return min((1 << idx) / 1000000.0, self.max)
+        return self.max
+
+    def summary(self):
+        """ Returns the count, mean, p50, p90, p99 and max latencies in
+            milliseconds and the non-empty buckets keyed by their upper bound
+            in milliseconds.
+        """
+        if not self.count:
+            return {'count': 0}
+        buckets = {}
+        for idx in range(_latency_bucket_count):
+            if self.counts[idx]:
+                buckets[(1 << idx) / 1000.0] = self.counts[idx]
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p90_ms': self.percentile(0.9) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.max * 1000,
+            'buckets': buckets
+        }
+
+
+class TSDeviceStats(object):
+    """ Live counters of one device. They are plain integers bumped by the
+        reader thread and the command callers, so keeping them costs a few
+        attribute increments per packet; read them through the device's
+        stats() method.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.bytes_read = 0
+        self.response_count = 0
+        self.stream_samples = 0
+        self.retries = 0
+        self.reader_errors = 0
+        self.last_reader_error = None
+        self.resyncs = 0
+        self.resync_bytes = 0
+        self.last_stats = (self.start_time, 0, 0, 0)
+
+    def readerError(self):
+        self.reader_errors += 1
+        self.last_reader_error = repr(sys.exc_info()[1])
+
+
+class _TSPendingCommand(object):
+    __slots__ = ('cmd_byte', 'logical_id', 'descriptor', 'parse_func', 'future',
+                 'deadline', 'abandoned', 'sent')
+
+    def __init__(self, cmd_byte, logical_id, descriptor, parse_func):
+        self.cmd_byte = cmd_byte
+        self.logical_id = logical_id
+        self.descriptor = descriptor
+        self.parse_func = parse_func
+        self.future = futures.Future()
+        self.deadline = None
+        self.abandoned = False
+        self.sent = None
+
+    def matches(self, cmd_echo, logical_id):
+        if self.cmd_byte != cmd_echo:
+            return False
+        return self.logical_id is None or self.logical_id == logical_id
+
+
+class TSCommandPipeline(object):
+    """ Tracks the commands in flight on one serial port and resolves the
+        concurrent.futures.Future of each request when its response arrives.
+
+        The device answers commands in the order it receives them, so a
+        response goes to the oldest outstanding request with the same command
+        echo (and logical ID, for wireless commands). A request that times out
+        is kept for a short grace period, so a late response is consumed by it
+        rather than handed to a newer request, and a new request for the same
+        command is held back until that grace period is over. Responses that
+        match no request are counted and dropped.
+
+        Timeouts come from a TSRoundTripEstimator per logical ID and command,
+        fed by the time each response takes. Commands are measured apart
+        since their execution time on the device differs widely (committing
+        settings writes flash), so a command's first use waits the initial
+        timeout.
+
+        Args:
+            max_in_flight: The number of commands that can await a response
+                at once (default is 8)
+    """
+
+    def __init__(self, max_in_flight=_max_commands_in_flight):
+        self.max_in_flight = max_in_flight
+        self.lock = threading.Condition(threading.Lock())
+        self.requests = collections.deque()
+        self.in_flight = 0
+        self.closed = False
+        self.timeout_count = 0
+        self.late_count = 0
+        self.stray_count = 0
+        self.fail_count = 0
+        self.estimators = {}
+        self.latencies = {}
+
+    def __len__(self):
+        return self.in_flight
+
+    def roundTripEstimator(self, cmd_byte, logical_id=None):
+        """ Returns the TSRoundTripEstimator of a command sent to the device
+            at logical_id, or to the wired device for None.
+        """
+        key = (logical_id, cmd_byte)
+        estimator = self.estimators.get(key)
+        if estimator is None:
+            estimator = self.estimators.setdefault(key, TSRoundTripEstimator())
+        return estimator
+
+    def retryDelay(self, attempt, cmd_byte, logical_id=None):
+        return self.roundTripEstimator(cmd_byte, logical_id).retryDelay(attempt)
+
+    def submit(self, write_func, write_array, descriptor, parse_func, logical_id=None, timeout=None):
+        """ Writes a request and returns the Future that its response
+            resolves. The write happens under the pipeline lock so requests
+            are queued in the same order they go out on the wire. Exceptions
+            from write_func are passed on to the caller.
+        """
+        request = _TSPendingCommand(descriptor.cmd_byte, logical_id, descriptor, parse_func)
+        tracer = _tracer
+        if tracer is not None:
+            start_time = tracer.now()
+        self.lock.acquire()
+        try:
+            while True:
+                if self.closed:
+                    raise Exception("The command pipeline has been closed")
+                now = time.perf_counter()
+                expired = self._expire(now)
+                if expired:
+                    self.lock.release()
+                    self._resolveExpired(expired)
+                    self.lock.acquire()
+                    continue
+                wait_until = None
+                if self.in_flight >= self.max_in_flight:
+                    wait_until = min(r.deadline for r in self.requests if not r.abandoned)
+                else:
+                    for r in self.requests:
+                        if r.abandoned and r.matches(request.cmd_byte, logical_id):
+                            wait_until = r.deadline
+                            break
+                if wait_until is None:
+                    break
+                self.lock.wait(max(wait_until - now, 0.001))
+            if tracer is not None:
+                tracer.span("pipeline wait", start_time, args={'cmd': request.cmd_byte, 'in_flight': self.in_flight})
+            if timeout is None:
+                timeout = self.roundTripEstimator(request.cmd_byte, logical_id).timeout(self.in_flight)
+            request.deadline = now + timeout
+            request.sent = now
+            self.requests.append(request)
+            self.in_flight += 1
+            try:
+                if tracer is not None:
+                    write_time = tracer.now()
+                    write_func(write_array)
+                    tracer.span("serial write", write_time, args={'cmd': request.cmd_byte, 'bytes': len(write_array)})
+                else:
+                    write_func(write_array)
+            except:
+                self.requests.remove(request)
+                self.in_flight -= 1
+                self.lock.notify_all()
+                raise
+        finally:
+            self.lock.release()
+        return request.future
+
+    def resolve(self, cmd_echo, logical_id, header_list, output_data):
+        """ Hands a response read off the port to the oldest matching
+            request. Returns False if the response matched no request.
+        """
+        with self.lock:
+            now = time.perf_counter()
+            expired = self._expire(now)
+            for request in self.requests:
+                if request.matches(cmd_echo, logical_id):
+                    break
+            else:
+                request = None
+                self.stray_count += 1
+            if request is not None:
+                self.requests.remove(request)
+                if request.abandoned:
+                    self.late_count += 1
+                else:
+                    self.in_flight -= 1
+                    latency = now - request.sent
+                    self.roundTripEstimator(request.cmd_byte, request.logical_id).update(latency)
+                    key = (request.logical_id, request.cmd_byte)
+                    histogram = self.latencies.get(key)
+                    if histogram is None:
+                        histogram = self.latencies[key] = TSLatencyHistogram()
+                    histogram.record(latency)
+                self.lock.notify_all()
+        if expired:
+            self._resolveExpired(expired)
+        if request is None or request.abandoned:
+            return False
+        tracer = _tracer
+        if tracer is not None:
+            start_time = tracer.now()
+        try:
+            result = request.parse_func(request.descriptor, header_list, output_data)
+        except:
+            result = (True, header_list[1], None)
+        if tracer is not None:
+            tracer.span("unpack", start_time, args={'cmd': request.cmd_byte})
+        if result[0]:
+            self.fail_count += 1
+        self._setResult(request, result)
+        return True
+
+    def expects(self, cmd_echo, logical_id, data_size):
+        """ Returns True if a response with this command echo and data size
+            could belong to a request, including one that already timed out.
+        """
+        with self.lock:
+            for request in self.requests:
+                if request.matches(cmd_echo, logical_id):
+                    return data_size == 0 or data_size == request.descriptor.out_len
+        return False
+
+    def expire(self):
+        """ Times out every request whose deadline has passed. """
+        if not self.requests:
+            return
+        with self.lock:
+            expired = self._expire(time.perf_counter())
+        self._resolveExpired(expired)
+
+    def wait(self, future):
+        """ Waits for a submitted request and returns its result, timing out
+            requests as their deadlines pass.
+        """
+        tracer = _tracer
+        if tracer is not None:
+            start_time = tracer.now()
+        while True:
+            with self.lock:
+                deadlines = [r.deadline for r in self.requests if not r.abandoned]
+            timeout = None
+            if deadlines:
+                timeout = max(min(deadlines) - time.perf_counter(), 0)
+            try:
+                result = future.result(timeout)
+                break
+            except futures.TimeoutError:
+                self.expire()
+        if tracer is not None:
+            tracer.span("wait for response", start_time, args={'failed': bool(result[0])})
+        return result
+
+    def close(self):
+        """ Fails every outstanding request and refuses new ones. """
+        with self.lock:
+            self.closed = True
+            pending = [r for r in self.requests if not r.abandoned]
+            self.requests.clear()
+            self.in_flight = 0
+            self.lock.notify_all()
+        self._resolveExpired(pending)
+
+    def _expire(self, now):
+        # Times out live requests past their deadline, and drops timed out
+        # requests whose grace period for a late response is over
+        expired = []
+        changed = False
+        for request in list(self.requests):
+            if request.deadline > now:
+                continue
+            if request.abandoned:
+                self.requests.remove(request)
+            else:
+                estimator = self.roundTripEstimator(request.cmd_byte, request.logical_id)
+                estimator.backoff()
+                request.abandoned = True
+                request.deadline = now + min(estimator.rto, _late_response_grace)
+                self.in_flight -= 1
+                self.timeout_count += 1
+                expired.append(request)
+            changed = True
+        if changed:
+            self.lock.notify_all()
+        return expired
+
+    def _resolveExpired(self, expired):
+        for request in expired:
+            self._setResult(request, (True, None, None))
+
+    def _setResult(self, request, result):
+        if request.future.set_running_or_notify_cancel():
+            request.future.set_result(result)
+
+
+class _TSKeyedExecutor(object):
+    """ Runs calls on a shared thread pool while keeping the calls submitted
+        for the same key, a sensor, in order and one at a time.
+
+        A key's calls are drained by a single pool task, so a busy sensor
+        holds at most one worker and no thread is created per call.
+    """
+
+    def __init__(self, max_workers=_max_broadcast_workers):
+        self.executor = futures.ThreadPoolExecutor(max_workers, thread_name_prefix="tss-broadcast")
+        self.lock = threading.Lock()
+        self.queues = {}
+
+    def submit(self, key, func, *args):
+        future = futures.Future()
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue is None:
+                self.queues[key] = collections.deque([(future, func, args)])
+                self.executor.submit(self._drain, key)
+            else:
+                queue.append((future, func, args))
+        return future
+
+    def _drain(self, key):
+        while True:
+            with self.lock:
+                queue = self.queues[key]
+                if not queue:
+                    del self.queues[key]
+                    return
+                future, func, args = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as ex:
+                future.set_exception(ex)
+
+
+def _getBroadcastExecutor():
+    global _broadcast_executor
+    if _broadcast_executor is None:
+        with _broadcast_executor_lock:
+            if _broadcast_executor is None:
+                _broadcast_executor = _TSKeyedExecutor()
+    return _broadcast_executor
+
+
+class TSReaderHub(object):
+    """ Reads the serial ports of many sensors from a single thread. Every
+        registered port's file descriptor is watched with a selector, each
+        ready port is drained with one read and its packets are framed and
+        dispatched by the sensor, and command timeouts are checked for all
+        sensors on the same thread. Packets are always framed, as in
+        TSS_READ_FRAMED, unless a sensor uses TSS_READ_ZERO_COPY.
+
+        Args:
+            poll_interval: How often, in seconds, command timeouts are
+                checked (default is 0.01)
+    """
+
+    def __init__(self, poll_interval=_reader_hub_interval):
+        self.poll_interval = poll_interval
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.changes = []
+        self.sensors = {}
+        self.closed = False
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._hubLoop, name="tss-reader-hub")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def _wake(self):
+        try:
+            os.write(self.wake_write, b'\0')
+        except OSError:
+            pass
+
+    def register(self, sensor):
+        """ Starts reading the sensor's port on the hub thread. """
+        with self.lock:
+            if self.closed or not self.thread.is_alive():
+                raise Exception("The reader hub is closed")
+            self.changes.append((sensor, True, None))
+        self._wake()
+
+    def unregister(self, sensor):
+        """ Stops reading the sensor's port. Once this returns the hub does
+            not touch the sensor again, so its port can be closed.
+        """
+        if threading.current_thread() is self.thread:
+            self._removeSensor(sensor)
+            return
+        done = threading.Event()
+        with self.lock:
+            if self.closed:
+                return
+            self.changes.append((sensor, False, done))
+        self._wake()
+        # A hub thread that died cannot touch the sensor any more either
+        while not done.wait(self.poll_interval):
+            if not self.thread.is_alive():
+                break
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self._wake()
+        if threading.current_thread() is not self.thread and self.thread.is_alive():
+            self.thread.join()
+
+    def _removeSensor(self, sensor):
+        for fd, registered in list(self.sensors.items()):
+            if registered is sensor:
+                del self.sensors[fd]
+                self.selector.unregister(fd)
+
+    def _applyChanges(self):
+        with self.lock:
+            changes = self.changes
+            self.changes = []
+        for sensor, add, done in changes:
+            try:
+                self._removeSensor(sensor)
+                if add and sensor.serial_port is not None:
+                    fd = sensor.serial_port.fd
+                    self.selector.register(fd, selectors.EVENT_READ, sensor)
+                    self.sensors[fd] = sensor
+            except:
+                _print("Reader hub failed to {0} {1}".format("add" if add else "remove", sensor))
+                traceback.print_exc()
+            if done is not None:
+                done.set()
+
+    def _hubLoop(self):
+        try:
+            self._pollSensors()
+        except:
+            traceback.print_exc()
+        with self.lock:
+            self.closed = True
+        for sensor in list(self.sensors.values()):
+            try:
+                self._removeSensor(sensor)
+            except:
+                pass
+        with self.lock:
+            for sensor, add, done in self.changes:
+                if done is not None:
+                    done.set()
+            self.changes = []
+        self.selector.close()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+
+    def _pollSensors(self):
+        selector = self.selector
+        wake_read = self.wake_read
+        next_expire = time.perf_counter()
+        while True:
+            self._applyChanges()
+            if self.closed:
+                break
+            for key, events in selector.select(self.poll_interval):
+                if key.fd == wake_read:
+                    try:
+                        os.read(wake_read, 4096)
+                    except OSError:
+                        pass
+                    continue
+                sensor = key.data
+                try:
+                    if not sensor._readReady(key.fd):
+                        # The port hung up, stop watching it until it is
+                        # reopened
+                        self._removeSensor(sensor)
+                except:
+                    sensor._readerFailed()
+            now = time.perf_counter()
+            if now >= next_expire:
+                next_expire = now + self.poll_interval
+                for sensor in list(self.sensors.values()):
+                    try:
+                        sensor.command_pipeline.expire()
+                    except:
+                        traceback.print_exc()
+
+
 class Broadcaster(object):
     def __init__(self):
         self.retries = 10
@@ -322,6 +1834,18 @@ class Broadcaster(object):
             q.queueWriteRead(sensor, sensor.serial_number, self.retries, command, input_list)
         return q.proccessQueue()
 
+    def writeReadFutures(self, command, input_list=None, filter=None):
+        """ Like writeRead, but returns right away with a dictionary of
+            serial numbers to concurrent.futures.Future objects that resolve
+            to each sensor's packet.
+        """
+        q = TSCommandQueue()
+        if filter is None:
+            filter = list(global_sensorlist.values())
+        for sensor in filter:
+            q.queueWriteRead(sensor, sensor.serial_number, self.retries, command, input_list)
+        return q.submitQueue()
+
     def _broadcastMethod(self, filter, method, default=None, *args):
         # _print(filter)
         if filter is None:
@@ -356,6 +1880,23 @@ class Broadcaster(object):
                           callback_func)
         return q.proccessQueue()
 
+    def broadcastMethodFutures(self, method, default=None, args=[], filter=None, callback_func=None):
+        """ Like broadcastMethod, but returns right away with a dictionary of
+            sensors to concurrent.futures.Future objects that resolve to each
+            sensor's result.
+        """
+        q = TSCommandQueue()
+        if filter is None:
+            filter = list(global_sensorlist.values())
+        for sensor in filter:
+            q.queueMethod(getattr(sensor, method),
+                          sensor,
+                          self.retries,
+                          default,
+                          args,
+                          callback_func)
+        return q.submitQueue()
+
     def setStreamingSlots(self, slot0='null',
                           slot1='null',
                           slot2='null',
@@ -453,23 +1994,47 @@ class TSCommandQueue(object):
         except(KeyboardInterrupt):
             print('\n! Received keyboard interrupt, quitting threads.\n')
             raise KeyboardInterrupt  # fix bug where a thread eats the interupt
+        return self.return_dict.get(rtn_key)
+
+    def _queueWriteRead(self, sensor, rtn_dict, rtn_key, retries, command, input_list=None):
+        sensor._queueWriteRead(rtn_dict, rtn_key, retries, command, input_list)
+        return rtn_dict.get(rtn_key)
 
-    def createThreads(self):
-        thread_queue = []
+    def _submitQueue(self, clear_queue=False):
+        # A list of (return key, future), one for every queued call even when
+        # return keys repeat
+        executor = _getBroadcastExecutor()
+        futures_list = []
         for item in self.queue:
             if item[0] == "queueWriteRead":
-                thread_queue.append(item[1].queueWriteRead(*item[2]))
+                sensor, args = item[1], item[2]
+                futures_list.append((args[1], executor.submit(sensor, self._queueWriteRead, sensor, *args)))
             elif item[0] == "queueMethod":
-                qThread = threading.Thread(target=self._queueMethod, args=item[1])
-                thread_queue.append(qThread)
-        return thread_queue
-
-    def proccessQueue(self, clear_queue=False):
-        thread_queue = self.createThreads()
-        [qThread.start() for qThread in thread_queue]
-        [qThread.join() for qThread in thread_queue]
+                method_obj, rtn_key = item[1][0], item[1][1]
+                sensor = getattr(method_obj, '__self__', rtn_key)
+                futures_list.append((rtn_key, executor.submit(sensor, self._queueMethod, *item[1])))
         if clear_queue:
             self.queue = []
+        return futures_list
+
+    def submitQueue(self, clear_queue=False):
+        """ Submits the queued calls to the shared broadcast executor, where
+            the calls of each sensor run in order. Returns a dictionary of
+            return keys to concurrent.futures.Future objects, the last call
+            queued under a key when keys repeat.
+        """
+        return dict(self._submitQueue(clear_queue))
+
+    def proccessQueue(self, clear_queue=False):
+        """ Runs the queued calls and waits for every one of them. A call that
+            raised leaves None under its return key.
+        """
+        for rtn_key, future in self._submitQueue(clear_queue):
+            try:
+                future.result()
+            except Exception:
+                traceback.print_exc()
+                self.return_dict.setdefault(rtn_key, None)
         return self.return_dict
 
 
@@ -495,6 +2060,7 @@ class _TSBase(object):
         'getJoystickAndMousePresentRemoved': (0xfe, 2, '>B', 0, None, 1),
         'null': (0xff, 0, None, 0, None, 1)
     }
+    max_commands_in_flight = _max_commands_in_flight
 
     def __init__(self, com_port=None, baudrate=_baudrate, timestamp_mode=TSS_TIMESTAMP_SENSOR):
         self.protocol_args = {'success_failure': True,
@@ -525,10 +2091,23 @@ class _TSBase(object):
         self.stream_timing = None
         self.stream_parse = None
         self.stream_slot_cmds = ['null'] * 8
+        if getattr(self, 'cached_stream_slots', None):
+            self.stream_slot_cmds = list(self.cached_stream_slots)
         self.stream_last_data = None
+        self.stream_sample = TSStreamSample()
         self.stream_data = []
+        self.stream_recorder = None
+        self.record_worker = None
+        self.stream_packet_dtype = None
+        self.batch_callback_func = None
+        self.callback_worker = None
+        self.batch_callback_worker = None
+        self.stream_queues = []
         self.record_data = False
+        self.stream_active = False
         self.data_loop = False
+        self.read_mode = TSS_READ_HEADER
+        self.device_stats = TSDeviceStats()
 
     def _setupProtocolHeader(self, success_failure=False,
                              timestamp=False,
@@ -545,22 +2124,85 @@ class _TSBase(object):
                                                   serial_number,
                                                   data_length)
         protocol_byte, self.header_parse, self.header_idx_lst = protocol_header
-        d_header = self.f7WriteRead('_getWiredResponseHeaderBitfield')
+        if getattr(self, 'verified_header_bitfield', None) == protocol_byte:
+            # The device cache check already got a response with this header
+            d_header = protocol_byte
+        else:
+            d_header = self.f7WriteRead('_getWiredResponseHeaderBitfield')
+        self.verified_header_bitfield = None
         if d_header != protocol_byte:
             self.f7WriteRead('_setWiredResponseHeaderBitfield', protocol_byte)
             d_header = self.f7WriteRead('_getWiredResponseHeaderBitfield')
         if d_header != protocol_byte:
             print("!!!!!fail d_header={0}, protocol_header_byte={1}".format(d_header, protocol_byte))
             raise Exception
+        self.header_bitfield = protocol_byte
+        self._storeDeviceCache()
+
+    def _storeDeviceCache(self):
+        if _device_cache_path is None or self.serial_port is None:
+            return
+        stream_slot_cmds = getattr(self, 'stream_slot_cmds', None)
+        if stream_slot_cmds is not None:
+            stream_slot_cmds = list(stream_slot_cmds)
+        _storeDeviceCacheEntry(self.port_name, {
+            'serial_number': self.serial_number,
+            'device_type': self.device_type,
+            'compatibility': self.compatibility,
+            'header_bitfield': self.header_bitfield,
+            'stream_slot_cmds': stream_slot_cmds
+        })
+
+    def _setupFrameParse(self):
+        # Positions of the header fields the framed reader needs, or None if
+        # the header does not carry them
+        idx_lst = self.header_idx_lst
+        self.frame_buffer = bytearray()
+        self.frame_idx = tuple(idx_lst.index(i) if i in idx_lst else None for i in range(7))
+        if self.read_mode == TSS_READ_ZERO_COPY:
+            self.frame_view = memoryview(bytearray(_frame_buffer_size))
+        else:
+            self.frame_view = None
+        self.frame_end = 0
+        self.frame_synced = True
 
     def _setupThreadedReadLoop(self):
-        self.read_lock = threading.Condition(threading.Lock())
-        self.read_queue = collections.deque()
-        self.read_dict = {}
+        self.command_pipeline = TSCommandPipeline(self.max_commands_in_flight)
+        self._setupFrameParse()
+        hub = getattr(self, 'reader_hub', None)
+        if hub is None and _use_reader_hub and self._canUseReaderHub():
+            hub = getReaderHub()
+        self._startReadLoop(hub)
+
+    def _canUseReaderHub(self):
+        return False
+
+    def _startReadLoop(self, hub=None):
         self.data_loop = True
-        self.read_thread = threading.Thread(target=self._dataReadLoop)
-        self.read_thread.daemon = True
-        self.read_thread.start()
+        self.reader_hub = hub
+        if hub is not None:
+            self.read_thread = None
+            hub.register(self)
+        else:
+            self.read_thread = threading.Thread(target=self._dataReadLoop)
+            self.read_thread.daemon = True
+            self.read_thread.start()
+
+    def _stopReadLoop(self):
+        # The port stays open, a reader thread leaves its loop after its
+        # current read times out
+        self.data_loop = False
+        if self.reader_hub is not None:
+            self.reader_hub.unregister(self)
+        elif self.read_thread is not None:
+            self.read_thread.join()
+
+    def _readerFailed(self):
+        if self.data_loop:  # errors from closing the port are expected
+            self.device_stats.readerError()
+        self._read_data = None
+        self.frame_buffer = bytearray()
+        self.frame_end = 0
 
     def __repr__(self):
         return "<YEI3Space {0}:{1}>".format(self.device_type, self.serial_number_hex)
@@ -568,16 +2210,113 @@ class _TSBase(object):
     def __str__(self):
         return self.__repr__()
 
+    def _statsPipeline(self):
+        # The command pipeline holding this device's requests and the logical
+        # ID they are tracked under
+        return getattr(self, 'command_pipeline', None), None
+
+    def _statsCommandName(self, cmd_byte):
+        return self.reverse_command_dict.get(cmd_byte, '0x{0:02x}'.format(cmd_byte))
+
+    def stats(self):
+        """ Returns a dictionary of the device's live counters:
+                uptime: Seconds since the counters started
+                bytes_read, responses, stream_samples: Totals read
+                bytes_per_second, packets_per_second, samples_per_second:
+                    Rates since the previous stats() call
+                unmatched_packets: Responses no request was waiting for
+                late_responses: Responses that came after their request timed
+                    out
+                timeouts, retries, failed_responses: Command failures
+                reader_errors, last_reader_error: Exceptions the reader thread
+                    recovered from, and the last one
+                resyncs, resync_bytes: Times the checksum mode reader lost
+                    the packet framing, and the bytes it skipped to find it
+                stream_dropped: Samples dropped by full stream queues and
+                    callback workers
+                latency: A TSLatencyHistogram summary per command name
+            The command counters come from the command pipeline, which is
+            recreated when the port is reopened.
+        """
+        device_stats = self.device_stats
+        now = time.perf_counter()
+        bytes_read = device_stats.bytes_read
+        stream_samples = device_stats.stream_samples
+        packets = device_stats.response_count + stream_samples
+        last_time, last_bytes, last_packets, last_samples = device_stats.last_stats
+        device_stats.last_stats = (now, bytes_read, packets, stream_samples)
+        interval = max(now - last_time, 1e-9)
+        rtn_dict = {
+            'uptime': now - device_stats.start_time,
+            'bytes_read': bytes_read,
+            'responses': device_stats.response_count,
+            'stream_samples': stream_samples,
+            'bytes_per_second': (bytes_read - last_bytes) / interval,
+            'packets_per_second': (packets - last_packets) / interval,
+            'samples_per_second': (stream_samples - last_samples) / interval,
+            'unmatched_packets': 0,
+            'late_responses': 0,
+            'timeouts': 0,
+            'retries': device_stats.retries,
+            'failed_responses': 0,
+            'reader_errors': device_stats.reader_errors,
+            'last_reader_error': device_stats.last_reader_error,
+            'resyncs': device_stats.resyncs,
+            'resync_bytes': device_stats.resync_bytes,
+            'stream_dropped': 0,
+            'latency': {}
+        }
+        pipeline, logical_id = self._statsPipeline()
+        if pipeline is not None:
+            if logical_id is None:
+                rtn_dict['unmatched_packets'] = pipeline.stray_count
+                rtn_dict['late_responses'] = pipeline.late_count
+                rtn_dict['timeouts'] = pipeline.timeout_count
+                rtn_dict['failed_responses'] = pipeline.fail_count
+            for key, histogram in list(pipeline.latencies.items()):
+                if key[0] == logical_id:
+                    rtn_dict['latency'][self._statsCommandName(key[1])] = histogram.summary()
+        for stream_queue in getattr(self, 'stream_queues', ()):
+            rtn_dict['stream_dropped'] += stream_queue.dropped
+        for worker in (getattr(self, 'callback_worker', None), getattr(self, 'batch_callback_worker', None),
+                       getattr(self, 'record_worker', None)):
+            if worker is not None:
+                rtn_dict['stream_dropped'] += worker.dropped
+        return rtn_dict
+
     def close(self):
+        self._closePort()
+        workers = (self.callback_worker, self.batch_callback_worker)
+        self.callback_worker = None
+        self.batch_callback_worker = None
+        self.callback_func = None
+        self.batch_callback_func = None
+        for worker in workers:
+            if worker is not None:
+                worker.close()
+
+    def _closePort(self):
+        # Stops reading and closes the port but keeps what the user set up,
+        # reconnect and a reused instance open the port again
         self.data_loop = False
+        if self.reader_hub is not None:
+            # The hub must let go of the file descriptor before it is closed
+            self.reader_hub.unregister(self)
         if self.serial_port:
             self.serial_port.close()
             self.serial_port = None
-        self.read_thread.join()
+        if self.read_thread is not None:
+            self.read_thread.join()
+        self.command_pipeline.close()
 
     def reconnect(self):
-        self.close()
-        if not tryPort(self.port_name):
+        self._closePort()
+        port_state = tryPort(self.port_name)
+        if port_state is False:
+            # The check still has the port open
+            _print("tryport timed out")
+            return False
+        if not port_state:
             _print("tryport fail")
         try:
             serial_port = serial.Serial(self.port_name, baudrate=self.baudrate, timeout=0.5, writeTimeout=0.5)
@@ -596,98 +2335,46 @@ class _TSBase(object):
 
     # Wired Old Protocol WriteRead
     def f7WriteRead(self, command, input_list=None):
-        command_args = self.command_dict[command]
-        cmd_byte, out_len, out_struct, in_len, in_struct, compatibility = command_args
-        packed_data = None
-        if in_struct:
-            if type(input_list) in (list, tuple):
-                packed_data = struct.pack(in_struct, *input_list)
-            else:
-                packed_data = struct.pack(in_struct, input_list)
-        write_array = makeWriteArray(0xf7, None, cmd_byte, packed_data)
+        descriptor = getCommandDescriptor(self.command_dict[command])
+        write_array = _makeCommandWriteArray(descriptor, 0xf7, None, input_list)
         self.serial_port.write(write_array)
-        if out_struct:
-            output_data = self.serial_port.read(out_len)
-            rtn_list = struct.unpack(out_struct, output_data)
-            if len(rtn_list) != 1:
-                return rtn_list
-            return rtn_list[0]
+        if descriptor.out_parse:
+            output_data = self.serial_port.read(descriptor.out_len)
+            return _unpackCommandOutput(descriptor, output_data)
 
     # requires the dataloop, do not call
     # Wired New Protocol WriteRead
     def f9WriteRead(self, command, input_list=None):
-        global global_counter
-        command_args = self.command_dict[command]
-        cmd_byte, out_len, out_struct, in_len, in_struct, compatibility = command_args
-        if self.compatibility < compatibility:
+        future = self.f9WriteReadFuture(command, input_list)
+        return self.command_pipeline.wait(future)
+
+    def f9WriteReadFuture(self, command, input_list=None):
+        """ Sends a command without waiting for its response. Returns a
+            concurrent.futures.Future that resolves to the same
+            (fail_byte, timestamp, data) tuple f9WriteRead returns, so several
+            threads can keep commands in flight on one port at once.
+        """
+        descriptor = getCommandDescriptor(self.command_dict[command])
+        if self.compatibility < descriptor.compatibility:
             raise Exception("Firmware for device on ( %s ) is out of date for this function. Recommend updating to latest firmware." % self.serial_port.name)
-        packed_data = None
-        if in_struct:
-            if type(input_list) in (list, tuple):
-                packed_data = struct.pack(in_struct, *input_list)
-            else:
-                packed_data = struct.pack(in_struct, input_list)
-        write_array = makeWriteArray(0xf9, None, cmd_byte, packed_data)
-        self.read_lock.acquire()
-        uid = global_counter
-        global_counter += 1
+        write_array = _makeCommandWriteArray(descriptor, 0xf9, None, input_list)
         try:
-            self.serial_port.write(write_array)  # release in reader thread
+            return self.command_pipeline.submit(self.serial_port.write, write_array, descriptor, _commandResult)
         except serial.SerialTimeoutException:
-            self.read_lock.release()
             self.serial_port.close()
             # _print("SerialTimeoutException!!!!")
             # !!!!!Reconnect
-            return (True, None, None)
+            return _completedCommand()
         except ValueError:
             try:
                 # _print("trying to open it back up!!!!")
                 self.serial_port.open()
                 # _print("aaand open!!!!")
             except serial.SerialException:
-                self.read_lock.release()
+                pass
             # _print("SerialTimeoutException!!!!")
             # !!!!!Reconnect
-            return (True, None, None)
-        queue_packet = (uid, cmd_byte)
-        timeout_time = 0.5 + (len(self.read_queue) * 0.150)  # timeout increases as queue gets larger
-        self.read_queue.append(queue_packet)
-        start_time = time.perf_counter() + timeout_time
-        read_data = None
-        while (timeout_time > 0):
-            self.read_lock.wait(timeout_time)
-            read_data = self.read_dict.get(uid, None)
-
-            if read_data is not None:
-                break
-            timeout_time = start_time - time.perf_counter()
-            # _print("Still waiting {0} {1} {2}".format(uid, command, timeout_time))
-        else:
-            # _print("Operation timed out!!!!")
-            try:
-                self.read_queue.remove(queue_packet)
-            except:
-                traceback.print_exc()
-            self.read_lock.release()
-            return (True, None, None)
-        self.read_lock.release()
-        del self.read_dict[uid]
-        header_list, output_data = read_data
-        fail_byte, timestamp, cmd_echo, ck_sum, rtn_log_id, sn, data_size = header_list
-        if cmd_echo != cmd_byte:
-            # _print("!!!!!!!!cmd_echo!=cmd_byte!!!!!")
-            # _print('cmd_echo= 0x{0:02x} cmd_byte= 0x{1:02x}'.format(cmd_echo, cmd_byte))
-            return (True, timestamp, None)
-        rtn_list = None
-        if not fail_byte:
-            if out_struct:
-                rtn_list = struct.unpack(out_struct, output_data)
-                if len(rtn_list) == 1:
-                    rtn_list = rtn_list[0]
-        else:
-            # _print("fail_byte!!!!triggered")
-            pass
-        return (fail_byte, timestamp, rtn_list)
+            return _completedCommand()
 
     writeRead = f9WriteRead
 
@@ -913,7 +2600,7 @@ class _TSSensor(_TSBase):
         'getMouseAbsoluteRelativeMode': (0xfc, 1, '>B', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["!BASE"]
 
@@ -968,7 +2655,8 @@ class _TSSensor(_TSBase):
                 packet = self.writeRead(command, input_list)
                 if packet[0]:
                     # _print("##Attempt: {0} complete".format(i))
-                    time.sleep(0.1)
+                    self.device_stats.retries += 1
+                    time.sleep(self._retryDelay(i, command))
                     continue
                 rtn_dict[rtn_key] = packet
                 break
@@ -979,8 +2667,11 @@ class _TSSensor(_TSBase):
             print('\n! Received keyboard interrupt, quitting threads.\n')
             raise KeyboardInterrupt  # fix bug where a thread eats the interupt
 
-    def queueWriteRead(self, rtn_dict, rtn_key, retries, command, input_list=None):
-        return threading.Thread(target=self._queueWriteRead, args=(rtn_dict, rtn_key, retries, command, input_list))
+    def _retryDelay(self, attempt, command):
+        command_pipeline = getattr(self, 'command_pipeline', None)
+        if command_pipeline is None:
+            return TSRoundTripEstimator().retryDelay(attempt)
+        return command_pipeline.retryDelay(attempt, self.command_dict[command][0])
 
     def _generateStreamParse(self):
         stream_string = '>'
@@ -991,11 +2682,24 @@ class _TSSensor(_TSBase):
                 out_struct = self.command_dict[slot_cmd][2]
                 stream_string += out_struct[1:]  # stripping the >
         self.stream_parse = struct.Struct(stream_string)
+        self.stream_sample = TSStreamSample(len(self.stream_parse.unpack(bytes(self.stream_parse.size))))
+        self.stream_packet_dtype = None
+        recorder = self.stream_recorder
+        if recorder is not None and recorder.slot_cmds != self.stream_slot_cmds:
+            # The recorded layout no longer matches the stream, start over
+            recorder.close()
+            self.stream_recorder = TSStreamRecorder(self.command_dict, self.stream_slot_cmds,
+                                                    recorder.capacity, recorder.overflow)
+            self.stream_data = self.stream_recorder
         # Set streaming batch command
         self.command_dict['_getStreamingBatch'] = (0x54, self.stream_parse.size, stream_string, 0, None, 1)
 
     def _parseStreamData(self, protocol_data, output_data):
+        tracer = _tracer
+        if tracer is not None:
+            start_time = tracer.now()
         rtn_list = self.stream_parse.unpack(output_data)
+        self.device_stats.stream_samples += 1
         if len(rtn_list) == 1:
             rtn_list = rtn_list[0]
 
@@ -1006,14 +2710,198 @@ class _TSSensor(_TSBase):
         data = (protocol_data, rtn_list)
         self.stream_last_data = data
         if self.record_data:
-            self.stream_data.append(data)
-        if self.callback_func:
-            self.callback_func(data)
+            if self.record_worker is not None:
+                self.record_worker.put((False, protocol_data, output_data))
+            elif self.stream_recorder is not None:
+                self.stream_recorder.record(protocol_data, output_data)
+            else:
+                self.stream_data.append(data)
+        for stream_queue in self.stream_queues:
+            stream_queue.put(data)
+        if self.callback_worker is not None:
+            self.callback_worker.put(data)
+        elif self.callback_func:
+            if tracer is not None:
+                callback_time = tracer.now()
+                self.callback_func(data)
+                tracer.span("callback", callback_time, "callback")
+            else:
+                self.callback_func(data)
+        if tracer is not None:
+            tracer.span("stream dispatch", start_time, "stream")
+            self._traceStreamQueues(tracer)
+
+    def _parseStreamBatch(self, frame_buffer, offset, end):
+        # Hands the run of whole stream packets at offset to the batch
+        # callback as one structured array, returns the offset after the run
+        tracer = _tracer
+        if tracer is not None:
+            start_time = tracer.now()
+        packet_dtype = self.getStreamPacketDtype()
+        packets = streamPacketRun(frame_buffer, packet_dtype, self.stream_parse.size, offset, end)
+        count = len(packets)
+        if not count:
+            return offset
+        self.device_stats.stream_samples += count
+        packets = packets.copy()  # release the read buffer
+        if self.timestamp_mode == TSS_TIMESTAMP_SENSOR:
+            timestamps = packets['timestamp']
+            timestamp = int(timestamps[-1])
+        elif self.timestamp_mode == TSS_TIMESTAMP_SYSTEM:
+            timestamps = timestamp = time.perf_counter() * 1000000
+        else:
+            timestamps = timestamp = None
+        last_offset = offset + (count - 1) * packet_dtype.itemsize + self.header_parse.size
+        if self.read_mode == TSS_READ_ZERO_COPY:
+            # getLatestStreamData and borrowLatestStreamSample expect the
+            # reusable sample in this mode
+            last_data = self.stream_sample
+            last_data.values[:] = self.stream_parse.unpack_from(frame_buffer, last_offset)
+            last_data.timestamp = timestamp
+            last_data.count += count
+        else:
+            rtn_list = self.stream_parse.unpack_from(frame_buffer, last_offset)
+            if len(rtn_list) == 1:
+                rtn_list = rtn_list[0]
+            last_data = (timestamp, rtn_list)
+
+        self.latest_lock.acquire()
+        self.new_data = True
+        self.latest_lock.notify()
+        self.latest_lock.release()
+        self.stream_last_data = last_data
+        if self.record_data and self.record_worker is not None:
+            self.record_worker.put((True, timestamps, packets))
+        elif self.record_data and self.stream_recorder is not None:
+            self.stream_recorder.recordBatch(timestamps, packets)
+        elif self.record_data or self.stream_queues:
+            header_size = self.header_parse.size
+            for i in range(count):
+                data_start = offset + i * packet_dtype.itemsize + header_size
+                rtn_list = self.stream_parse.unpack_from(frame_buffer, data_start)
+                if len(rtn_list) == 1:
+                    rtn_list = rtn_list[0]
+                if self.timestamp_mode == TSS_TIMESTAMP_SENSOR:
+                    timestamp = int(timestamps[i])
+                data = (timestamp, rtn_list)
+                if self.record_data:
+                    self.stream_data.append(data)
+                for stream_queue in self.stream_queues:
+                    stream_queue.put(data)
+        if self.batch_callback_worker is not None:
+            self.batch_callback_worker.put(packets)
+        elif tracer is not None:
+            callback_time = tracer.now()
+            self.batch_callback_func(packets)
+            tracer.span("callback", callback_time, "callback", {'samples': count})
+        else:
+            self.batch_callback_func(packets)
+        if tracer is not None:
+            tracer.span("stream dispatch", start_time, "stream", {'samples': count})
+            self._traceStreamQueues(tracer)
+        return offset + count * packet_dtype.itemsize
+
+    def _parseStreamDataInto(self, timestamp, frame_view, offset):
+        # Zero-copy counterpart of _parseStreamData, decodes straight out of
+        # the read buffer into the reusable stream sample
+        tracer = _tracer
+        if tracer is not None:
+            start_time = tracer.now()
+        sample = self.stream_sample
+        sample.values[:] = self.stream_parse.unpack_from(frame_view, offset)
+        sample.timestamp = timestamp
+        sample.count += 1
+        self.device_stats.stream_samples += 1
+
+        self.latest_lock.acquire()
+        self.new_data = True
+        self.latest_lock.notify()
+        self.latest_lock.release()
+        self.stream_last_data = sample
+        # Consumers that keep the sample past this call get one shared copy,
+        # inline ones borrow the sample itself
+        data = None
+        if self.record_data:
+            if self.record_worker is not None:
+                self.record_worker.put((False, timestamp, frame_view[offset:offset + self.stream_parse.size].tobytes()))
+            elif self.stream_recorder is not None:
+                self.stream_recorder.record(timestamp, frame_view[offset:offset + self.stream_parse.size])
+            else:
+                data = sample.copy()
+                self.stream_data.append(data)
+        if self.stream_queues:
+            if data is None:
+                data = sample.copy()
+            for stream_queue in self.stream_queues:
+                stream_queue.put(data)
+        if self.callback_worker is not None:
+            if data is None:
+                data = sample.copy()
+            self.callback_worker.put(data)
+        elif self.callback_func:
+            if tracer is not None:
+                callback_time = tracer.now()
+                self.callback_func(sample)
+                tracer.span("callback", callback_time, "callback")
+            else:
+                self.callback_func(sample)
+        if tracer is not None:
+            tracer.span("stream dispatch", start_time, "stream")
+            self._traceStreamQueues(tracer)
+
+    def _canUseReaderHub(self):
+        return getattr(self.serial_port, 'fd', None) is not None
+
+    def _readReady(self, fd):
+        # Called on the reader hub thread when the port has data waiting,
+        # returns False once the port has hung up
+        if self.read_mode == TSS_READ_ZERO_COPY:
+            frame_end = self.frame_end
+            read_count = os.readv(fd, [self.frame_view[frame_end:]])
+            if not read_count:
+                return False
+            self.device_stats.bytes_read += read_count
+            self._parseZeroCopyFrames(frame_end + read_count)
+        else:
+            read_bytes = os.read(fd, _frame_read_size)
+            if not read_bytes:
+                return False
+            self.device_stats.bytes_read += len(read_bytes)
+            self._feedFramedData(read_bytes)
+        return True
+
+    def setReaderHub(self, hub):
+        """ Moves reading this sensor's port onto a TSReaderHub, such as the
+            shared one from getReaderHub(), or back onto a thread of its own
+            with None. The hub frames packets as TSS_READ_FRAMED does unless
+            TSS_READ_ZERO_COPY is set.
+
+            @return: True if the sensor now reads as asked, False if the port
+                has no file descriptor to wait on.
+        """
+        if hub is self.reader_hub:
+            return True
+        if hub is not None and not self._canUseReaderHub():
+            return False
+        self._stopReadLoop()
+        self._setupFrameParse()
+        self._startReadLoop(hub)
+        return True
+
+    def getReaderHub(self):
+        return self.reader_hub
 
     def _dataReadLoop(self):
         while self.data_loop:
             try:
-                self._readDataWiredProHeader()
+                if self.read_mode == TSS_READ_ZERO_COPY:
+                    self._readDataWiredZeroCopy()
+                elif self.read_mode == TSS_READ_FRAMED or self.protocol_args.get('checksum'):
+                    # Header reads cannot look back for the next packet, so
+                    # checksum mode always frames
+                    self._readDataWiredFramed()
+                else:
+                    self._readDataWiredProHeader()
             except(KeyboardInterrupt):
                 print('\n! Received keyboard interrupt, quitting threads.\n')
                 raise KeyboardInterrupt  # fix bug where a thread eats the interupt
@@ -1021,11 +2909,8 @@ class _TSSensor(_TSBase):
                 # traceback.print_exc()
                 # _print("bad _parseStreamData parse")
                 # _print('!!!!!inWaiting = {0}'.format(self.serial_port.inWaiting()))
-                self._read_data = None
-                try:
-                    self.read_lock.release()
-                except:
-                    pass
+                self._readerFailed()
+            self.command_pipeline.expire()
 
     def _readDataWiredProHeader(self):
         _serial_port = self.serial_port
@@ -1047,27 +2932,208 @@ class _TSSensor(_TSBase):
                 header_list = padProtocolHeader69(header_data, None)
             fail_byte, timestamp, cmd_echo, ck_sum, rtn_log_id, sn, data_size = header_list
             output_data = _serial_port.read(data_size)
-            if cmd_echo is 0xff:
+            self.device_stats.bytes_read += len(header_bytes) + len(output_data)
+            if cmd_echo == 0xff:
                 if data_size:
                     self._parseStreamData(timestamp, output_data)
                 return
-            self.read_lock.acquire()
-            if len(self.read_queue):  # here for a bug in the code
-                uid, cmd_byte = self.read_queue.popleft()
-                if cmd_byte == cmd_echo:
-                    self.read_dict[uid] = (header_list, output_data)
-                    self.read_lock.notify()  # dies in 3 seconds if there is a writeRead in wait
-                else:
-                    # _print('Unrequested packet found!!!')
-                    # _hexDump(header_bytes, 'o')
-                    # _hexDump(output_data, 'o')
-                    self.read_queue.appendleft((uid, cmd_byte))
-                self.read_lock.release()
+            self._dispatchResponse(cmd_echo, header_list, output_data)
+
+    def _readDataWiredFramed(self):
+        # Drains everything waiting on the port with as few reads as possible
+        # and splits out every complete packet, keeping partial frames in the
+        # buffer for the next pass
+        _serial_port = self.serial_port
+        fd = getattr(_serial_port, 'fd', None)
+        if fd is not None:
+            # POSIX ports can be drained straight from the file descriptor
+            # with one wait and one read
+            if not select.select([fd], [], [], _serial_port.timeout)[0]:
+                return
+            read_bytes = os.read(fd, _frame_read_size)
+        else:
+            in_waiting = _serial_port.in_waiting
+            if in_waiting:
+                read_bytes = _serial_port.read(in_waiting)
+            else:
+                read_bytes = _serial_port.read(1)  # block until data arrives
+                in_waiting = _serial_port.in_waiting
+                if in_waiting:
+                    read_bytes += _serial_port.read(in_waiting)
+        if read_bytes:
+            self.device_stats.bytes_read += len(read_bytes)
+            self._feedFramedData(read_bytes)
+
+    def _feedFramedData(self, read_bytes):
+        frame_buffer = self.frame_buffer
+        frame_buffer += read_bytes
+        fail_idx, time_idx, echo_idx, ck_idx, log_idx, sn_idx, size_idx = self.frame_idx
+        if size_idx is None or echo_idx is None:
+            raise Exception("Framed reads need the command echo and data length header fields")
+        header_size = self.header_parse.size
+        unpack_from = self.header_parse.unpack_from
+        timestamp_mode = self.timestamp_mode
+        batch_callback_func = self.batch_callback_func
+        end = len(frame_buffer)
+        offset = 0
+        while end - offset >= header_size:
+            if batch_callback_func is not None:
+                batch_end = self._parseStreamBatch(frame_buffer, offset, end)
+                if batch_end != offset:
+                    offset = batch_end
+                    self.frame_synced = True
+                    continue
+            header_data = unpack_from(frame_buffer, offset)
+            data_start = offset + header_size
+            data_end = data_start + header_data[size_idx]
+            if ck_idx is not None:
+                valid = self._checkFrame(frame_buffer, offset, end, header_data)
+                if valid is None:
+                    break
+                if not valid:
+                    self._resyncFrame()
+                    offset += 1
+                    continue
+            elif data_end > end:
+                break
+            if timestamp_mode == TSS_TIMESTAMP_SENSOR:
+                timestamp = header_data[time_idx]
+            elif timestamp_mode == TSS_TIMESTAMP_SYSTEM:
+                timestamp = time.perf_counter() * 1000000
+            else:
+                timestamp = None
+            output_data = bytes(frame_buffer[data_start:data_end])
+            offset = data_end
+            cmd_echo = header_data[echo_idx]
+            if cmd_echo == 0xff:
+                if output_data:
+                    self._parseStreamData(timestamp, output_data)
+                continue
+            header_list = padProtocolHeader(header_data, self.header_idx_lst, timestamp)
+            self._dispatchResponse(cmd_echo, header_list, output_data)
+        if offset:
+            del frame_buffer[:offset]
+
+    def _readDataWiredZeroCopy(self):
+        # Reads into the preallocated frame buffer and decodes stream packets
+        # from it in place, without slicing out a bytes object per packet
+        _serial_port = self.serial_port
+        frame_view = self.frame_view
+        frame_end = self.frame_end
+        fd = getattr(_serial_port, 'fd', None)
+        if fd is not None:
+            if not select.select([fd], [], [], _serial_port.timeout)[0]:
                 return
+            read_count = os.readv(fd, [frame_view[frame_end:]])
+        else:
+            read_bytes = _serial_port.read(max(1, min(_serial_port.in_waiting, len(frame_view) - frame_end)))
+            read_count = len(read_bytes)
+            frame_view[frame_end:frame_end + read_count] = read_bytes
+        if not read_count:
+            return
+        self.device_stats.bytes_read += read_count
+        self._parseZeroCopyFrames(frame_end + read_count)
+
+    def _parseZeroCopyFrames(self, end):
+        frame_view = self.frame_view
+        fail_idx, time_idx, echo_idx, ck_idx, log_idx, sn_idx, size_idx = self.frame_idx
+        if size_idx is None or echo_idx is None:
+            raise Exception("Framed reads need the command echo and data length header fields")
+        header_size = self.header_parse.size
+        unpack_from = self.header_parse.unpack_from
+        timestamp_mode = self.timestamp_mode
+        batch_callback_func = self.batch_callback_func
+        offset = 0
+        while end - offset >= header_size:
+            if batch_callback_func is not None:
+                batch_end = self._parseStreamBatch(frame_view, offset, end)
+                if batch_end != offset:
+                    offset = batch_end
+                    self.frame_synced = True
+                    continue
+            header_data = unpack_from(frame_view, offset)
+            data_start = offset + header_size
+            data_end = data_start + header_data[size_idx]
+            if ck_idx is not None:
+                valid = self._checkFrame(frame_view, offset, end, header_data)
+                if valid is None:
+                    break
+                if not valid:
+                    self._resyncFrame()
+                    offset += 1
+                    continue
+            elif data_end > end:
+                break
+            if timestamp_mode == TSS_TIMESTAMP_SENSOR:
+                timestamp = header_data[time_idx]
+            elif timestamp_mode == TSS_TIMESTAMP_SYSTEM:
+                timestamp = time.perf_counter() * 1000000
+            else:
+                timestamp = None
+            offset = data_end
+            cmd_echo = header_data[echo_idx]
+            if cmd_echo == 0xff:
+                if data_end > data_start:
+                    self._parseStreamDataInto(timestamp, frame_view, data_start)
+                continue
+            header_list = padProtocolHeader(header_data, self.header_idx_lst, timestamp)
+            self._dispatchResponse(cmd_echo, header_list, frame_view[data_start:data_end].tobytes())
+        remain = end - offset
+        if remain == len(frame_view):
+            remain = 0  # a full buffer without a complete packet is garbage
+        elif offset and remain:
+            frame_view[:remain] = frame_view[offset:end]
+        self.frame_end = remain
+
+    def _checkFrame(self, frame_buffer, offset, end, header_data):
+        # Checksum mode test of the packet at offset: None if it is not all in
+        # the buffer yet, otherwise whether it is a real packet. A header that
+        # cannot be real is rejected before waiting on its data, so a corrupt
+        # length does not stall the reader. A packet that lost a zero byte
+        # still sums right, so the next header, when already read, has to
+        # look real too.
+        if not self._frameHeaderValid(frame_buffer, offset, header_data):
+            return False
+        fail_idx, time_idx, echo_idx, ck_idx, log_idx, sn_idx, size_idx = self.frame_idx
+        data_start = offset + self.header_parse.size
+        data_end = data_start + header_data[size_idx]
+        if data_end > end:
+            return None
+        if sum(frame_buffer[data_start:data_end]) & 0xff != header_data[ck_idx]:
+            return False
+        if data_end + self.header_parse.size <= end:
+            next_header = self.header_parse.unpack_from(frame_buffer, data_end)
+            if not self._frameHeaderValid(frame_buffer, data_end, next_header):
+                return False
+        self.frame_synced = True
+        return True
+
+    def _frameHeaderValid(self, frame_buffer, offset, header_data):
+        fail_idx, time_idx, echo_idx, ck_idx, log_idx, sn_idx, size_idx = self.frame_idx
+        if fail_idx is not None and frame_buffer[offset] > 1:
+            return False
+        cmd_echo = header_data[echo_idx]
+        data_size = header_data[size_idx]
+        if cmd_echo == 0xff:
+            stream_parse = self.stream_parse
+            return stream_parse is None or data_size == stream_parse.size
+        return self.command_pipeline.expects(cmd_echo, None, data_size)
+
+    def _resyncFrame(self):
+        # Called for every byte skipped while looking for the next packet, a
+        # run of them counts as one resync
+        device_stats = self.device_stats
+        if self.frame_synced:
+            self.frame_synced = False
+            device_stats.resyncs += 1
+        device_stats.resync_bytes += 1
+
+    def _dispatchResponse(self, cmd_echo, header_list, output_data):
+        self.device_stats.response_count += 1
+        if not self.command_pipeline.resolve(cmd_echo, header_list[4], header_list, output_data):
             # _print('Unrequested packet found!!!')
-            # _hexDump(header_bytes, 'o')
             # _hexDump(output_data, 'o')
-            self.read_lock.release()
+            pass
 
     def getLatestStreamData(self, timeout):
         self.latest_lock.acquire()
@@ -1075,19 +3141,392 @@ class _TSSensor(_TSBase):
         self.latest_lock.wait(timeout)
         self.latest_lock.release()
         if self.new_data:
+            if self.read_mode == TSS_READ_ZERO_COPY:
+                return self.stream_last_data.copy()
             return self.stream_last_data
 
-    def setNewDataCallBack(self, callback):
+    def iterStream(self, maxsize=_stream_queue_size, block=True, timeout=None, batch=None,
+                   overflow=TSS_OVERFLOW_DROP_OLDEST):
+        """ Returns an iterator over every stream sample from now on, in the
+            order they arrive, as (timestamp, data) tuples. Samples are queued
+            by the reader thread, so none are lost between iterations unless
+            more than maxsize pile up; the iterator's dropped attribute counts
+            those.
+
+            Args:
+                maxsize: The number of samples queued for the iterator
+                    (default is 1024)
+                block: Wait for the next sample instead of stopping when none
+                    is queued (default is True)
+                timeout: Stop when no sample arrives within this many seconds
+                    (default is None, wait forever)
+                batch: Yield lists of up to this many queued samples instead
+                    of single samples (default is None)
+                overflow: One of the TSS_OVERFLOW_* policies (default is
+                    TSS_OVERFLOW_DROP_OLDEST)
+        """
+        stream_queue = TSStreamQueue(maxsize, overflow)
+        self.stream_queues = self.stream_queues + [stream_queue]
+        return TSStreamIterator(self, stream_queue, block, timeout, batch)
+
+    def streamingSession(self, slots, interval=0, duration=0xFFFFFFFF, delay=0,
+                         filter_mode=None, calibration_mode=None, compass_enabled=None,
+                         gyro_autocalibrate=False, record_data=False, close_on_exit=True):
+        """ Returns a TSStreamingSession, a context manager that sets the
+            streaming slots, timing, filter mode and calibration mode once,
+            checks them with a single read-back and starts streaming. Leaving
+            it stops streaming and closes the sensor.
+
+            Example:
+                with sensor.streamingSession(['getTaredOrientationAsQuaternion'],
+                                             filter_mode=1) as session:
+                    for timestamp, data in sensor.iterStream(timeout=1.0):
+                        ...
+        """
+        return TSStreamingSession(self, slots, interval, duration, delay, filter_mode,
+                                  calibration_mode, compass_enabled, gyro_autocalibrate,
+                                  record_data, close_on_exit)
+
+    def _streamLink(self):
+        # The baud rate and response header size of the link the stream is
+        # sent over, and the (packet_size, interval) of other streams on it
+        return self.baudrate, self.header_parse.size, []
+
+    def _streamLinkPort(self):
+        return self.port_name
+
+    def _streamLoad(self):
+        interval = 0
+        if self.stream_timing is not None:
+            interval = self.stream_timing[0]
+        return streamPayloadSize(self.command_dict, self.stream_slot_cmds), interval
+
+    def planStreaming(self, interval=None, slots=None, baudrate=None):
+        """ Returns a TSStreamPlan for streaming from this sensor, checking
+            that the stream packets at the requested rate fit the baud rate
+            of the link along with every other stream on it. Nothing is sent
+            to the sensor.
+
+            Args:
+                interval: The streaming interval in microseconds (default is
+                    the current streaming timing)
+                slots: A list of streaming slot command names (default is the
+                    current streaming slots)
+                baudrate: The baud rate to plan for (default is the link's)
+        """
+        link_baudrate, header_size, other_streams = self._streamLink()
+        payload_size, current_interval = self._streamLoad()
+        if slots is not None:
+            payload_size = streamPayloadSize(self.command_dict, slots)
+        if interval is None:
+            interval = current_interval
+        if baudrate is None:
+            baudrate = link_baudrate
+        streams = [(header_size + payload_size, interval)] + other_streams
+        return planStreamingLink(streams, baudrate)[0]
+
+    def _checkStreamPlan(self):
+        policy = _stream_plan_policy
+        if policy == TSS_PLAN_IGNORE or self.stream_timing is None:
+            return
+        if not self.stream_timing[0] and not _plan_unpaced_streams:
+            return
+        if isUSBCDCPort(self._streamLinkPort()):
+            return
+        plan = self.planStreaming()
+        if plan.fits:
+            return
+        message = ("%s cannot stream %d byte packets at %.1f Hz over %d baud, at most %.1f Hz fits "
+                   "(an interval of %s us or %s baud would)" % (
+                       self, plan.packet_size, plan.requested_hz, plan.baudrate, plan.max_hz,
+                       plan.min_interval, plan.suggested_baudrate))
+        if policy == TSS_PLAN_RAISE:
+            raise Exception(message)
+        if policy == TSS_PLAN_ADJUST and plan.min_interval is not None:
+            interval, duration, delay = self.stream_timing
+            _print("Adjusting the streaming interval to %d us: %s" % (plan.min_interval, message))
+            if self.setStreamingTiming(plan.min_interval, duration, delay):
+                return
+        warnings.warn(message, RuntimeWarning, stacklevel=3)
+
+    def _traceStreamQueues(self, tracer):
+        # How far the stream consumers are behind the reader, and how many
+        # samples they dropped
+        depth = 0
+        dropped = 0
+        for stream_queue in self.stream_queues:
+            depth += len(stream_queue)
+            dropped += stream_queue.dropped
+        for worker in (self.callback_worker, self.batch_callback_worker, self.record_worker):
+            if worker is not None:
+                depth += len(worker.stream_queue)
+                dropped += worker.dropped
+        tracer.counter("stream queues " + self.serial_number_hex, {'depth': depth, 'dropped': dropped})
+
+    def _removeStreamQueue(self, stream_queue):
+        # The reader thread iterates stream_queues, so it is replaced rather
+        # than changed in place
+        if stream_queue in self.stream_queues:
+            self.stream_queues = [q for q in self.stream_queues if q is not stream_queue]
+
+    def close(self):
+        for stream_queue in self.stream_queues:
+            stream_queue.close()
+        self._stopRecordWorker()
+        super(_TSSensor, self).close()
+
+    def setNewDataCallBack(self, callback, threaded=True, maxsize=_stream_queue_size,
+                           overflow=TSS_OVERFLOW_DROP_OLDEST):
+        """ Sets a function called with every (timestamp, data) stream sample.
+            By default the callback runs on a TSCallbackWorker thread fed
+            through a queue of maxsize samples, so it cannot stall the reader;
+            overflow picks what happens when the callback falls that far
+            behind. With threaded off it is called on the reader thread, and
+            in TSS_READ_ZERO_COPY mode receives the borrowed stream sample.
+        """
+        # The reader calls callback_func only without a worker, so the new
+        # worker and function are in place before the old worker goes
+        new_worker = None
+        if callback is not None and threaded:
+            new_worker = TSCallbackWorker(callback, maxsize, overflow)
         self.callback_func = callback
+        worker = self.callback_worker
+        self.callback_worker = new_worker
+        if worker is not None:
+            worker.close()
+
+    def setNewDataBatchCallBack(self, callback, threaded=True, maxsize=_stream_queue_size,
+                                overflow=TSS_OVERFLOW_DROP_OLDEST):
+        """ Sets a function that receives stream data in batches. Every run of
+            back-to-back stream packets the reader finds in one read is
+            decoded with a single np.frombuffer call and passed on as one
+            structured array with the fields of getStreamPacketDtype(). While
+            set, it replaces the per-sample new data callback. Batches need
+            one of the framed read modes, so the header read mode is switched
+            to TSS_READ_FRAMED. Like setNewDataCallBack, the callback runs on
+            its own thread unless threaded is off, with maxsize and overflow
+            counted in batches.
+        """
+        if callback is not None:
+            _requireNumpy()
+            if self.read_mode == TSS_READ_HEADER:
+                self.setReadMode(TSS_READ_FRAMED)
+        new_worker = None
+        if callback is not None and threaded:
+            new_worker = TSCallbackWorker(callback, maxsize, overflow)
+        self.batch_callback_func = callback
+        worker = self.batch_callback_worker
+        self.batch_callback_worker = new_worker
+        if worker is not None:
+            worker.close()
+
+    def getCallbackDropCount(self):
+        """ Returns the number of samples, and batches, the callback workers
+            dropped because their queues were full.
+        """
+        count = 0
+        for worker in (self.callback_worker, self.batch_callback_worker):
+            if worker is not None:
+                count += worker.dropped
+        return count
+
+    def getStreamPacketDtype(self):
+        """ Returns the structured NumPy dtype of one stream packet with the
+            current protocol header and streaming slots. It matches the
+            big-endian struct format of stream_parse with the header fields
+            (fail_byte, timestamp, cmd_echo, data_size, ...) in front.
+        """
+        if self.stream_packet_dtype is None:
+            if self.stream_parse is None:
+                self._generateStreamParse()
+            self.stream_packet_dtype = streamPacketDtype(self.header_idx_lst, self.command_dict,
+                                                         self.stream_slot_cmds)
+        return self.stream_packet_dtype
+
+    def decodeStreamCapture(self, data):
+        """ Decodes a raw capture of this sensor's wired stream into one
+            structured array of stream packets. Runs of back-to-back stream
+            packets are decoded a block at a time with np.frombuffer, and any
+            command responses in between are skipped.
 
-    def startRecordingData(self):
+            @param data: A bytes-like object that starts on a packet boundary.
+
+            @return: A structured array with the fields of
+                getStreamPacketDtype().
+        """
+        np = _requireNumpy()
+        packet_dtype = self.getStreamPacketDtype()
+        size_idx = self.frame_idx[6]
+        header_size = self.header_parse.size
+        payload_size = self.stream_parse.size
+        runs = []
+        offset = 0
+        end = len(data)
+        while end - offset >= header_size:
+            packets = streamPacketRun(data, packet_dtype, payload_size, offset, end)
+            if len(packets):
+                runs.append(packets)
+                offset += len(packets) * packet_dtype.itemsize
+                continue
+            header_data = self.header_parse.unpack_from(data, offset)
+            offset += header_size + header_data[size_idx]
+        if not runs:
+            return np.zeros(0, packet_dtype)
+        # concatenate would give the fields native byte order
+        return np.concatenate(runs).astype(packet_dtype)
+
+    def setReadMode(self, mode):
+        """ Selects how the reader thread pulls packets off the serial port.
+
+            @param mode: TSS_READ_HEADER reads each packet's header and data
+                with two blocking reads. TSS_READ_FRAMED drains everything
+                waiting on the port into a reusable buffer and splits out all
+                complete packets in one pass, which uses far fewer reads at
+                high streaming rates. TSS_READ_ZERO_COPY frames the same way
+                but reads into a preallocated buffer and decodes stream data
+                in place into a borrowed TSStreamSample, which is what an
+                unthreaded new data callback then receives. It saves the
+                packet copies and header tuples of the other modes, not every
+                allocation: decoding still unpacks the values once per
+                sample, and stream iterators, threaded callbacks and list
+                recording keep samples past the read, so they share one
+                copied (timestamp, data) tuple per sample. A ring-buffer
+                recorder copies the raw bytes instead.
+
+            @return: True if the mode is valid and was set.
+        """
+        if mode not in (TSS_READ_HEADER, TSS_READ_FRAMED, TSS_READ_ZERO_COPY):
+            _print("Invalid read mode: {0}".format(mode))
+            return False
+        if mode == self.read_mode:
+            return True
+        # The frame buffers belong to the reader, so it is stopped while they
+        # are replaced
+        hub = self.reader_hub
+        reading = self.data_loop
+        if reading:
+            self._stopReadLoop()
+        self.read_mode = mode
+        self._setupFrameParse()
+        if reading:
+            self._startReadLoop(hub)
+        return True
+
+    def setChecksumMode(self, enabled):
+        """ Turns the checksum field of the response header on or off. With
+            it on, the reader checks every packet's header against what can
+            be pending and its data against the checksum, and when either is
+            wrong scans forward byte by byte for the next valid packet instead
+            of trusting a corrupt length. Packets are then always framed, as
+            in TSS_READ_FRAMED, unless TSS_READ_ZERO_COPY is set. Lost framing
+            shows up as resyncs in stats().
+
+            @param enabled: True to verify checksums.
+
+            @return: True if the sensor accepted the new response header.
+        """
+        enabled = bool(enabled)
+        if self.protocol_args.get('checksum', False) == enabled:
+            return True
+        # The header is changed with direct reads, so the reader is stopped
+        # while that happens
+        hub = self.reader_hub
+        self._stopReadLoop()
+        protocol_args = self.protocol_args
+        header = (self.header_parse, self.header_idx_lst, self.header_bitfield)
+        self.protocol_args = dict(protocol_args, checksum=enabled)
+        success = True
+        try:
+            self._setupProtocolHeader(**self.protocol_args)
+        except:
+            _print("Failed to set the checksum mode")
+            success = False
+            self.protocol_args = protocol_args
+            try:
+                self._setupProtocolHeader(**protocol_args)
+            except:
+                self.header_parse, self.header_idx_lst, self.header_bitfield = header
+        finally:
+            self.stream_packet_dtype = None
+            self._setupFrameParse()
+            self._startReadLoop(hub)
+        return success
+
+    def getChecksumMode(self):
+        return self.protocol_args.get('checksum', False)
+
+    def borrowLatestStreamSample(self):
+        """ Returns the TSStreamSample the zero-copy reader decodes into. The
+            sample is shared with the reader thread and changes as new data
+            arrives, so read what is needed from it right away or copy() it.
+        """
+        return self.stream_sample
+
+    def getReadMode(self):
+        return self.read_mode
+
+    def startRecordingData(self, capacity=None, overflow=TSS_RECORD_OVERWRITE):
+        """ Starts recording stream data into stream_data.
+
+            @param capacity: An optional number of samples to keep. When given,
+                stream_data becomes a TSStreamRecorder ring buffer backed by a
+                NumPy structured array whose fields follow the streaming slots,
+                instead of a list that grows without bound.
+
+            @param overflow: What a full ring buffer does with a new sample,
+                either TSS_RECORD_OVERWRITE to drop the oldest sample or
+                TSS_RECORD_BLOCK to wait until the samples are read out. A
+                blocking recorder is fed through a TSCallbackWorker so only
+                that worker waits, never the reader thread; samples that
+                pile up beyond its queue are dropped and counted in
+                stats() as stream_dropped.
+        """
+        if capacity is not None:
+            self._stopRecordWorker()
+            if self.stream_recorder is not None:
+                self.stream_recorder.close()
+            self.stream_recorder = TSStreamRecorder(self.command_dict, self.stream_slot_cmds,
+                                                    capacity, overflow)
+            self.stream_data = self.stream_recorder
+        self._startRecordWorker()
         self.record_data = True
 
+    def _startRecordWorker(self):
+        recorder = self.stream_recorder
+        if recorder is None or recorder.overflow != TSS_RECORD_BLOCK or self.record_worker is not None:
+            return
+        recorder.reopen()
+        self.record_worker = TSCallbackWorker(self._recordQueued, overflow=TSS_OVERFLOW_DROP_NEWEST)
+
+    def _stopRecordWorker(self):
+        # Closing the recorder releases a worker waiting for room
+        worker = self.record_worker
+        if worker is None:
+            return
+        self.record_worker = None
+        if self.stream_recorder is not None:
+            self.stream_recorder.close()
+        worker.close()
+
+    def _recordQueued(self, item):
+        recorder = self.stream_recorder
+        if recorder is None:
+            return
+        is_batch, timestamp, data = item
+        if is_batch:
+            recorder.recordBatch(timestamp, data)
+        else:
+            recorder.record(timestamp, data)
+
     def stopRecordingData(self):
         self.record_data = False
+        self._stopRecordWorker()
 
     def clearRecordingData(self):
-        self.stream_data = []
+        if self.stream_recorder is not None:
+            self.stream_recorder.clear()
+        else:
+            self.stream_data = []
 
     # Convenience functions to replace commands 244(0xf4) and 245(0xf5)
     def setGlobalAxis(self, hid_type, config_axis, local_axis, global_axis, deadzone, scale, power):
@@ -1453,7 +3892,7 @@ class _TSSensor(_TSBase):
                 if not fail_byte:
                     while self.getSerialNumber():
                         pass
-                    self.close()
+                    self._closePort()
                     time.sleep(5)
                     while self.reconnect():
                         pass
@@ -1548,7 +3987,7 @@ class _TSSensor(_TSBase):
                 if not fail_byte:
                     while self.getSerialNumber():
                         pass
-                    self.close()
+                    self._closePort()
                     time.sleep(5)
                     while self.reconnect():
                         pass
@@ -1588,6 +4027,8 @@ class _TSSensor(_TSBase):
         fail_byte, timestamp, filler = self.writeRead('_setStreamingSlots', slot_bytes)
         self.stream_slot_cmds = slots
         self._generateStreamParse()
+        if not fail_byte:
+            self._storeDeviceCache()
         return not fail_byte
 
     ##  81(0x51)
@@ -1605,6 +4046,7 @@ class _TSSensor(_TSBase):
                     need_update = True
             if need_update:
                 self._generateStreamParse()
+                self._storeDeviceCache()
             return self.stream_slot_cmds
 
     ##  82(0x52)
@@ -1638,6 +4080,7 @@ class _TSSensor(_TSBase):
     ##  85(0x55)
     def stopStreaming(self):
         self.record_data = False
+        self.stream_active = False
         fail_byte, timestamp, slot_bytes = self.writeRead('stopStreaming')
         return not fail_byte
 
@@ -1646,7 +4089,10 @@ class _TSSensor(_TSBase):
         self.record_data = start_record
         if self.stream_parse is None:
             self._generateStreamParse()
+        self._checkStreamPlan()
         fail_byte, timestamp, slot_bytes = self.writeRead('startStreaming')
+        if not fail_byte:
+            self.stream_active = True
         return not fail_byte
 
     ## generated functions USB and WL_ and EM_ and DL_ and BT_
@@ -2437,7 +4883,7 @@ class TSUSBSensor(_TSSensor):
         'getButtonState': (0xfa, 1, '>B', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["USB", "USB-HH", "MUSB", "MUSB-HH", "USBWT", "USBWT-HH"]
 
@@ -2507,7 +4953,7 @@ class TSWLSensor(_TSSensor):
         'getButtonState': (0xfa, 1, '>B', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["WL", "WL-HH", "MWL"]
 
@@ -2601,18 +5047,42 @@ class TSWLSensor(_TSSensor):
             if self.stream_slot_cmds is not None:
                 self.setStreamingSlots(*self.stream_slot_cmds)
 
-    def close(self):
+    def _closePort(self):
         if self.serial_port is not None:
-            super(TSWLSensor, self).close()
+            super(TSWLSensor, self)._closePort()
 
     def _wirlessWriteRead(self, command, input_list=None):
         result = (True, None, None)
         for i in range(_wireless_retries + 1):
+            if i:
+                self.device_stats.retries += 1
+                time.sleep(self._retryDelay(i - 1, command))
             result = self.dongle.faWriteRead(self.logical_id, command, input_list)
             if not result[0]:
                 break
         return result
 
+    def _statsPipeline(self):
+        if getattr(self, 'wireless_com', False):
+            return self.dongle.command_pipeline, self.logical_id
+        return super(TSWLSensor, self)._statsPipeline()
+
+    def _retryDelay(self, attempt, command):
+        if getattr(self, 'wireless_com', False):
+            return self.dongle.command_pipeline.retryDelay(attempt, self.command_dict[command][0], self.logical_id)
+        return super(TSWLSensor, self)._retryDelay(attempt, command)
+
+    def _streamLink(self):
+        if getattr(self, 'wireless_com', False):
+            dongle = self.dongle
+            return dongle.baudrate, dongle.header_parse.size, dongle._streamLoads(exclude=self)
+        return super(TSWLSensor, self)._streamLink()
+
+    def _streamLinkPort(self):
+        if getattr(self, 'wireless_com', False):
+            return self.dongle.port_name
+        return super(TSWLSensor, self)._streamLinkPort()
+
     def switchToWirelessMode(self):
         if self.dongle and self.logical_id is not None:
             self.writeRead = self._wirlessWriteRead
@@ -2748,7 +5218,9 @@ class TSDongle(_TSBase):
         'getMouseLogicalID': (0xf3, 1, '>B', 0, None, 1)
     })
 
+    reverse_command_dict = _ReverseCommandDict()
     wl_command_dict = TSWLSensor.command_dict.copy()
+    max_commands_in_flight = 15
 
     _device_types = ["DNG"]
 
@@ -2816,8 +5288,13 @@ class TSDongle(_TSBase):
         self.startStreaming()
 
     def reconnect(self):
-        self.close()
-        if not tryPort(self.port_name):
+        self._closePort()
+        port_state = tryPort(self.port_name)
+        if port_state is False:
+            # The check still has the port open
+            _print("tryport timed out")
+            return False
+        if not port_state:
             _print("tryport fail")
         try:
             serial_port = serial.Serial(self.port_name, baudrate=self.baudrate, timeout=0.5, writeTimeout=0.5)
@@ -2856,6 +5333,8 @@ class TSDongle(_TSBase):
 
     def _setupBaseVariables(self):
         self.serial_number_hex = '{0:08X}'.format(self.serial_number)
+        self.read_mode = TSS_READ_HEADER
+        self.device_stats = TSDeviceStats()
         self.wireless_table = [0] * 15
         for i in range(15):
             tmp_id = self.f7WriteRead('getSerialNumberAtLogicalID', i)
@@ -2892,15 +5371,8 @@ class TSDongle(_TSBase):
 
     # Wireless Old Protocol WriteRead
     def f8WriteRead(self, logical_id, command, input_list=None):
-        command_args = self.command_dict[command]
-        cmd_byte, out_len, out_struct, in_len, in_struct, compatibility = command_args
-        packed_data = None
-        if in_struct:
-            if type(input_list) in (list, tuple):
-                packed_data = struct.pack(in_struct, *input_list)
-            else:
-                packed_data = struct.pack(in_struct, input_list)
-        write_array = makeWriteArray(0xf8, logical_id, cmd_byte, packed_data)
+        descriptor = getCommandDescriptor(self.command_dict[command])
+        write_array = _makeCommandWriteArray(descriptor, 0xf8, logical_id, input_list)
         self.serial_port.write(write_array)
         rtn_list = []
         output_data = self.serial_port.read(2)
@@ -2912,9 +5384,9 @@ class TSDongle(_TSBase):
                 self.serial_port.read(1)
             else:
                 return True
-            if out_struct:
-                output_data = self.serial_port.read(out_len)
-                rtn_list.append(struct.unpack(out_struct, output_data))
+            if descriptor.out_parse:
+                output_data = self.serial_port.read(descriptor.out_len)
+                rtn_list.append(descriptor.out_parse.unpack(output_data))
             if len(rtn_list) != 1:
                 return rtn_list
             return rtn_list[0]
@@ -2922,97 +5394,77 @@ class TSDongle(_TSBase):
 
     ## Wireless New Protocol WriteRead
     def faWriteRead(self, logical_id, command, input_list=None):
-        global global_counter
-        command_args = self.wl_command_dict[command]
-        cmd_byte, out_len, out_struct, in_len, in_struct, compatibility = command_args
-        if self.compatibility < compatibility:
+        future = self.faWriteReadFuture(logical_id, command, input_list)
+        return self.command_pipeline.wait(future)
+
+    def faWriteReadFuture(self, logical_id, command, input_list=None):
+        """ Sends a command to the wireless sensor at logical_id without
+            waiting for its response. Returns a concurrent.futures.Future that
+            resolves to the (fail_byte, timestamp, data) tuple faWriteRead
+            returns.
+        """
+        descriptor = getCommandDescriptor(self.wl_command_dict[command])
+        if self.compatibility < descriptor.compatibility:
             raise Exception("Firmware for device on ( %s ) is out of date for this function. Recommend updating to latest firmware." % self.serial_port.name)
-        packed_data = None
-        if in_struct:
-            if type(input_list) in (list, tuple):
-                packed_data = struct.pack(in_struct, *input_list)
-            else:
-                packed_data = struct.pack(in_struct, input_list)
-        write_array = makeWriteArray(0xfa, logical_id, cmd_byte, packed_data)
-
-        while len(self.read_queue) > 15:
-            _print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!too many commands!!!!!")
-            time.sleep(0.01)
-        self.read_lock.acquire()
-        uid = global_counter
-        global_counter += 1
+        write_array = _makeCommandWriteArray(descriptor, 0xfa, logical_id, input_list)
         try:
-            self.serial_port.write(write_array)  # release in reader thread
+            return self.command_pipeline.submit(self.serial_port.write, write_array, descriptor,
+                                                self._wirelessCommandResult, logical_id)
         except serial.SerialTimeoutException:
-            self.read_lock.release()
             self.serial_port.close()
             # _print("SerialTimeoutException!!!!")
-            return (True, None, None)
+            return _completedCommand()
         except ValueError:
             try:
                 # _print("trying to open it back up!!!!")
                 self.serial_port.open()
                 # _print("aaand open!!!!")
             except serial.SerialException:
-                self.read_lock.release()
+                pass
             # _print("SerialTimeoutException!!!!")
-            return (True, None, None)
-        queue_packet = (uid, cmd_byte)
-        timeout_time = 0.5 + (len(self.read_queue) * 0.150)  # timeout increases as queue gets larger
-        self.read_queue.append(queue_packet)
-        start_time = time.perf_counter() + timeout_time
-        read_data = None
-        while (timeout_time > 0):
-            self.read_lock.wait(timeout_time)
-            read_data = self.read_dict.get(uid, None)
-
-            if read_data is not None:
-                break
-            timeout_time = start_time - time.perf_counter()
-            # _print("Still waiting {0} {1} {2} {3}".format(uid, command,logical_id, timeout_time))
-        else:
-            # _print("Operation timed out!!!!")
-            try:
-                self.read_queue.remove(queue_packet)
-            except:
-                traceback.print_exc()
-            self.read_lock.release()
-            return (True, None, None)
-        self.read_lock.release()
-        del self.read_dict[uid]
-        header_list, output_data = read_data
+            return _completedCommand()
+
+    def _wirelessCommandResult(self, descriptor, header_list, output_data):
         fail_byte, timestamp, cmd_echo, ck_sum, rtn_log_id, sn, data_size = header_list
-        # _print("RESponse  {0} {1} {2} {3}".format(uid, command,logical_id, timeout_time))
-        if logical_id != rtn_log_id:
-            # _print("!!!!!!!!logical_id != rtn_log_id!!!!!")
-            # _print(header_list)
-            # _hexDump(output_data, 'o')
-            # _print('!!!!!inWaiting = {0}'.format(self.serial_port.inWaiting()))
-            return (True, timestamp, None)
-        if cmd_echo != cmd_byte:
-            # _print("!!!!!!!!cmd_echo!=cmd_byte!!!!!")
-            # _print('cmd_echo= 0x{0:02x} cmd_byte= 0x{1:02x}'.format(cmd_echo, cmd_byte))
-            # _print(header_list)
-            # _hexDump(output_data, 'o')
-            # _print('!!!!!inWaiting = {0}'.format(self.serial_port.inWaiting()))
-            # _print('!!!!!!end')
-            return (True, timestamp, None)
         rtn_list = None
         if not fail_byte:
-            if out_struct:
-                rtn_list = struct.unpack(out_struct, output_data)
-                if len(rtn_list) == 1:
-                    rtn_list = rtn_list[0]
+            if descriptor.out_parse:
+                rtn_list = _unpackCommandOutput(descriptor, output_data)
             elif cmd_echo == 0x54:
-                rtn_list = self[logical_id].stream_parse.unpack(output_data)
+                rtn_list = self[rtn_log_id].stream_parse.unpack(output_data)
                 if len(rtn_list) == 1:
                     rtn_list = rtn_list[0]
-        else:
-            # _print("fail_byte!!!!triggered")
-            pass
-        self._read_data = None
         return (fail_byte, timestamp, rtn_list)
 
+    def _streamingSensors(self):
+        for logical_id, hw_id in enumerate(self.wireless_table):
+            sensor = global_sensorlist.get(hw_id) if hw_id else None
+            if sensor is not None and getattr(sensor, 'dongle', None) is self and sensor.stream_active:
+                yield logical_id, sensor
+
+    def _streamLoads(self, exclude=None):
+        header_size = self.header_parse.size
+        loads = []
+        for logical_id, sensor in self._streamingSensors():
+            if sensor is not exclude:
+                payload_size, interval = sensor._streamLoad()
+                loads.append((header_size + payload_size, interval))
+        return loads
+
+    def planStreaming(self, baudrate=None):
+        """ Returns a dictionary of logical ID to TSStreamPlan for the
+            wireless sensors streaming through this dongle, which share its
+            serial link. Nothing is sent to the dongle.
+
+            Args:
+                baudrate: The baud rate to plan for (default is the dongle's)
+        """
+        if baudrate is None:
+            baudrate = self.baudrate
+        logical_ids = [logical_id for logical_id, sensor in self._streamingSensors()]
+        plans = planStreamingLink(self._streamLoads(), baudrate)
+        return dict(zip(logical_ids, plans))
+
     def __getitem__(self, idx):
         hw_id = self.wireless_table[idx]
         if hw_id == 0:
@@ -3069,10 +5521,9 @@ class TSDongle(_TSBase):
                 # traceback.print_exc()
                 # _print("bad _parseStreamData parse")
                 # _print('!!!!!inWaiting = {0}'.format(self.serial_port.inWaiting()))
-                try:
-                    self.read_lock.release()
-                except:
-                    pass
+                if self.data_loop:  # errors from closing the port are expected
+                    self.device_stats.readerError()
+            self.command_pipeline.expire()
 
     def _readDataWirelessProHeader(self):
         _serial_port = self.serial_port
@@ -3096,30 +5547,18 @@ class TSDongle(_TSBase):
             fail_byte, timestamp, cmd_echo, ck_sum, rtn_log_id, sn, data_size = header_list
             # _print("!!!!fail_byte={0}, cmd_echo={1}, rtn_log_id={2}, data_size={3}".format(fail_byte, cmd_echo, rtn_log_id, data_size))
             output_data = _serial_port.read(data_size)
+            self.device_stats.bytes_read += len(header_bytes) + len(output_data)
 
             if cmd_echo is 0xff:
                 if data_size:
                     self[rtn_log_id]._parseStreamData(timestamp, output_data)
                 return
-            self.read_lock.acquire()
-            # _print('retrning data!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!')
-            if len(self.read_queue):  # here for a bug in the code
-                uid, cmd_byte = self.read_queue.popleft()
-                if cmd_byte == cmd_echo:
-                    self.read_dict[uid] = (header_list, output_data)
-                    self.read_lock.notifyAll()  # dies in 3 seconds if there is a writeRead in wait
-                else:
-                    # _print('Unrequested packet found!!!')
-                    # _hexDump(header_bytes, 'o')
-                    # _hexDump(output_data, 'o')
-                    self.read_queue.appendleft((uid, cmd_byte))
-                self.read_lock.release()
-                return
-            # _print('Unrequested packet found (read_queue is empty)!!!')
-            # _hexDump(header_bytes, 'o')
-            # _hexDump(output_data, 'o')
-            # _print("no status bytes")
-            self.read_lock.release()
+            self.device_stats.response_count += 1
+            if not self.command_pipeline.resolve(cmd_echo, rtn_log_id, header_list, output_data):
+                # _print('Unrequested packet found!!!')
+                # _hexDump(header_bytes, 'o')
+                # _hexDump(output_data, 'o')
+                pass
 
     ## 209(0xd1)
     def setSerialNumberAtLogicalID(self, logical_id, serial_number, timestamp=False):
@@ -3314,7 +5753,7 @@ class TSEMSensor(_TSSensor):
         'getUARTBaudRate': (0xe8, 4, '>I', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["EM", "EM-HH"]
 
@@ -3400,7 +5839,7 @@ class TSDLSensor(_TSSensor):
         'getButtonState': (0xfa, 1, '>B', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["DL", "DL-HH"]
 
@@ -3521,7 +5960,7 @@ class TSBTSensor(_TSSensor):
         'getButtonState': (0xfa, 1, '>B', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["BT", "BT-HH", "MBT"]
 
@@ -3606,11 +6045,11 @@ class TSLXSensor(_TSSensor):
         'getUARTBaudRate': (0xe8, 4, '>I', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["LX", "LX-HH"]
 
-    def __new__(cls, com_port=None, baudrate=_baudrate, timestamp_mode=TSS_TIMESTAMP_SENSOR):
+    def __new__(cls, com_port=None, baudrate=_baudrate, timestamp_mode=TSS_TIMESTAMP_SENSOR, negotiate_baud=False):
         if com_port is None:
             return None
         if com_port:
@@ -3633,6 +6072,79 @@ class TSLXSensor(_TSSensor):
                 return _generateSensorClass(new_inst, serial_port, TSLXSensor._device_types)
         _print('Error serial port was not made')
 
+    def __init__(self, com_port=None, baudrate=_baudrate, timestamp_mode=TSS_TIMESTAMP_SENSOR, negotiate_baud=False):
+        super(TSLXSensor, self).__init__(com_port, baudrate, timestamp_mode)
+        if negotiate_baud:
+            self.negotiateBaudRate()
+
+    def _switchBaudRate(self, baudrate):
+        # The sensor answers at the old rate and then switches, so the port
+        # only follows once the response is in
+        if not self.setUARTBaudRate(baudrate):
+            return False
+        self.serial_port.baudrate = baudrate
+        time.sleep(_baud_settle_time)
+        self.serial_port.flushInput()
+        return True
+
+    def _checkBaudRate(self, hardware_version):
+        expected = ((False, self.serial_number), (False, hardware_version))
+        commands = ('getSerialNumber', 'getHardwareVersionString') * _baud_check_rounds
+        pending = [self.f9WriteReadFuture(command) for command in commands]
+        results = [self.command_pipeline.wait(future) for future in pending]
+        return all((bool(fail_byte), data) == expected[i % 2]
+                   for i, (fail_byte, timestamp, data) in enumerate(results))
+
+    def negotiateBaudRate(self, baudrates=None):
+        """ Switches the sensor and the port to the fastest baud rate that
+            passes a round trip integrity check, trying faster rates first.
+            Each check sends several serial number and hardware version
+            requests back to back and compares them with the answers read at
+            the current rate. When a rate fails, the sensor and the port are
+            switched back before the next one is tried. The rate in use is
+            kept in serial_port_settings, so reconnect() opens the port at
+            it. Returns the baud rate in use afterwards.
+
+            On a USB CDC port (see isUSBCDCPort) the baud rate does not limit
+            the link and setUARTBaudRate only changes the sensor's UART, so
+            nothing is sent and None is returned.
+
+            Args:
+                baudrates: An optional list of baud rates to try (default is
+                    every allowed rate above the current one)
+        """
+        if isUSBCDCPort(self.port_name):
+            _print("{0} is a USB CDC port, not negotiating its baud rate".format(self.port_name))
+            return None
+        original = self.baudrate
+        if baudrates is None:
+            baudrates = [rate for rate in _allowed_baudrates if rate > original]
+        fail_byte, timestamp, hardware_version = self.writeRead('getHardwareVersionString')
+        if fail_byte:
+            return original
+        for baudrate in sorted(baudrates, reverse=True):
+            if baudrate == original or baudrate not in _allowed_baudrates:
+                continue
+            if self._switchBaudRate(baudrate) and self._checkBaudRate(hardware_version):
+                _print("Negotiated {0} baud on {1}".format(baudrate, self.port_name))
+                self.serial_port_settings = self.serial_port.getSettingsDict()
+                return baudrate
+            _print("{0} baud failed the integrity check on {1}".format(baudrate, self.port_name))
+            if not self._restoreBaudRate(original, hardware_version):
+                raise Exception("Lost contact with %s while negotiating its baud rate" % self.port_name)
+        return self.baudrate
+
+    def _restoreBaudRate(self, baudrate, hardware_version):
+        # The sensor may or may not have switched, so it is asked to go back
+        # at the new rate first and then at the original one
+        for i in range(2):
+            self._switchBaudRate(baudrate)
+            self.serial_port.baudrate = baudrate
+            self.baudrate = baudrate
+            if self._checkBaudRate(hardware_version):
+                return True
+        return False
+
     ## 231(0xe7)
     def setUARTBaudRate(self, baud_rate, timestamp=False):
         fail_byte, t_stamp, data = self.writeRead('_setUARTBaudRate', baud_rate)
@@ -3684,7 +6196,7 @@ class TSNANOSensor(_TSSensor):
         'getUARTBaudRate': (0xe8, 4, '>I', 0, None, 1)
     })
 
-    reverse_command_dict = dict(map(lambda x: [x[1][0], x[0]], command_dict.items()))
+    reverse_command_dict = _ReverseCommandDict()
 
     _device_types = ["Nano", "NANO-HH"]
 
@@ -3752,4 +6264,195 @@ class TSNANOSensor(_TSSensor):
 
 ## END generated functions Nano
 
+
+class TSDeviceMonitor(object):
+    """ Attaches sensors as they are plugged in and closes them when they are
+        unplugged.
+
+        On Linux the monitor waits on inotify events from /dev, elsewhere it
+        falls back to scanning getComPorts every poll_interval seconds.
+        Sensors are created through the normal constructor, so a sensor that
+        is plugged back in gets its previous instance back from
+        global_sensorlist with its settings and callbacks.
+
+        Args:
+            on_attach: A function called with each sensor after it is opened
+            on_detach: A function called with each sensor after it is closed
+            filter: The TSS_FIND flags of the devices to attach (default is
+                TSS_FIND_LX)
+            sensor_class: The class used to open the attached devices (default
+                is TSLXSensor)
+            settle_time: Seconds to wait after a port appears before opening
+                it, giving udev time to set its permissions (default is 0.25)
+            poll_interval: Seconds between port scans where inotify is not
+                available (default is 1.0)
+    """
+
+    def __init__(self, on_attach=None, on_detach=None, filter=TSS_FIND_LX, sensor_class=TSLXSensor,
+                 settle_time=_hotplug_settle_time, poll_interval=_hotplug_poll_interval):
+        self.on_attach = on_attach
+        self.on_detach = on_detach
+        self.filter = filter
+        self.sensor_class = sensor_class
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.sensors = {}
+        self.pending = {}
+        self.failed = set()
+        self.lock = threading.Condition(threading.Lock())
+        self.stopping = threading.Event()
+        self.watcher = None
+        self.wake_pipe = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        if sys.platform.startswith('linux'):
+            try:
+                self.watcher = TSPortWatcher()
+                self.wake_pipe = os.pipe()
+            except OSError:
+                _print("inotify is not available, scanning for ports instead")
+                self.watcher = None
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._monitorLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """ Stops watching for devices. Attached sensors are left open. """
+        if self.thread is None:
+            return
+        self.stopping.set()
+        if self.wake_pipe is not None:
+            os.write(self.wake_pipe[1], b'\0')
+        self.thread.join()
+        self.thread = None
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        if self.wake_pipe is not None:
+            os.close(self.wake_pipe[0])
+            os.close(self.wake_pipe[1])
+            self.wake_pipe = None
+
+    def getSensors(self):
+        with self.lock:
+            return list(self.sensors.values())
+
+    def waitForSensor(self, timeout=None):
+        """ Returns the first attached sensor, waiting up to timeout seconds
+            for one to be plugged in. Returns None on timeout.
+        """
+        with self.lock:
+            end_time = None
+            if timeout is not None:
+                end_time = time.time() + timeout
+            while not self.sensors:
+                if end_time is None:
+                    self.lock.wait()
+                else:
+                    remaining = end_time - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.lock.wait(remaining)
+            return next(iter(self.sensors.values()))
+
+    def _matchingPorts(self):
+        return [port.com_port for port in getComPorts(filter=self.filter)]
+
+    def _monitorLoop(self):
+        for port_name in self._matchingPorts():
+            self.pending[port_name] = (0, 0)
+        while not self.stopping.is_set():
+            timeout = self.poll_interval
+            if self.pending:
+                next_time = min(due_time for due_time, attempts in self.pending.values())
+                timeout = max(0, min(timeout, next_time - time.time()))
+            if self.watcher is not None:
+                if self.pending:
+                    readable = select.select([self.watcher, self.wake_pipe[0]], [], [], timeout)[0]
+                else:
+                    readable = select.select([self.watcher, self.wake_pipe[0]], [], [])[0]
+                if self.watcher in readable:
+                    for port_name, present in self.watcher.read():
+                        if present:
+                            self.failed.discard(port_name)
+                            if port_name not in self.sensors:
+                                self.pending[port_name] = (time.time() + self.settle_time, 0)
+                        else:
+                            self._detach(port_name)
+            else:
+                self.stopping.wait(timeout)
+                port_list = self._matchingPorts()
+                for port_name in list(self.sensors):
+                    if port_name not in port_list:
+                        self._detach(port_name)
+                self.failed.intersection_update(port_list)
+                for port_name in port_list:
+                    if port_name in self.failed:
+                        continue
+                    if port_name not in self.sensors and port_name not in self.pending:
+                        self.pending[port_name] = (time.time() + self.settle_time, 0)
+            if not self.stopping.is_set():
+                self._attachDue()
+
+    def _attachDue(self):
+        now = time.time()
+        due_list = [port_name for port_name in self.pending if self.pending[port_name][0] <= now]
+        if not due_list:
+            return
+        port_list = self._matchingPorts()
+        for port_name in due_list:
+            due_time, attempts = self.pending.pop(port_name)
+            if port_name in self.sensors or port_name not in port_list:
+                continue
+            try:
+                sensor = self.sensor_class(com_port=port_name)
+            except:
+                _print("Could not open {0}: {1}".format(port_name, sys.exc_info()[1]))
+                sensor = None
+            if sensor is None:
+                if attempts + 1 < _hotplug_attach_retries:
+                    self.pending[port_name] = (time.time() + self.settle_time * 2 ** attempts, attempts + 1)
+                else:
+                    self.failed.add(port_name)
+                continue
+            with self.lock:
+                self.sensors[port_name] = sensor
+                self.lock.notify_all()
+            if self.on_attach is not None:
+                try:
+                    self.on_attach(sensor)
+                except:
+                    traceback.print_exc()
+
+    def _detach(self, port_name):
+        self.pending.pop(port_name, None)
+        with self.lock:
+            sensor = self.sensors.pop(port_name, None)
+        if sensor is None:
+            return
+        try:
+            sensor.close()
+        except:
+            _print("Error closing the sensor on {0}".format(port_name))
+        if self.on_detach is not None:
+            try:
+                self.on_detach(sensor)
+            except:
+                traceback.print_exc()
+
 global_broadcaster = Broadcaster()
+
+if os.environ.get('TSS_TRACE'):
+    startTrace(os.environ['TSS_TRACE'])
+    atexit.register(stopTrace)
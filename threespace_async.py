@@ -0,0 +1,487 @@
+#!/usr/bin/env python
+
+""" This module is an asyncio API module for ThreeSpace devices.
+
+    The ThreeSpace Async module drives wired ThreeSpace sensors from an
+    asyncio event loop instead of a read thread per device. The serial port
+    is used non-blocking and its file descriptor is watched with
+    loop.add_reader, so one loop can serve many sensors. Every command in the
+    matching threaded class's command_dict is available as a coroutine method
+    with the same name, and commands can be kept in flight together with
+    asyncio.gather. Needs an event loop that supports add_reader, which
+    rules out the Windows proactor loop.
+"""
+
+import asyncio
+import collections
+import os
+import struct
+import time
+
+
+from threespace_api import *
+from threespace_api import _baudrate, _allowed_baudrates, _frame_read_size
+from threespace_api import _max_commands_in_flight, _late_response_grace
+from threespace_api import _generateProtocolHeader, _makeCommandWriteArray, _commandResult
+from threespace_api import _unpackCommandOutput, _print, _ReverseCommandDict
+
+### Private ###
+_stream_queue_size = 256
+
+
+### Functions ###
+def _f7WriteRead(serial_port, command_dict, command, input_list=None):
+    # Blocking header-less command used while the port is being set up
+    descriptor = getCommandDescriptor(command_dict[command])
+    serial_port.write(_makeCommandWriteArray(descriptor, 0xf7, None, input_list))
+    if descriptor.out_parse:
+        output_data = serial_port.read(descriptor.out_len)
+        return _unpackCommandOutput(descriptor, output_data)
+
+
+### Classes ###
+class _AsyncPendingCommand(object):
+    __slots__ = ('cmd_byte', 'descriptor', 'future', 'removed', 'sent')
+
+    def __init__(self, cmd_byte, descriptor, future, removed, sent):
+        self.cmd_byte = cmd_byte
+        self.descriptor = descriptor
+        self.future = future
+        self.removed = removed
+        self.sent = sent
+
+
+class _AsyncTSSensor(object):
+    """ Base class of the asyncio sensors, should not be used directly.
+
+        Args:
+            com_port: The port name or ComInfo of the sensor
+            baudrate: The baudrate of the port (default is 115200)
+            timestamp_mode: One of the TSS_TIMESTAMP_* modes (default is
+                TSS_TIMESTAMP_SENSOR)
+            max_in_flight: The number of commands that can await a response
+                at once (default is 8)
+    """
+    command_dict = {}
+    reverse_command_dict = {}
+
+    _device_types = []
+
+    def __init__(self, com_port, baudrate=_baudrate, timestamp_mode=TSS_TIMESTAMP_SENSOR,
+                 max_in_flight=_max_commands_in_flight):
+        if type(com_port) is ComInfo:
+            com_port = com_port.com_port
+        if baudrate not in _allowed_baudrates:
+            baudrate = _baudrate
+            _print("Error baudrate value not allowed. Using default.")
+        self.port_name = com_port
+        self.baudrate = baudrate
+        self.timestamp_mode = timestamp_mode
+        self.protocol_args = {'success_failure': True,
+                              'timestamp': True,
+                              'command_echo': True,
+                              'data_length': True}
+        if timestamp_mode != TSS_TIMESTAMP_SENSOR:
+            self.protocol_args['timestamp'] = False
+        self.command_dict = dict(self.command_dict)
+        self.max_in_flight = max_in_flight
+        self.serial_port = None
+        self.loop = None
+        self.fd = None
+        self.compatibility = 0
+        self.device_type = None
+        self.serial_number = None
+        self.serial_number_hex = None
+        self.stream_slot_cmds = ['null'] * 8
+        self.stream_timing = None
+        self.stream_parse = None
+        self.stream_last_data = None
+        self.streaming = False
+        self.stream_queues = []
+        self.stream_dropped = 0
+        self.stray_count = 0
+        self.timeout_count = 0
+        self.round_trips = {}
+        self.requests = collections.deque()
+        self.in_flight = None
+        self.frame_buffer = bytearray()
+        self.write_buffer = bytearray()
+
+    def __repr__(self):
+        if self.serial_number_hex is None:
+            return "<YEI3Space Async:{0}>".format(self.port_name)
+        return "<YEI3Space Async {0}:{1}>".format(self.device_type, self.serial_number_hex)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __getattr__(self, name):
+        # Commands without a wrapper below become coroutine methods that
+        # return the data of get commands and success of everything else
+        command_dict = self.__dict__.get('command_dict', type(self).command_dict)
+        if name.startswith('_') or name not in command_dict:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, name))
+        has_output = bool(command_dict[name][2])
+
+        async def command(*args, timestamp=False):
+            if not args:
+                input_list = None
+            elif len(args) == 1:
+                input_list = args[0]
+            else:
+                input_list = args
+            fail_byte, t_stamp, data = await self.writeRead(name, input_list)
+            if not has_output:
+                data = not fail_byte
+            if timestamp:
+                return (data, t_stamp)
+            return data
+        command.__name__ = name
+        return command
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    async def open(cls, com_port, baudrate=_baudrate, timestamp_mode=TSS_TIMESTAMP_SENSOR,
+                   max_in_flight=_max_commands_in_flight):
+        """ Creates a sensor and connects to it. """
+        sensor = cls(com_port, baudrate, timestamp_mode, max_in_flight)
+        await sensor.connect()
+        return sensor
+
+    async def connect(self):
+        """ Opens the port and sets the sensor up. The blocking setup runs in
+            the loop's default executor, after which all I/O goes through
+            the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if not hasattr(loop, 'add_reader') or os.name == 'nt':
+            raise Exception("The asyncio API needs an event loop that can watch file descriptors.")
+        await loop.run_in_executor(None, self._openPort)
+        self.loop = loop
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.fd = self.serial_port.fileno()
+        os.set_blocking(self.fd, False)
+        loop.add_reader(self.fd, self._onReadable)
+        await self.getStreamingSlots()
+
+    def _openPort(self):
+        serial_port = serial.Serial(self.port_name, baudrate=self.baudrate, timeout=0.5, writeTimeout=0.5)
+        try:
+            self.compatibility = checkSoftwareVersionFromPort(serial_port)
+            hardware_version = convertString(_f7WriteRead(serial_port, self.command_dict, 'getHardwareVersionString'))
+            dev_type = hardware_version[4:-8].strip()
+            if dev_type not in self._device_types:
+                raise Exception("This is a %s device, not one of these devices %s!" % (dev_type, self._device_types))
+            self.device_type = dev_type
+            _f7WriteRead(serial_port, self.command_dict, 'stopStreaming')
+            time.sleep(0.05)
+            serial_port.reset_input_buffer()
+            self.serial_number = _f7WriteRead(serial_port, self.command_dict, 'getSerialNumber')
+            self.serial_number_hex = '{0:08X}'.format(self.serial_number)
+            protocol_byte, self.header_parse, self.header_idx_lst = _generateProtocolHeader(**self.protocol_args)
+            d_header = _f7WriteRead(serial_port, self.command_dict, '_getWiredResponseHeaderBitfield')
+            if d_header != protocol_byte:
+                _f7WriteRead(serial_port, self.command_dict, '_setWiredResponseHeaderBitfield', protocol_byte)
+                d_header = _f7WriteRead(serial_port, self.command_dict, '_getWiredResponseHeaderBitfield')
+            if d_header != protocol_byte:
+                raise Exception("Failed to set the response header of the device on ( %s )" % self.port_name)
+        except:
+            serial_port.close()
+            raise
+        idx_lst = self.header_idx_lst
+        self.frame_idx = tuple(idx_lst.index(i) if i in idx_lst else None for i in range(7))
+        self.serial_port = serial_port
+
+    def close(self):
+        """ Stops watching the port, fails the outstanding commands and ends
+            every stream() iterator.
+        """
+        if self.serial_port is None:
+            return
+        if self.loop is not None:
+            self.loop.remove_reader(self.fd)
+            self.loop.remove_writer(self.fd)
+        self.serial_port.close()
+        self.serial_port = None
+        while self.requests:
+            request = self.requests.popleft()
+            self._removeRequest(request, (True, None, None))
+        for stream_queue in self.stream_queues:
+            self._putStreamItem(stream_queue, None)
+
+    ## Transport
+    def _write(self, write_array):
+        if not self.write_buffer:
+            try:
+                written = os.write(self.fd, write_array)
+            except BlockingIOError:
+                written = 0
+            if written == len(write_array):
+                return
+            write_array = write_array[written:]
+            self.loop.add_writer(self.fd, self._onWritable)
+        self.write_buffer += write_array
+
+    def _onWritable(self):
+        try:
+            written = os.write(self.fd, self.write_buffer)
+        except BlockingIOError:
+            return
+        del self.write_buffer[:written]
+        if not self.write_buffer:
+            self.loop.remove_writer(self.fd)
+
+    def _onReadable(self):
+        try:
+            read_bytes = os.read(self.fd, _frame_read_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            _print("Lost the port of {0}".format(self))
+            self.close()
+            return
+        if read_bytes:
+            self._feedFramedData(read_bytes)
+
+    def _feedFramedData(self, read_bytes):
+        frame_buffer = self.frame_buffer
+        frame_buffer += read_bytes
+        fail_idx, time_idx, echo_idx, ck_idx, log_idx, sn_idx, size_idx = self.frame_idx
+        header_size = self.header_parse.size
+        unpack_from = self.header_parse.unpack_from
+        end = len(frame_buffer)
+        offset = 0
+        while end - offset >= header_size:
+            header_data = unpack_from(frame_buffer, offset)
+            data_start = offset + header_size
+            data_end = data_start + header_data[size_idx]
+            if data_end > end:
+                break
+            if self.timestamp_mode == TSS_TIMESTAMP_SENSOR:
+                timestamp = header_data[time_idx]
+            elif self.timestamp_mode == TSS_TIMESTAMP_SYSTEM:
+                timestamp = time.perf_counter() * 1000000
+            else:
+                timestamp = None
+            output_data = bytes(frame_buffer[data_start:data_end])
+            offset = data_end
+            cmd_echo = header_data[echo_idx]
+            if cmd_echo == 0xff:
+                if output_data:
+                    self._parseStreamData(timestamp, output_data)
+                continue
+            header_list = padProtocolHeader(header_data, self.header_idx_lst, timestamp)
+            self._dispatchResponse(cmd_echo, header_list, output_data)
+        if offset:
+            del frame_buffer[:offset]
+
+    def _dispatchResponse(self, cmd_echo, header_list, output_data):
+        # Responses come back in request order, so the oldest request with
+        # the same echo owns it, even if that request has already timed out
+        for request in self.requests:
+            if request.cmd_byte == cmd_echo:
+                break
+        else:
+            self.stray_count += 1
+            return
+        self.requests.remove(request)
+        if not request.future.done():
+            self._roundTripEstimator(cmd_echo).update(self.loop.time() - request.sent)
+        try:
+            result = _commandResult(request.descriptor, header_list, output_data)
+        except:
+            result = (True, header_list[1], None)
+        self._removeRequest(request, result)
+
+    def _removeRequest(self, request, result):
+        if not request.future.done():
+            request.future.set_result(result)
+        if not request.removed.done():
+            request.removed.set_result(None)
+
+    def _roundTripEstimator(self, cmd_byte):
+        round_trip = self.round_trips.get(cmd_byte)
+        if round_trip is None:
+            round_trip = self.round_trips[cmd_byte] = TSRoundTripEstimator()
+        return round_trip
+
+    def _expireRequest(self, request):
+        if request in self.requests:
+            self.requests.remove(request)
+            self._removeRequest(request, (True, None, None))
+
+    ## Commands
+    async def writeRead(self, command, input_list=None):
+        """ Sends a command and returns its (fail_byte, timestamp, data)
+            tuple, like the threaded classes' f9WriteRead.
+        """
+        if self.serial_port is None:
+            return (True, None, None)
+        descriptor = getCommandDescriptor(self.command_dict[command])
+        if self.compatibility < descriptor.compatibility:
+            raise Exception("Firmware for device on ( %s ) is out of date for this function. Recommend updating to latest firmware." % self.port_name)
+        write_array = _makeCommandWriteArray(descriptor, 0xf9, None, input_list)
+        cmd_byte = descriptor.cmd_byte
+        async with self.in_flight:
+            # A timed out request for the same command may still get its
+            # late response, wait for it so the response is not taken as ours
+            for request in list(self.requests):
+                if request.cmd_byte == cmd_byte and request.future.done():
+                    await asyncio.wait([request.removed])
+            if self.serial_port is None:
+                return (True, None, None)
+            round_trip = self._roundTripEstimator(cmd_byte)
+            timeout = round_trip.timeout(len(self.requests))
+            request = _AsyncPendingCommand(cmd_byte, descriptor, self.loop.create_future(), self.loop.create_future(),
+                                           self.loop.time())
+            self.requests.append(request)
+            self._write(write_array)
+            try:
+                return await asyncio.wait_for(asyncio.shield(request.future), timeout)
+            except asyncio.TimeoutError:
+                self.timeout_count += 1
+                round_trip.backoff()
+                request.future.set_result((True, None, None))
+                self.loop.call_later(min(round_trip.rto, _late_response_grace), self._expireRequest, request)
+                return (True, None, None)
+
+    ##  80(0x50)
+    async def setStreamingSlots(self, slot0='null',
+                                slot1='null',
+                                slot2='null',
+                                slot3='null',
+                                slot4='null',
+                                slot5='null',
+                                slot6='null',
+                                slot7='null'):
+        slots = [slot0, slot1, slot2, slot3, slot4, slot5, slot6, slot7]
+        slot_bytes = []
+        for slot in slots:
+            cmd_byte = self.command_dict[slot][0]
+            slot_bytes.append(cmd_byte)
+        fail_byte, timestamp, filler = await self.writeRead('_setStreamingSlots', slot_bytes)
+        self.stream_slot_cmds = slots
+        self._generateStreamParse()
+        return not fail_byte
+
+    ##  81(0x51)
+    async def getStreamingSlots(self):
+        fail_byte, timestamp, slot_bytes = await self.writeRead('_getStreamingSlots')
+        if slot_bytes:
+            self.stream_slot_cmds = [self.reverse_command_dict[cmd_byte] for cmd_byte in slot_bytes]
+            self._generateStreamParse()
+            return self.stream_slot_cmds
+
+    ##  82(0x52)
+    async def setStreamingTiming(self, interval, duration, delay, timestamp=False):
+        arg_list = (interval, duration, delay)
+        fail_byte, t_stamp, data = await self.writeRead('_setStreamingTiming', arg_list)
+        if not fail_byte:
+            self.stream_timing = arg_list
+        if timestamp:
+            return (not fail_byte, t_stamp)
+        return not fail_byte
+
+    ##  83(0x53)
+    async def getStreamingTiming(self, timestamp=False):
+        fail_byte, t_stamp, data = await self.writeRead('_getStreamingTiming')
+        if data:
+            self.stream_timing = data
+        if timestamp:
+            return (data, t_stamp)
+        return data
+
+    ##  84(0x54)
+    async def getStreamingBatch(self, timestamp=False):
+        fail_byte, t_stamp, data = await self.writeRead('_getStreamingBatch')
+        if timestamp:
+            return (data, t_stamp)
+        return data
+
+    ##  85(0x55)
+    async def stopStreaming(self):
+        fail_byte, timestamp, data = await self.writeRead('stopStreaming')
+        if not fail_byte:
+            self.streaming = False
+        return not fail_byte
+
+    ##  86(0x56)
+    async def startStreaming(self):
+        if self.stream_parse is None:
+            self._generateStreamParse()
+        fail_byte, timestamp, data = await self.writeRead('startStreaming')
+        if not fail_byte:
+            self.streaming = True
+        return not fail_byte
+
+    ## Streaming
+    def _generateStreamParse(self):
+        stream_string = '>'
+        for slot_cmd in self.stream_slot_cmds:
+            if slot_cmd != 'null':
+                out_struct = self.command_dict[slot_cmd][2]
+                stream_string += out_struct[1:]  # stripping the >
+        self.stream_parse = struct.Struct(stream_string)
+        self.command_dict['_getStreamingBatch'] = (0x54, self.stream_parse.size, stream_string, 0, None, 1)
+
+    def _parseStreamData(self, timestamp, output_data):
+        rtn_list = self.stream_parse.unpack(output_data)
+        if len(rtn_list) == 1:
+            rtn_list = rtn_list[0]
+        data = (timestamp, rtn_list)
+        self.stream_last_data = data
+        for stream_queue in self.stream_queues:
+            self._putStreamItem(stream_queue, data)
+
+    def _putStreamItem(self, stream_queue, data):
+        if stream_queue.full():
+            # Slow consumers lose the oldest samples rather than stall the port
+            stream_queue.get_nowait()
+            self.stream_dropped += 1
+        stream_queue.put_nowait(data)
+
+    async def stream(self, maxsize=_stream_queue_size):
+        """ Yields (timestamp, data) stream samples as they arrive. Streaming
+            is started with the current slots and timing if it is not running
+            yet, and stopped again when the iteration that started it ends.
+            Each iterator buffers up to maxsize samples and drops the oldest
+            when its consumer falls behind.
+        """
+        stream_queue = asyncio.Queue(maxsize)
+        self.stream_queues.append(stream_queue)
+        started = False
+        try:
+            if not self.streaming:
+                started = await self.startStreaming()
+            while True:
+                data = await stream_queue.get()
+                if data is None:
+                    return
+                yield data
+        finally:
+            self.stream_queues.remove(stream_queue)
+            if started and self.serial_port is not None:
+                await self.stopStreaming()
+
+
+class AsyncTSLXSensor(_AsyncTSSensor):
+    """ An asyncio counterpart of TSLXSensor.
+
+        Example:
+            async with AsyncTSLXSensor('/dev/ttyACM0') as sensor:
+                quat, accel = await asyncio.gather(
+                    sensor.getTaredOrientationAsQuaternion(),
+                    sensor.getCorrectedAccelerometerVector())
+                async for timestamp, data in sensor.stream():
+                    ...
+    """
+    command_dict = TSLXSensor.command_dict.copy()
+    reverse_command_dict = _ReverseCommandDict()
+
+    _device_types = TSLXSensor._device_types
@@ -0,0 +1,583 @@
+#!/usr/bin/env python
+
+""" This module is a hardware-free emulator for ThreeSpace devices.
+
+    The ThreeSpace Emulator module opens a Linux pseudo-terminal and answers
+    the 0xF7/0xF9 wired and 0xF8/0xFA wireless protocols on it the same way a
+    3-Space Sensor or Dongle would. The slave side of the pseudo-terminal can
+    be handed to any of the ThreeSpace API classes in place of a real serial
+    port, so command latency and streaming throughput can be measured without
+    a physical device attached. Streaming is paced to the configured baud rate
+    and can be given a fixed sample rate, timing jitter, and byte corruption.
+"""
+
+import os
+import sys
+import tty
+import math
+import time
+import random
+import select
+import struct
+import threading
+
+import threespace_api as ts_api
+
+### Globals ###
+TSS_EMU_HARDWARE_VERSION = "TSS-{0:<20s}v2.0.0  "
+TSS_EMU_FIRMWARE_VERSION = "25Apr2016A05"
+
+### Private ###
+_bits_per_byte = 10  # 8N1 framing on the UART
+_max_chunk_size = 4096
+_link_slack = 0.01  # seconds of idle link time a late stream may catch up on
+_struct_cache = {}
+
+_protocol_header_args = (
+    'success_failure',
+    'timestamp',
+    'command_echo',
+    'checksum',
+    'logical_id',
+    'serial_number',
+    'data_length'
+)
+
+
+### Functions ###
+def _headerFromBitfield(bitfield):
+    kwargs = {}
+    for i in range(len(_protocol_header_args)):
+        kwargs[_protocol_header_args[i]] = bool(bitfield & (1 << i))
+    protocol_byte, header_parse, idx_list = ts_api._generateProtocolHeader(**kwargs)
+    return header_parse, idx_list
+
+
+def _reverseCommandDict(command_dict):
+    return dict((args[0], (name, args)) for name, args in command_dict.items())
+
+
+def _synthesizeValues(command, out_struct, t):
+    """ Produces deterministic sensor readings for a command at time t. The
+        emulated sensor rotates slowly around its Y axis while sitting level.
+    """
+    cached = _struct_cache.get(out_struct)
+    if cached is None:
+        parse = struct.Struct(out_struct)
+        cached = (parse, len(parse.unpack(b'\x00' * parse.size)), _structCodes(out_struct))
+        _struct_cache[out_struct] = cached
+    parse, count, codes = cached
+    angle = (t * 0.5) % (2 * math.pi)
+    if 'Quaternion' in command and count == 4:
+        values = [0.0, math.sin(angle / 2), 0.0, math.cos(angle / 2)]
+    elif 'EulerAngles' in command and count == 3:
+        values = [0.0, angle - math.pi, 0.0]
+    elif 'RotationMatrix' in command and count == 9:
+        c = math.cos(angle)
+        s = math.sin(angle)
+        values = [c, 0.0, s, 0.0, 1.0, 0.0, -s, 0.0, c]
+    elif 'Accelerometer' in command or 'Acceleration' in command:
+        values = [0.001 * math.sin(t * 7.0 + i) for i in range(count)]
+        if count >= 3 and 'Linear' not in command:
+            values[1] += 1.0
+    elif 'Gyro' in command:
+        values = [0.0] * count
+        if count >= 2:
+            values[1] = 0.5
+    elif 'Temperature' in command:
+        values = [25.0] * count
+    else:
+        values = [0.1 * math.sin(t + i) for i in range(count)]
+    out_values = []
+    for fmt, value in zip(codes, values):
+        if fmt in 'fd':
+            out_values.append(value)
+        elif fmt == '?':
+            out_values.append(False)
+        elif fmt == 's':
+            out_values.append(b'')
+        else:
+            out_values.append(0)
+    return parse.pack(*out_values)
+
+
+def _structCodes(fmt):
+    codes = []
+    count = ''
+    for char in fmt.lstrip('<>!=@'):
+        if char.isdigit():
+            count += char
+            continue
+        if char == 's':
+            codes.append(char)
+        else:
+            codes.extend([char] * int(count or 1))
+        count = ''
+    return codes
+
+
+### Classes ###
+class _TSEmulatedDevice(object):
+    """ The register state and command handling of one emulated device. """
+
+    def __init__(self, emulator, device_type, serial_number, command_dict, logical_id=None):
+        self.emulator = emulator
+        self.device_type = device_type
+        self.serial_number = serial_number
+        self.logical_id = logical_id
+        self.command_dict = command_dict
+        self.reverse_command_dict = _reverseCommandDict(command_dict)
+        self.wired_header = 0
+        self.wireless_header = 0
+        self.stream_slots = [0xff] * 8
+        self.stream_timing = (0, 0xffffffff, 0)
+        self.streaming = False
+        self.stream_start = 0.0
+        self.stream_next = 0.0
+        self.settings = {}
+
+    def streamPayload(self, t):
+        payload = bytearray()
+        for cmd_byte in self.stream_slots:
+            if cmd_byte == 0xff:
+                continue
+            command, args = self.reverse_command_dict[cmd_byte]
+            if args[2]:
+                payload += _synthesizeValues(command, args[2], t)
+        return bytes(payload)
+
+    def streamPeriod(self):
+        if self.emulator.sample_rate:
+            return 1.0 / self.emulator.sample_rate
+        return self.stream_timing[0] / 1000000.0
+
+    def startStreaming(self, now):
+        interval, duration, delay = self.stream_timing
+        self.streaming = True
+        self.stream_start = now + delay / 1000000.0
+        self.stream_next = self.stream_start
+
+    def streamExpired(self, now):
+        duration = self.stream_timing[1]
+        if duration == 0xffffffff:
+            return False
+        return now - self.stream_start > duration / 1000000.0
+
+    def handleCommand(self, command, args, data):
+        """ Executes a command against the register state and returns a
+            (fail_byte, output_data) tuple.
+        """
+        cmd_byte, out_len, out_struct, in_len, in_struct, compatibility = args
+        now = time.perf_counter()
+        if in_struct:
+            in_data = struct.unpack(in_struct, data)
+        else:
+            in_data = ()
+        emulator = self.emulator
+        if command == 'getSerialNumber':
+            return False, struct.pack('>I', self.serial_number)
+        elif command == 'getHardwareVersionString':
+            version = TSS_EMU_HARDWARE_VERSION.format(self.device_type)
+            return False, version.encode('ascii')
+        elif command == 'getFirmwareVersionString':
+            return False, TSS_EMU_FIRMWARE_VERSION.encode('ascii')
+        elif command == '_setWiredResponseHeaderBitfield':
+            self.wired_header = in_data[0]
+            return False, b''
+        elif command == '_getWiredResponseHeaderBitfield':
+            return False, struct.pack('>I', self.wired_header)
+        elif command == '_setWirelessResponseHeaderBitfield':
+            self.wireless_header = in_data[0]
+            return False, b''
+        elif command == '_getWirelessResponseHeaderBitfield':
+            return False, struct.pack('>I', self.wireless_header)
+        elif command == '_setStreamingSlots':
+            for slot in in_data:
+                if slot not in self.reverse_command_dict:
+                    return True, b''
+            self.stream_slots = list(in_data)
+            return False, b''
+        elif command == '_getStreamingSlots':
+            return False, struct.pack('>8B', *self.stream_slots)
+        elif command == '_setStreamingTiming':
+            self.stream_timing = in_data
+            return False, b''
+        elif command == '_getStreamingTiming':
+            return False, struct.pack('>III', *self.stream_timing)
+        elif command == '_getStreamingBatch':
+            return False, self.streamPayload(now - emulator.start_time)
+        elif command == 'startStreaming':
+            self.startStreaming(now)
+            return False, b''
+        elif command in ('stopStreaming', 'softwareReset'):
+            self.streaming = False
+            return False, b''
+        elif command == '_setUARTBaudRate':
+            if in_data[0] not in ts_api._allowed_baudrates:
+                return True, b''
+            emulator.pending_baudrate = in_data[0]
+            return False, b''
+        elif command == 'getUARTBaudRate':
+            return False, struct.pack('>I', emulator.baudrate)
+        elif command == 'getReceptionBitfield':
+            bitfield = 0
+            for logical_id in emulator.wireless_table:
+                bitfield |= 1 << logical_id
+            return False, struct.pack('>H', bitfield)
+        elif command == 'getSerialNumberAtLogicalID':
+            sensor = emulator.wireless_table.get(in_data[0])
+            serial_number = sensor.serial_number if sensor is not None else 0
+            return False, struct.pack('>I', serial_number)
+        elif command == '_setSerialNumberAtLogicalID':
+            return False, b''
+
+        if command.startswith('set') or command.startswith('_set'):
+            self.settings[command.replace('set', 'get', 1)] = data
+            return False, b''
+        if out_struct is None:
+            return False, b''
+        stored = self.settings.get(command)
+        if stored is not None and len(stored) == out_len:
+            return False, stored
+        return False, _synthesizeValues(command, out_struct, now - emulator.start_time)
+
+
+class TSEmulator(object):
+    """ An emulated 3-Space device served over a Linux pseudo-terminal.
+
+        Args:
+            device_type: The device type string reported in the hardware
+                version, e.g. 'LX', 'USB', 'EM' or 'DNG' (default is 'LX')
+            serial_number: The serial number the device reports
+            baudrate: The simulated link speed used to pace all output
+                (default is 921600)
+            sample_rate: An optional fixed streaming rate in Hz that overrides
+                the interval set with setStreamingTiming
+            jitter: The fraction of the streaming period each packet may
+                randomly arrive early or late by (default is 0.0)
+            corruption: The probability each streamed packet has a byte
+                dropped or flipped (default is 0.0)
+            wireless_sensors: For a 'DNG' device, a dict mapping logical IDs to
+                serial numbers of the wireless sensors paired to it
+            throttle: If False, streaming with a zero interval is not paced to
+                the baud rate and runs as fast as the reader accepts it
+            seed: An optional seed for the jitter and corruption generator
+    """
+
+    def __init__(self, device_type="LX", serial_number=0x0EA71000, baudrate=921600,
+                 sample_rate=None, jitter=0.0, corruption=0.0, wireless_sensors=None,
+                 throttle=True, seed=None):
+        self.device_type = device_type
+        self.baudrate = baudrate
+        self.pending_baudrate = None
+        self.sample_rate = sample_rate
+        self.jitter = jitter
+        self.corruption = corruption
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        self.start_time = time.perf_counter()
+        self.wireless_table = {}
+        if device_type == "DNG":
+            self.device = _TSEmulatedDevice(self, device_type, serial_number,
+                                            ts_api.TSDongle.command_dict)
+            if wireless_sensors:
+                for logical_id, wl_serial in wireless_sensors.items():
+                    self.wireless_table[logical_id] = _TSEmulatedDevice(
+                        self, "WL", wl_serial, ts_api.TSDongle.wl_command_dict, logical_id)
+        else:
+            self.device = _TSEmulatedDevice(self, device_type, serial_number,
+                                            ts_api.TSLXSensor.command_dict)
+        self._wireless_reverse_dict = _reverseCommandDict(ts_api.TSDongle.wl_command_dict)
+        self._header_cache = {}
+        self._state_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._link_time = 0.0
+        self._running = False
+        self.master_fd = None
+        self.slave_fd = None
+        self.port_name = None
+        self.commands_handled = 0
+        self.packets_streamed = 0
+        self.packets_corrupted = 0
+        self.bytes_written = 0
+        self.bytes_dropped = 0
+
+    def __repr__(self):
+        return "<TSEmulator {0}:{1:08X} {2}>".format(self.device_type, self.device.serial_number, self.port_name)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        tty.setraw(self.master_fd)
+        os.set_blocking(self.master_fd, False)
+        self.port_name = os.ttyname(self.slave_fd)
+        self._running = True
+        self._command_thread = threading.Thread(target=self._commandLoop)
+        self._command_thread.daemon = True
+        self._command_thread.start()
+        self._stream_thread = threading.Thread(target=self._streamLoop)
+        self._stream_thread.daemon = True
+        self._stream_thread.start()
+        return self.port_name
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._command_thread.join()
+        self._stream_thread.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+        self.master_fd = None
+        self.slave_fd = None
+
+    def _write(self, data):
+        """ Writes to the host side, pacing to the link speed. Bytes the host
+            does not drain in time are dropped like a UART overrun.
+        """
+        with self._write_lock:
+            now = time.perf_counter()
+            self._link_time = max(self._link_time, now - _link_slack) + self._wireTime(len(data))
+            view = memoryview(data)
+            while len(view):
+                try:
+                    written = os.write(self.master_fd, view)
+                except BlockingIOError:
+                    select.select([], [self.master_fd], [], 0.1)
+                    try:
+                        written = os.write(self.master_fd, view)
+                    except BlockingIOError:
+                        self.bytes_dropped += len(view)
+                        return
+                except OSError:
+                    return
+                self.bytes_written += written
+                view = view[written:]
+
+    def _wireTime(self, byte_count):
+        return byte_count * _bits_per_byte / float(self.baudrate)
+
+    def _timestamp(self):
+        return int((time.perf_counter() - self.start_time) * 1000000) & 0xffffffff
+
+    def _packHeader(self, bitfield, fail_byte, cmd_echo, payload, logical_id, serial_number):
+        cached = self._header_cache.get(bitfield)
+        if cached is None:
+            cached = _headerFromBitfield(bitfield)
+            self._header_cache[bitfield] = cached
+        header_parse, idx_list = cached
+        values = (bool(fail_byte),
+                  self._timestamp(),
+                  cmd_echo,
+                  sum(bytearray(payload)) % 256,
+                  logical_id or 0,
+                  serial_number,
+                  len(payload))
+        return header_parse.pack(*[values[i] for i in idx_list])
+
+    def _commandLoop(self):
+        buffer = bytearray()
+        while self._running:
+            readable, writable, errored = select.select([self.master_fd], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self.master_fd, _max_chunk_size)
+            except (BlockingIOError, OSError):
+                continue
+            consumed = self._parseCommands(buffer)
+            del buffer[:consumed]
+
+    def _parseCommands(self, buffer):
+        idx = 0
+        while idx < len(buffer):
+            start_byte = buffer[idx]
+            if start_byte in (0xf7, 0xf9):
+                cmd_idx = idx + 1
+                logical_id = None
+            elif start_byte in (0xf8, 0xfa):
+                cmd_idx = idx + 2
+                if cmd_idx >= len(buffer):
+                    break
+                logical_id = buffer[idx + 1]
+            else:
+                idx += 1  # not a command start byte, resynchronize
+                continue
+            if cmd_idx >= len(buffer):
+                break
+            if logical_id is None:
+                device = self.device
+                reverse_dict = device.reverse_command_dict
+            else:
+                device = self.wireless_table.get(logical_id)
+                reverse_dict = self._wireless_reverse_dict
+            cmd_byte = buffer[cmd_idx]
+            if cmd_byte not in reverse_dict:
+                idx += 1
+                continue
+            command, args = reverse_dict[cmd_byte]
+            in_len = args[3]
+            end_idx = cmd_idx + 1 + in_len
+            if end_idx >= len(buffer):
+                break
+            if (sum(buffer[idx + 1:end_idx]) % 256) != buffer[end_idx]:
+                idx += 1  # bad checksum, resynchronize
+                continue
+            data = bytes(buffer[cmd_idx + 1:end_idx])
+            self._respond(start_byte, device, logical_id, command, args, data)
+            idx = end_idx + 1
+        return idx
+
+    def _respond(self, start_byte, device, logical_id, command, args, data):
+        self.commands_handled += 1
+        if device is None:
+            fail_byte, output_data = True, b''
+        else:
+            with self._state_lock:
+                fail_byte, output_data = device.handleCommand(command, args, data)
+        cmd_byte = args[0]
+        if start_byte == 0xf7:
+            if output_data:
+                self._write(output_data)
+        elif start_byte == 0xf9:
+            header = self._packHeader(self.device.wired_header, fail_byte, cmd_byte,
+                                      output_data, None, self.device.serial_number)
+            self._write(header + output_data)
+        elif start_byte == 0xf8:
+            if fail_byte:
+                self._write(bytes(bytearray((1, logical_id))))
+            else:
+                self._write(bytes(bytearray((0, logical_id, len(output_data)))) + output_data)
+        else:
+            serial_number = device.serial_number if device is not None else 0
+            header = self._packHeader(self.device.wireless_header, fail_byte, cmd_byte,
+                                      output_data, logical_id, serial_number)
+            self._write(header + output_data)
+        if self.pending_baudrate is not None:
+            self.baudrate = self.pending_baudrate
+            self.pending_baudrate = None
+
+    def _streamPacket(self, device, now):
+        payload = device.streamPayload(now - self.start_time)
+        if device.logical_id is None:
+            bitfield = device.wired_header
+        else:
+            bitfield = self.device.wireless_header
+        packet = bytearray(self._packHeader(bitfield, False, 0xff, payload,
+                                            device.logical_id, device.serial_number))
+        packet += payload
+        self.packets_streamed += 1
+        if self.corruption and self.random.random() < self.corruption:
+            self.packets_corrupted += 1
+            pos = self.random.randrange(len(packet))
+            if self.random.random() < 0.5:
+                del packet[pos]
+            else:
+                packet[pos] ^= 1 << self.random.randrange(8)
+        return packet
+
+    def _streamLoop(self):
+        while self._running:
+            now = time.perf_counter()
+            chunk = bytearray()
+            next_due = now + 0.05
+            link_time = max(self._link_time, now - _link_slack)
+            with self._state_lock:
+                devices = [self.device] + list(self.wireless_table.values())
+                for device in devices:
+                    if not device.streaming:
+                        continue
+                    if device.streamExpired(now):
+                        device.streaming = False
+                        continue
+                    period = device.streamPeriod()
+                    while device.stream_next <= now and len(chunk) < _max_chunk_size:
+                        packet = self._streamPacket(device, now)
+                        chunk += packet
+                        link_time += self._wireTime(len(packet))
+                        if period:
+                            offset = 0.0
+                            if self.jitter:
+                                offset = self.random.uniform(-self.jitter, self.jitter) * period
+                            device.stream_next += period + offset
+                        elif self.throttle:
+                            device.stream_next = link_time
+                        else:
+                            device.stream_next = now
+                    if device.stream_next < now - 1.0:
+                        device.stream_next = now  # the host fell behind, do not burst
+                    next_due = min(next_due, device.stream_next)
+            if chunk:
+                self._write(chunk)
+            if self.throttle:
+                next_due = max(next_due, self._link_time)
+            delay = next_due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def benchmark(duration=5.0, rate=None, command_count=200):
+    """ Measures command round trips and streaming throughput of a TSLXSensor
+        connected to an emulated device and prints the results.
+    """
+    with TSEmulator(sample_rate=rate) as emulator:
+        sensor = ts_api.TSLXSensor(com_port=emulator.port_name, baudrate=emulator.baudrate)
+        start = time.perf_counter()
+        for i in range(command_count):
+            sensor.getTaredOrientationAsQuaternion()
+        rtt = (time.perf_counter() - start) / command_count
+        print("Command round trip: {0:.3f} ms".format(rtt * 1000))
+
+        counter = [0]
+
+        def count(data):
+            counter[0] += 1
+        sensor.setNewDataCallBack(count)
+        sensor.setStreamingSlots(slot0='getTaredOrientationAsQuaternion',
+                                 slot1='getCorrectedAccelerometerVector',
+                                 slot2='getCorrectedGyroRate')
+        sensor.setStreamingTiming(interval=0, duration=0xffffffff, delay=0)
+        sensor.startStreaming()
+        start = time.perf_counter()
+        time.sleep(duration)
+        received = counter[0]
+        elapsed = time.perf_counter() - start
+        sensor.stopStreaming()
+        sensor.close()
+        print("Stream samples: {0} in {1:.2f} s ({2:.0f} Hz, {3} streamed)".format(
+            received, elapsed, received / elapsed, emulator.packets_streamed))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Emulate a 3-Space device on a pseudo-terminal.")
+    parser.add_argument('--type', default="LX", help="device type to report (default LX)")
+    parser.add_argument('--serial', default="0EA71000", help="serial number in hex")
+    parser.add_argument('--baudrate', type=int, default=921600)
+    parser.add_argument('--rate', type=float, default=None, help="fixed streaming rate in Hz")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--corruption', type=float, default=0.0)
+    parser.add_argument('--wireless', type=int, default=0, help="number of wireless sensors on a DNG")
+    parser.add_argument('--bench', type=float, default=None, help="run a benchmark for this many seconds")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.bench, args.rate)
+        sys.exit()
+    serial_number = int(args.serial, 16)
+    wireless = dict((i, serial_number + i + 1) for i in range(args.wireless))
+    emulator = TSEmulator(args.type, serial_number, args.baudrate, args.rate,
+                          args.jitter, args.corruption, wireless)
+    print("Emulating {0} on {1}".format(args.type, emulator.start()))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+
+""" This module is a stream recording module used in the ThreeSpace API.
+
+    The ThreeSpace Recorder module holds a fixed-capacity ring buffer for
+    stream data backed by a structured NumPy array. Each record is the stream
+    timestamp followed by the slot data exactly as it came off the wire, so
+    recording a sample is a single buffer copy and the buffer's dtype is
+    derived from the streaming slot commands. The module also builds the dtype
+    of whole stream packets, header included, so blocks of back-to-back
+    packets can be decoded with one NumPy call. NumPy is only needed once a
+    recorder or packet dtype is created.
+"""
+
+import math
+import struct
+import threading
+
+### Globals ###
+TSS_RECORD_OVERWRITE = 0
+TSS_RECORD_BLOCK = 1
+
+### Private ###
+numpy = None
+
+_struct_to_dtype = {
+    '?': '?',
+    'b': 'i1',
+    'B': 'u1',
+    'h': '>i2',
+    'H': '>u2',
+    'i': '>i4',
+    'I': '>u4',
+    'l': '>i4',
+    'L': '>u4',
+    'q': '>i8',
+    'Q': '>u8',
+    'f': '>f4',
+    'd': '>f8'
+}
+
+_timestamp_parse = struct.Struct('=d')
+
+# Protocol header fields in the order _generateProtocolHeader packs them
+_header_dtype_fields = (
+    ('fail_byte', '?'),
+    ('timestamp', '>u4'),
+    ('cmd_echo', 'u1'),
+    ('ck_sum', 'u1'),
+    ('rtn_log_id', 'u1'),
+    ('sn', '>u4'),
+    ('data_size', 'u1')
+)
+
+
+### Functions ###
+def _requireNumpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as _numpy
+        except ImportError:
+            raise ImportError("NumPy is required for stream recording buffers and batch decoding.")
+        numpy = _numpy
+    return numpy
+
+
+def _structDtypeFields(struct_format):
+    # Splits a big-endian struct format like '>fIff' or '>4f' into a list of
+    # (dtype string, count) groups
+    groups = []
+    count = ''
+    for char in struct_format.lstrip('<>!=@'):
+        if char.isdigit():
+            count += char
+            continue
+        count = int(count or 1)
+        if char == 's':
+            dtype = 'S{0:d}'.format(count)
+            count = 1
+        else:
+            dtype = _struct_to_dtype[char]
+        if groups and groups[-1][0] == dtype and char != 's':
+            groups[-1] = (dtype, groups[-1][1] + count)
+        else:
+            groups.append((dtype, count))
+        count = ''
+    return groups
+
+
+def slotDtypeFields(command_dict, slot_cmds):
+    """ Builds the NumPy dtype fields of the stream data for a list of slot
+        commands. Each non-null slot becomes a field named after its command,
+        with its values kept in the big-endian layout they are streamed in.
+    """
+    fields = []
+    names = set()
+    for slot_cmd in slot_cmds:
+        if slot_cmd == 'null':
+            continue
+        out_struct = command_dict[slot_cmd][2]
+        if not out_struct:
+            continue
+        name = slot_cmd
+        suffix = 1
+        while name in names:
+            name = '{0}_{1:d}'.format(slot_cmd, suffix)
+            suffix += 1
+        names.add(name)
+        groups = _structDtypeFields(out_struct)
+        if len(groups) == 1:
+            dtype, count = groups[0]
+            if count == 1:
+                fields.append((name, dtype))
+            else:
+                fields.append((name, dtype, (count,)))
+        else:
+            sub_fields = []
+            for i in range(len(groups)):
+                dtype, count = groups[i]
+                if count == 1:
+                    sub_fields.append(('f{0:d}'.format(i), dtype))
+                else:
+                    sub_fields.append(('f{0:d}'.format(i), dtype, (count,)))
+            fields.append((name, sub_fields))
+    return fields
+
+
+def streamRecordDtype(command_dict, slot_cmds):
+    """ Returns the structured NumPy dtype of one recorded stream sample: a
+        'timestamp' float followed by one field per streaming slot.
+    """
+    np = _requireNumpy()
+    return np.dtype([('timestamp', '=f8')] + slotDtypeFields(command_dict, slot_cmds))
+
+
+def streamPacketDtype(header_idx_lst, command_dict, slot_cmds):
+    """ Returns the structured NumPy dtype of one stream packet as it comes
+        off the wire: the protocol header fields listed in header_idx_lst
+        followed by one field per streaming slot.
+    """
+    np = _requireNumpy()
+    fields = [_header_dtype_fields[i] for i in header_idx_lst]
+    return np.dtype(fields + slotDtypeFields(command_dict, slot_cmds))
+
+
+def streamPacketRun(data, packet_dtype, payload_size, offset=0, end=None):
+    """ Decodes the run of back-to-back stream packets starting at offset in
+        data with a single np.frombuffer call. The run stops before the first
+        packet that is incomplete, not a stream packet, or fails its checksum
+        when the header carries one. Returns a read-only structured array
+        view into data, which may be empty.
+    """
+    np = _requireNumpy()
+    if end is None:
+        end = len(data)
+    count = (end - offset) // packet_dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, packet_dtype)
+    packets = np.frombuffer(data, packet_dtype, count, offset)
+    valid = (packets['cmd_echo'] == 0xff) & (packets['data_size'] == payload_size)
+    if 'ck_sum' in packet_dtype.names:
+        # The checksum is the low byte of the sum of the payload bytes
+        raw = np.frombuffer(data, np.uint8, count * packet_dtype.itemsize, offset)
+        payload = raw.reshape(count, packet_dtype.itemsize)[:, packet_dtype.itemsize - payload_size:]
+        valid &= (payload.sum(axis=1, dtype=np.uint32) & 0xff) == packets['ck_sum']
+    if not valid[-1] or not valid.all():
+        packets = packets[:int(np.argmin(valid))]
+    return packets
+
+
+### Classes ###
+class TSStreamRecorder(object):
+    """ A fixed-capacity ring buffer of stream samples.
+
+        Every sample is written twice, once in each half of a buffer twice the
+        capacity, so the newest samples are always one contiguous slice and
+        snapshot() does not need to copy or reorder anything.
+
+        Args:
+            command_dict: The command table of the sensor being recorded
+            slot_cmds: The sensor's streaming slot commands
+            capacity: The number of samples kept
+            overflow: TSS_RECORD_OVERWRITE drops the oldest sample when the
+                buffer is full, TSS_RECORD_BLOCK makes the recording thread
+                wait until read() frees room (default is TSS_RECORD_OVERWRITE)
+    """
+
+    def __init__(self, command_dict, slot_cmds, capacity, overflow=TSS_RECORD_OVERWRITE):
+        if capacity < 1:
+            raise ValueError("Recording capacity must be at least 1 sample")
+        if overflow not in (TSS_RECORD_OVERWRITE, TSS_RECORD_BLOCK):
+            raise ValueError("Unknown recording overflow policy: {0}".format(overflow))
+        np = _requireNumpy()
+        self.slot_cmds = list(slot_cmds)
+        self.dtype = streamRecordDtype(command_dict, slot_cmds)
+        self.payload_dtype = np.dtype(slotDtypeFields(command_dict, slot_cmds))
+        self.capacity = capacity
+        self.overflow = overflow
+        self.buffer = np.zeros(capacity * 2, self.dtype)
+        self.record_size = self.dtype.itemsize
+        self.payload_size = self.record_size - _timestamp_parse.size
+        self._raw = memoryview(self.buffer.view(np.uint8))
+        self.lock = threading.Condition(threading.Lock())
+        self.head = 0
+        self.count = 0
+        self.total = 0
+        self.dropped = 0
+        self.closed = False
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        return self.snapshot()[idx]
+
+    def __iter__(self):
+        return iter(self.snapshot(copy=True))
+
+    def __repr__(self):
+        return "<TSStreamRecorder {0:d}/{1:d} samples>".format(self.count, self.capacity)
+
+    def record(self, timestamp, payload):
+        """ Stores one stream sample. Returns False if the payload does not
+            match the recorded slots or the buffer was closed while blocked.
+        """
+        if len(payload) != self.payload_size:
+            return False
+        if timestamp is None:
+            timestamp = math.nan
+        with self.lock:
+            if self.count == self.capacity:
+                if self.overflow == TSS_RECORD_BLOCK:
+                    while self.count == self.capacity:
+                        if self.closed:
+                            return False
+                        self.lock.wait()
+                else:
+                    self.dropped += 1
+                    self.count -= 1
+            raw = self._raw
+            record_size = self.record_size
+            for start in (self.head * record_size, (self.head + self.capacity) * record_size):
+                _timestamp_parse.pack_into(raw, start, timestamp)
+                raw[start + 8:start + record_size] = payload
+            self.head += 1
+            if self.head == self.capacity:
+                self.head = 0
+            self.count += 1
+            self.total += 1
+        return True
+
+    def recordBatch(self, timestamps, packets):
+        """ Stores a structured array of stream packets, or recorded samples,
+            whose slot fields match this recorder. timestamps is an array or a
+            single value applied to every sample.
+        """
+        np = _requireNumpy()
+        count = len(packets)
+        if not count:
+            return True
+        if timestamps is None:
+            timestamps = math.nan
+        if self.overflow == TSS_RECORD_BLOCK:
+            # Blocking has to hand samples over as room frees up
+            payload_dtype = self.payload_dtype
+            payloads = packets[list(payload_dtype.names)].astype(payload_dtype)
+            timestamps = np.broadcast_to(np.asarray(timestamps, dtype=float), (count,))
+            for i in range(count):
+                if not self.record(timestamps[i], payloads[i:i + 1].tobytes()):
+                    return False
+            return True
+        names = [name for name in self.dtype.names if name != 'timestamp']
+        with self.lock:
+            if count > self.capacity:
+                self.dropped += count - self.capacity
+                packets = packets[count - self.capacity:]
+                if np.ndim(timestamps):
+                    timestamps = timestamps[count - self.capacity:]
+                count = self.capacity
+            positions = (self.head + np.arange(count)) % self.capacity
+            for idx in (positions, positions + self.capacity):
+                self.buffer['timestamp'][idx] = timestamps
+                for name in names:
+                    self.buffer[name][idx] = packets[name]
+            overflow = self.count + count - self.capacity
+            if overflow > 0:
+                self.dropped += overflow
+            self.count = min(self.capacity, self.count + count)
+            self.head = (self.head + count) % self.capacity
+            self.total += count
+        return True
+
+    def snapshot(self, copy=False):
+        """ Returns the recorded samples, oldest first, as one contiguous
+            structured array. Without copy this is a view into the buffer and
+            is overwritten as recording continues.
+        """
+        with self.lock:
+            end = self.head + self.capacity
+            view = self.buffer[end - self.count:end]
+            if copy:
+                return view.copy()
+            return view
+
+    def read(self, max_count=None):
+        """ Removes and returns up to max_count of the oldest samples as a
+            copied structured array, making room for a blocked recorder.
+        """
+        with self.lock:
+            count = self.count
+            if max_count is not None:
+                count = min(count, max_count)
+            end = self.head + self.capacity
+            start = end - self.count
+            samples = self.buffer[start:start + count].copy()
+            self.count -= count
+            self.lock.notify_all()
+        return samples
+
+    def clear(self):
+        with self.lock:
+            self.head = 0
+            self.count = 0
+            self.lock.notify_all()
+
+    def close(self):
+        """ Releases a recording thread blocked on a full buffer, later
+            samples are refused until reopen() is called.
+        """
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+
+    def reopen(self):
+        with self.lock:
+            self.closed = False
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+""" This module is a profiling module used in the ThreeSpace API.
+
+    The ThreeSpace Trace module records timed spans of the command and stream
+    paths as Chrome trace events, which can be opened in Perfetto
+    (ui.perfetto.dev) or chrome://tracing. Each span is one complete ("X")
+    event on the thread that ran it, so time spent building commands,
+    writing to and waiting on the port, unpacking responses, and running
+    user callbacks shows up side by side per thread. The depth of each
+    sensor's stream queues and the samples they dropped are recorded as
+    counter ("C") events alongside.
+"""
+
+import os
+import threading
+import time
+
+### Private ###
+_max_trace_events = 1000000
+
+
+### Classes ###
+class TSTracer(object):
+    """ Collects trace events in memory until they are saved.
+
+        Args:
+            path: An optional file the trace is written to by save() (default
+                is None)
+            max_events: The number of events kept, later events are counted
+                as dropped (default is 1000000)
+    """
+
+    def __init__(self, path=None, max_events=_max_trace_events):
+        self.path = path
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self.thread_names = {}
+        self.pid = os.getpid()
+        self.start_time = time.perf_counter()
+
+    def __len__(self):
+        return len(self.events)
+
+    def now(self):
+        return time.perf_counter()
+
+    def span(self, name, start_time, category="command", args=None, end_time=None):
+        """ Records a span from start_time to end_time (default is now), both
+            time.perf_counter() values, on the calling thread.
+        """
+        if end_time is None:
+            end_time = time.perf_counter()
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start_time - self.start_time) * 1000000,
+            'dur': (end_time - start_time) * 1000000,
+            'pid': self.pid,
+            'tid': tid
+        }
+        if args is not None:
+            event['args'] = args
+        self.events.append(event)
+
+    def counter(self, name, values, category="stream"):
+        """ Records a counter event, values is a dictionary of series. """
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append({
+            'name': name,
+            'cat': category,
+            'ph': 'C',
+            'ts': (time.perf_counter() - self.start_time) * 1000000,
+            'pid': self.pid,
+            'args': values
+        })
+
+    def traceEvents(self):
+        """ Returns the recorded events with the thread name metadata. """
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in list(self.thread_names.items())]
+        return metadata + list(self.events)
+
+    def save(self, path=None):
+        """ Writes the trace as Chrome trace-event JSON to path, or to the
+            path the tracer was created with. Returns the path written.
+        """
+        import json
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError("No trace file path was given")
+        with open(path, 'w') as trace_file:
+            json.dump({
+                'traceEvents': self.traceEvents(),
+                'displayTimeUnit': 'ms',
+                'otherData': {'dropped_events': self.dropped}
+            }, trace_file)
+        return path
@@ -16,10 +16,10 @@ __authors__ = [
 
 import os
 import sys
-import subprocess
+import struct
 import collections
-import serial
-import multiprocessing
+import importlib
+import threading
 import time
 
 ### Globals ###
@@ -39,13 +39,49 @@ TSS_FIND_ALL_KNOWN =    0x7fffffff
 TSS_FIND_ALL =          0xffffffff
 
 ### Private ###
+# Firmware build dates (year, month, day) where the protocol changed
 __version_firmware = (
-    time.strptime("01Jan2000", "%d%b%Y"),
-    time.strptime("25Apr2013", "%d%b%Y"),
-    time.strptime("21Jun2013", "%d%b%Y"),
-    time.strptime("08Aug2013", "%d%b%Y")
+    (2000, 1, 1),
+    (2013, 4, 25),
+    (2013, 6, 21),
+    (2013, 8, 8)
 )
 
+_firmware_months = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
+}
+
+_try_port_timeout = 1.0
+_try_port_locks = {}
+_try_port_locks_lock = threading.Lock()
+
+_device_vendor_id = "VID_2476"
+# The Nano talks through an FTDI bridge, only its product ID is matched
+# under FTDI's vendor ID
+_ftdi_vendor_id = "VID_0403"
+_ftdi_product_ids = ("PID_6015",)
+
+# USB product IDs of 3-Space devices with their type and TSS_FIND_* flag
+_device_pid_map = {
+    "PID_1000": ("BTL", TSS_FIND_BTL),
+    "PID_1010": ("USB", TSS_FIND_USB),
+    "PID_1020": ("DNG", TSS_FIND_DNG),
+    "PID_1030": ("WL", TSS_FIND_WL),
+    "PID_1040": ("EM", TSS_FIND_EM),
+    "PID_1050": ("DL", TSS_FIND_DL),
+    "PID_1060": ("BT", TSS_FIND_BT),
+    "PID_1090": ("LX", TSS_FIND_LX),
+    "PID_1100": ("MBT", TSS_FIND_MBT),
+    "PID_1101": ("MWL", TSS_FIND_MWL),
+    "PID_6015": ("NANO", TSS_FIND_NANO)
+}
+
+# Device types that are USB CDC devices themselves, the baud rate of their
+# ports does not limit the link
+_usb_cdc_device_types = frozenset(
+    device[0] for pid, device in _device_pid_map.items() if pid not in _ftdi_product_ids)
+
 ### Structures ###
 ComInfo = collections.namedtuple(
     'ComInfo', (
@@ -73,6 +109,31 @@ ComPortListing = collections.namedtuple(
     )
 )
 
+### Classes ###
+class _LazyModule(object):
+    """ Stands in for a module that is only imported on first attribute
+        access, keeping rarely needed imports off the import path.
+    """
+
+    def __init__(self, module_name):
+        self._module_name = module_name
+        self._module = None
+
+    def __getattr__(self, name):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._module_name)
+            self._module = module
+        return getattr(module, name)
+
+    def __repr__(self):
+        return "<lazy module '{0}'>".format(self._module_name)
+
+
+serial = _LazyModule('serial')
+subprocess = _LazyModule('subprocess')
+
+
 ### Functions ###
 if sys.version_info >= (3, 0):
     def convertString(string):
@@ -82,17 +143,32 @@ else:
         return string
 
 
-def pyTryPort(port_name, conn):
+def _matchDeviceIds(vid, pid):
+    # Returns the (type, TSS_FIND_* flag) of a USB vendor and product ID
+    # string pair, or None if they are not a 3-Space device
+    if vid == _device_vendor_id or (vid == _ftdi_vendor_id and pid in _ftdi_product_ids):
+        return _device_pid_map.get(pid)
+    return None
+
+
+def _openClosePort(port_name, port_lock, result):
     try:
-        tmp_port = serial.Serial(port_name, timeout=0.2, writeTimeout=0.2, baudrate=115200)
-    except:
-        conn.send(False)
-        return
-    tmp_port.close()
-    conn.send(True)
+        try:
+            tmp_port = serial.Serial(port_name, timeout=0.2, writeTimeout=0.2, baudrate=115200)
+        except:
+            return
+        tmp_port.close()
+        result.append(True)
+    finally:
+        port_lock.release()
 
 
-def tryPort(port_name, use_subprocess=False):
+def tryPort(port_name, use_subprocess=False, timeout=_try_port_timeout):
+    """ Checks that a port can be opened by opening and closing it. Returns
+        True if it could, None if it could not, and False if the check timed
+        out while still holding the port, which must not be opened until the
+        check lets go of it.
+    """
     if use_subprocess:
         ## Subprocess version of tryport
         # TryPort attempts to connect to the port repeatedly and releases it
@@ -129,17 +205,33 @@ def tryPort(port_name, use_subprocess=False):
            return None
 
     else:
-        ## Multiprocessing version of tryport
-        parent_conn, child_conn = multiprocessing.Pipe()
-        tmp_process = multiprocessing.Process(target=pyTryPort, args=(port_name, child_conn))
-        tmp_process.start()
-        make_port = parent_conn.recv()
-        tmp_process.join()
-        if not make_port:
+        ## Thread version of tryport
+        # Opens and closes the port on a helper thread so a driver that hangs
+        # in open() costs at most timeout seconds, one check per port at a time
+        with _try_port_locks_lock:
+            port_lock = _try_port_locks.setdefault(port_name, threading.Lock())
+        if not port_lock.acquire(True, timeout):
+            return False
+        result = []
+        try_thread = threading.Thread(target=_openClosePort, args=(port_name, port_lock, result))
+        try_thread.daemon = True
+        try_thread.start()
+        try_thread.join(timeout)
+        if try_thread.is_alive():
+            return False
+        if not result:
             return None
     return True
 
 
+def _parseFirmwareDate(date_string):
+    # Parses a "%d%b%Y" build date like "25Apr2013" without time.strptime
+    try:
+        return (int(date_string[5:9]), _firmware_months[date_string[2:5]], int(date_string[:2]))
+    except (KeyError, ValueError):
+        raise ValueError("Unknown firmware date {0!r}".format(date_string))
+
+
 def checkSoftwareVersionFromPort(serial_port):
     # Figure out whether the current hardware is on "old" or "new" firmware
     compatibility = 0
@@ -157,7 +249,7 @@ def checkSoftwareVersionFromPort(serial_port):
         # Hour-minute remainder
         serial_port.read(3)
         
-        sensor_firmware = time.strptime(response, "%d%b%Y")
+        sensor_firmware = _parseFirmwareDate(response)
         
         for i in reversed(range(len(__version_firmware))):
             if sensor_firmware >= __version_firmware[i]:
@@ -165,4 +257,67 @@ def checkSoftwareVersionFromPort(serial_port):
                 break
     if compatibility == 0:
         raise Exception("Firmware for device on ( %s ) is out of date for this API. Recommend updating to latest firmware." % serial_port.name)
-    return compatibility
\ No newline at end of file
+    return compatibility
+
+
+def _getSoftwareVersionFromPort(serial_port):
+    # Figure out whether the current hardware is on "old" or "new" firmware
+    serial_port.write(bytearray((0xf7, 0xdf, 0xdf)))
+    response = convertString(serial_port.read(9))
+    if len(response) == 0:
+        # Check and see if in bootloader
+        return None
+    elif response[:3] == "TSS":
+        # Old firmware version remainder
+        serial_port.read(9)
+        raise Exception("Firmware for device on ( %s ) is out of date for this API. Recommend updating to latest firmware." % serial_port.name)
+
+    # Hour-minute remainder
+    serial_port.read(3)
+    return response
+
+
+def _pollDeviceInfo(port_name, dev_type):
+    # Queries the device on a port for the details getDeviceInfoFromComPort
+    # reports, returns (dev_type, dev_serial, dev_fw_ver, dev_hw_ver, in_bootloader)
+    dev_serial = 0
+    dev_fw_ver = ""
+    dev_hw_ver = ""
+    in_bootloader = False
+    tmp_port = None
+    try:
+        tmp_port = serial.Serial(port_name, timeout=0.1, baudrate=115200)
+
+        if dev_type == "BT":
+            tmp_port.timeout = 5.0
+    except:
+        tmp_port = None
+    if tmp_port is not None:
+        # Try to get the serial, if it fails try to see if in bootloader
+        tmp_port.write(bytearray((0xf7, 0xed, 0xed)))
+        response = tmp_port.read(4)
+        if len(response) == 4:
+            dev_serial = "{0:08X}".format(struct.unpack('>I', response)[0])
+            # Get the version strings (and device type if the
+            # previous method did not resolve it)
+            software_version = _getSoftwareVersionFromPort(tmp_port)
+            if software_version is not None:
+                # This is in fact a 3-Space sensor
+                dev_fw_ver = software_version
+                tmp_port.write(bytearray((0xf7, 0xe6, 0xe6)))
+                hardware_version = convertString(tmp_port.read(32))
+                dev_hw_ver = hardware_version
+                if dev_type == "???":
+                    dev_type = hardware_version[4:-8].strip()
+            else:
+                tmp_port.write(bytearray((0x3f,)))  # this is ascii '?'
+                response = convertString(tmp_port.read(2))
+                if response:
+                    if response == "OK":
+                        in_bootloader = True
+                        dev_type = "BTL"
+                else:
+                    raise Exception("Either device on( %s ) is not a 3-Space Sensor or the firmware is out of date for this API and recommend updating to latest firmware." % port_name)
+
+        tmp_port.close()
+    return (dev_type, dev_serial, dev_fw_ver, dev_hw_ver, in_bootloader)
@@ -15,6 +15,7 @@ __authors__ = [
 ]
 
 from threespace_utils import *
+from threespace_utils import _device_vendor_id, _matchDeviceIds, _pollDeviceInfo
 import struct
 # import serial
 # from serial.win32 import ULONG_PTR, is_64bit
@@ -600,49 +601,20 @@ def getComPorts(filter=TSS_FIND_ALL):
     """
     port_list = []
     serial_port_list = _yeiComPorts()
-    pid_map = {
-        "PID_1000": ("BTL", TSS_FIND_BTL),
-        "PID_1010": ("USB", TSS_FIND_USB),
-        "PID_1020": ("DNG", TSS_FIND_DNG),
-        "PID_1030": ("WL", TSS_FIND_WL),
-        "PID_1040": ("EM", TSS_FIND_EM),
-        "PID_1050": ("DL", TSS_FIND_DL),
-        "PID_1060": ("BT", TSS_FIND_BT),
-        "PID_1090": ("LX", TSS_FIND_LX),
-        "PID_1100": ("MBT", TSS_FIND_MBT),
-        "PID_1101": ("MWL", TSS_FIND_MWL),
-        "PID_601": ("NANO", TSS_FIND_NANO)
-    }
     for cur_port in serial_port_list:
         hw_string = cur_port[2]
 
         if cur_port[3] != "":
             vid, pid = cur_port[3].split("&")
-            if (vid == "VID_2476" or vid == "VID_0403") and pid in pid_map and pid_map[pid][1] & filter:
-                port_list.append(ComInfo(cur_port[0], cur_port[1], pid_map[pid][0]))
+            device = _matchDeviceIds(vid, pid)
+            if device is not None and device[1] & filter:
+                port_list.append(ComInfo(cur_port[0], cur_port[1], device[0]))
                 continue
         elif TSS_FIND_UNKNOWN & filter:
             port_list.append(ComInfo(cur_port[0], cur_port[1], "???"))
     return port_list
 
 
-def _getSoftwareVersionFromPort(serial_port):
-    # Figure out whether the current hardware is on "old" or "new" firmware
-    serial_port.write(bytearray((0xf7, 0xdf, 0xdf)))
-    response = convertString(serial_port.read(9))
-    if len(response) == 0:
-        # Check and see if in bootloader
-        return None
-    elif response[:3] == "TSS":
-        # Old firmware version remainder
-        serial_port.read(9)
-        raise Exception("Firmware for device on ( %s ) is out of date for this API. Recommend updating to latest firmware." % serial_port.name)
-
-    # Hour-minute remainder
-    serial_port.read(3)
-    return response
-
-
 def getDeviceInfoFromComPort(port_name, poll_device=True):
     """ Analyzes a serial COM port of a 3-Space Sensor and returns details about
         the device.
@@ -675,19 +647,6 @@ def getDeviceInfoFromComPort(port_name, poll_device=True):
     dev_fw_ver = ""
     dev_hw_ver = ""
     in_bootloader = False
-    pid_map = {
-        "PID_1000": "BTL",
-        "PID_1010": "USB",
-        "PID_1020": "DNG",
-        "PID_1030": "WL",
-        "PID_1040": "EM",
-        "PID_1050": "DL",
-        "PID_1060": "BT",
-        "PID_1090": "LX",
-        "PID_1100": "MBT",
-        "PID_1101": "MWL",
-        "PID_6015": "NANO",
-    }
     matched_ports = _yeiGrep(port_name)
 
     for cur_port in matched_ports:
@@ -697,48 +656,14 @@ def getDeviceInfoFromComPort(port_name, poll_device=True):
             # device type
             if cur_port[3] != "":
                 vid, pid = cur_port[3].split("&")
-                if vid == "VID_2476":
+                if vid == _device_vendor_id:
                     # The VID matches the YEI vendor ID
-                    if pid in pid_map:
-                        dev_type = pid_map[pid]
+                    device = _matchDeviceIds(vid, pid)
+                    if device is not None:
+                        dev_type = device[0]
             break
     if poll_device:
-        tmp_port = None
-        try:
-            tmp_port = serial.Serial(port_name, timeout=0.1, baudrate=115200)
-
-            if dev_type == "BT":
-                tmp_port.timeout = 5.0
-        except:
-            tmp_port = None
-        if tmp_port is not None:
-            # Try to get the serial, if it fails try to see if in bootloader
-            tmp_port.write(bytearray((0xf7, 0xed, 0xed)))
-            response = tmp_port.read(4)
-            if len(response) == 4:
-                dev_serial = "{0:08X}".format(struct.unpack('>I', response)[0])
-                # Get the version strings (and device type if the
-                # previous method did not resolve it)
-                software_version = _getSoftwareVersionFromPort(tmp_port)
-                if software_version is not None:
-                    # This is in fact a 3-Space sensor
-                    dev_fw_ver = software_version
-                    tmp_port.write(bytearray((0xf7, 0xe6, 0xe6)))
-                    hardware_version = convertString(tmp_port.read(32))
-                    dev_hw_ver = hardware_version
-                    if dev_type == "???":
-                        dev_type = hardware_version[4:-8].strip()
-                else:
-                    tmp_port.write(bytearray((0x3f,)))  # this is ascii '?'
-                    response = convertString(tmp_port.read(2))
-                    if response:
-                        if response == "OK":
-                            in_bootloader = True
-                            dev_type = "BTL"
-                    else:
-                        raise Exception("Either device on( %s ) is not a 3-Space Sensor or the firmware is out of date for this API and recommend updating to latest firmware." % port_name)
-
-            tmp_port.close()
+        dev_type, dev_serial, dev_fw_ver, dev_hw_ver, in_bootloader = _pollDeviceInfo(port_name, dev_type)
     return SensorInfo(
         friendly_name,
         dev_type,